@@ -1,490 +1,444 @@
 # app.py
+#
+# matplotlib, geopandas and scipy are only imported once a section has to draw a figure
+# or load the neighbor index; the first view is served from the pre-rendered figures in
+# the app bundle. See benchmarks/cold_start.py for the start up budget.
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-import geopandas as gpd
-import zipfile
-import requests
-import io
 import os
-
-# Load your dataset
-@st.cache_data
-def load_data():
-    return pd.read_parquet('processed_data.parquet')
+import hashlib
+import pyarrow as pa
+
+import page_content
+import page_figures
+import plots
+from app_bundle import AppBundle
+from batch_compare import compare_pins, parcel_ranks, read_pins
+from county_dataset import artifact_paths, read_counties, read_parcels
+from distributions import build_summary, load_summary
+from geo_tiers import map_layers
+from instrument import PROFILE_ENV, Profiler, StageStats
+from neighbors import DEFAULT_K, NeighborIndex
+from pin_index import PinIndex
+from raster_grids import RasterGrids
+from segments import ALL, SEGMENT_COLUMNS, SegmentCube
+from shared_data import APP_COLUMNS, map_shared, shared_frame
+
+# Opt-in instrumentation: set PROPERTY_TAX_PROFILE to a file to log each rerun's stage
+# timings there as JSON lines, or open the page with ?debug=1 for a panel at the bottom
+PROFILE_PATH = os.environ.get(PROFILE_ENV)
+DEBUG = 'debug' in st.query_params
+profiler = Profiler(enabled=bool(PROFILE_PATH) or DEBUG, label='page', threaded=True)
+
+# per-stage totals shared by every session of this process
+@st.cache_resource
+def stage_stats():
+    return StageStats()
+
+def finish_run(run):
+    if run.enabled:
+        stage_stats().add(run)
+        if PROFILE_PATH:
+            run.append(PROFILE_PATH)
+
+# county shown first when the partitioned dataset has several
+DEFAULT_COUNTY = '37135'
+
+# Every loader below takes the county, so each county is cached separately and only the
+# selected county's files are read. county=None is the single county layout next to app.py.
+
+# The data sections, summary and default figures of the page in one file written by
+# preprocess.py, memory mapped once per process. Without it, the loaders below read
+# the separate files it was built from.
+@st.cache_resource
+def load_bundle(county):
+    path = artifact_paths(county)['bundle']
+    if os.path.exists(path):
+        return AppBundle.read(path)
+    return None
+
+def bundled_figure(county, kind, *args):
+    # the pre-rendered figure for these arguments, or None if it has to be drawn
+    bundle = load_bundle(county)
+    return bundle.image(page_figures.figure_key(kind, *args)) if bundle is not None else None
+
+# The parcel columns the page uses as one Arrow table per process: the memory mapped
+# copy written by preprocess.py, or the dataset read once if it hasn't been written.
+# Sessions share it; cache_data would hand every caller its own unpickled copy.
+@st.cache_resource
+def load_table(county):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.table('parcels')
+    path = artifact_paths(county)['shared']
+    if os.path.exists(path):
+        return map_shared(path)
+    return pa.Table.from_pandas(read_parcels(county, columns=APP_COLUMNS), preserve_index=False)
+
+# Load your dataset, as a read only view of the shared table
+def load_data(county):
+    return shared_frame(load_table(county))
       
+# PIN index written by preprocess.py, memory mapped once per process and shared by
+# every session. Falls back to building it from the dataset if it hasn't been written.
+@st.cache_resource
+def load_pin_index(county):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.pin_index()
+    path = artifact_paths(county)['pin_index']
+    if os.path.exists(path):
+        return PinIndex.load(path)
+    return PinIndex.from_frame(load_data(county))
+
+# KD-tree over the parcel centroids, only written when preprocess.py had the parcel layer
+@st.cache_resource
+def load_neighbor_index(county):
+    path = artifact_paths(county)['neighbors']
+    if os.path.exists(path):
+        return NeighborIndex.load(path)
+    return None
+
+# Quantiles, trim bounds and histogram bins written by preprocess.py, so nothing on the
+# page is recomputed from the parcel table
+@st.cache_resource
+def load_distributions(county):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.summary
+    path = artifact_paths(county)['summary']
+    if os.path.exists(path):
+        return load_summary(path)
+    return build_summary(load_data(county))
+
+# Files the two ZIP maps are drawn from: the pre-projected tiers written by
+# preprocess.py, or the raw layers when the tiers haven't been built
+MAP_FILES = ['zip_tiers', 'county_tiers', 'zip_map', 'county']
+
+@st.cache_data(show_spinner=False)
+def file_digest(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def map_data_version(county):
+    # changes whenever a geometry file is rebuilt
+    paths = [artifact_paths(county)[key] for key in MAP_FILES]
+    return ':'.join(file_digest(path, os.path.getmtime(path)) for path in paths if os.path.exists(path))
+
+# the coarsest tier that still resolves one output pixel, read once per process
+@st.cache_resource(show_spinner=False)
+def load_map_layers(county, data_version):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.map_layers(plots.MAP_FIGSIZE, plots.SAVEFIG_OPTIONS['dpi'])
+    return map_layers(artifact_paths(county), plots.MAP_FIGSIZE, plots.SAVEFIG_OPTIONS['dpi'])
+
+# bytes are immutable, so cache_resource can hand the same object to every session
+@st.cache_resource(show_spinner=False, max_entries=32)
+def render_zip_map(name, county_name, data_version, county, fmt='png'):
+    zip_tier, county_tier = load_map_layers(county, data_version)
+    return page_figures.zip_map(name, zip_tier, county_tier, county_name, fmt)
+
+def render_page_map(name, county, county_name):
+    prerendered = bundled_figure(county, 'zip_map', name, county_name)
+    if prerendered is not None:
+        return prerendered
+    return render_zip_map(name, county_name, map_data_version(county), county)
+
+# Counties in the partitioned dataset written by preprocess.py; without one, the page
+# shows the single county next to app.py
+counties = read_counties()
+if counties:
+    county_ids = list(counties)
+    county = st.sidebar.selectbox('County', county_ids, format_func=counties.get,
+                                  index=county_ids.index(DEFAULT_COUNTY) if DEFAULT_COUNTY in counties else 0)
+    county_name = counties[county]
+else:
+    county, county_name = None, page_content.COUNTY_NAME
+
 # Load data
-merged_df_trim_filter01 = load_data()
+with profiler.stage('load_distributions') as stage:
+    summary = load_distributions(county)
+    stage['rows'] = summary['rows']
+with profiler.stage('load_pin_index') as stage:
+    pin_index = load_pin_index(county)
+    stage['rows'] = len(pin_index)
 
 
 # Title
-st.title('🏡 Exploration of the Property Tax Revaluation in Orange County NC')
-
-st.markdown("""
-Recently, where I live in Orange County North Carolina, there has been a lot of <a href="https://www.newsobserver.com/news/local/counties/orange-county/article300487814.html" target="_blank">talk about changes in the appraised value of homes that are used for calculating property taxes</a>.
+st.title(f'🏡 Exploration of the Property Tax Revaluation in {county_name} NC')
 
-I thought it would be interesting to see how residential property values have evolved from 2024 to 2025, and how they compare to each other in my county (Orange County NC). So, I used the publicly available Orange County GIS data to get the value of each property and compare them to others in the rest of the county.
-
-Below I'll provide some data that I found interesting, and at the bottom you can see how changes in property values compares to general distribution found in Orange County.
-""", unsafe_allow_html=True)
+st.markdown(page_content.INTRO, unsafe_allow_html=True)
 st.markdown("---")
 
-st.markdown("""
-**First, what is the revaluation process and why does it matter?**
-
-I'm not going to go into the full details, but the Orange County website does a <a href="https://www.orangecountync.gov/878/Revaluation" target="_blank">great job</a> of describing the process and answering a lot of questions (<a href="https://www.orangecountync.gov/FAQ.aspx?TID=40" target="_blank">and here is an additional FAQ</a>). From a simple perspective, it is the following:
-
-*"Revaluation is the process of updating all property tax assessments in Orange County to reflect market value as of a set date. For Orange County, this date is January 1, 2025. During this process, the tax office reassesses all real property, including land, buildings, and improvements. North Carolina law requires counties to revalue properties at least every eight years, Orange County follows a four-year revaluation cycle."*
-""", unsafe_allow_html=True)
+st.markdown(page_content.REVALUATION, unsafe_allow_html=True)
 st.markdown("---")
 
-st.markdown("""
-Next up, some basics on the data itself, and what is and is not included in this analysis
-
-**Where is the data sourced?**
-
-Nicely, Orange County Publishes all of this data on their <a href="https://www.orangecountync.gov/2057/Download-GIS-Data" target="_blank">website</a>. Full data for 2024 and previous years is on the site, but they were kind enough to supply preliminary 2025 data by email.
-
-**Does this include all properties in Orange County NC?**
-
-No! For simplicity, and because I wanted to focus on residential housing, I trimmed out a few types of properties:
-
-1. **Non Zero Tax Exemptions** This primarily includes out schools and similar tax exempt locations.
-2. **Land only plots** There is a LOT of land in Chapel Hill which doesn't have any buildings. It's been trimmed out.
-3. **Duplicates:** I wasn't sure exactly how to handle this, but there are more than a few duplicates Parcels in the data which are mostly similar. It's a relatively small amount, but only one was chosen.
-
-In sum, this leaves us with around 40K property locations in Orange County, down from around 62K. I should note that this data also includes a lot of other quirks which I don't fully understand, nor will likely ever understand. As the 2025 data is also *preliminary*, it is also likely to change and get cleaner over time.
+st.markdown(page_content.DATA_NOTES, unsafe_allow_html=True)
 
-Before we go deeper, we should check if this data makes sense. The following figure shows the median appraised value for each zip code in Orange County. Two zip codes had under 10 properties, so I filtered them out (27312 and 27515). As expected, the locations that are closer to the town center of chapel hill have higher valuations (e.g. 27514):
 
-""", unsafe_allow_html=True)
-
-
-# Load data
-orange = gpd.read_parquet('orange.parquet')
-zip_map = gpd.read_parquet('zip_map.parquet')
-zip_map["AppraisalValueChange"] = zip_map["AvgAppraisalValue"] / zip_map["AvgAppraisalValue_2024"] - 1
-
-
-# 1. Ensure ZIP GeoDataFrame has projected CRS
-zip_map_proj = zip_map.to_crs(epsg=3857)  # shading layer with value
-zip_boundaries = zip_map_proj.copy()
-zip_boundaries["geometry"] = zip_boundaries["geometry"].boundary  # outlines only
-
-# 2. Reproject Orange County boundary
-orange_proj = orange.to_crs(epsg=3857)
-
-# 3. Plot
-fig, ax = plt.subplots(figsize=(7,10))
-
-# Fill ZIPs with shading by appraisal value
-zip_map_proj.plot(
-    column="AvgAppraisalValue",
-    cmap="OrRd",
-    linewidth=0,
-    ax=ax,
-    legend=False,
-    legend_kwds={"label": "Avg Appraised Value", "shrink": 0.6}
-)
-
-# ZIP code boundary lines
-zip_boundaries.plot(ax=ax, linewidth=1, edgecolor="black")
-
-# County boundary
-orange_proj.boundary.plot(ax=ax, linewidth=2, edgecolor="blue")
-
-# ZIP code labels
-for idx, row in zip_map_proj.iterrows():
-    if pd.notnull(row["AvgAppraisalValue"]) and row.geometry.centroid.is_valid:
-        centroid = row.geometry.centroid
-        label = f"{row['ZIP']}\n${row['AvgAppraisalValue']:,.0f}"
-        ax.text(
-            centroid.x,
-            centroid.y,
-            label,
-            fontsize=8,
-            ha="center",
-            va="center",
-            color="black"
-        )
-
-# Clean layout
-ax.set_title("Median Appraised Value by ZIP in Orange County, NC", fontsize=14)
-ax.axis("off")
-plt.tight_layout()
-st.pyplot(fig)
+# Both maps are cached as encoded images shared by every session, keyed on the
+# geometry files' contents and the plot parameters, so they are drawn once per data version
+with profiler.stage('value_map'):
+    st.image(render_page_map('value_map', county, county_name))
 
 
 st.markdown("---")
 
-st.markdown("""
-**Next, does the data show that property valuations have increased in the county, and if so, by how much?**
-
-Yes. For this set of properties, appraised values increased by around 58% in 2025. However, there is also a lot of variation (see figures below). While almost no properties had lower value valuations, there were a rather larger number of properties that actually had valuations increase 2X, 5X and a few even by 10X.
-
-The table below shows a quick snapshot of the valuation change from 2024 to 2025.
-
-""")
-
-
-
-# Select and summarize
-columns_to_summarize = ['TotalAppraisedValue_percent', 'TotalAppraisedValue']
-selected_data = merged_df_trim_filter01[columns_to_summarize]
-
-summary_stats = selected_data.agg([
-    'mean',
-    lambda x: x.quantile(0.25),
-    'median',
-    lambda x: x.quantile(0.75)
-])
-
-# Rename and transpose
-summary_stats.index = ['Mean', '25th Percentile', 'Median', '75th Percentile']
-summary_stats = summary_stats.transpose()
-
-# Format values
-#summary_stats.loc['TotalAppraisedValue_percent'] =(summary_stats.loc['TotalAppraisedValue_percent']-1).round(2)
-summary_stats.loc['TotalAppraisedValue_percent'] = summary_stats.loc['TotalAppraisedValue_percent'].apply(
-    lambda x: f"{x * 100-100:.1f}%"
-)
-summary_stats.loc['TotalAppraisedValue'] = summary_stats.loc['TotalAppraisedValue'].apply(lambda x: f"${x:,.0f}")
-summary_stats.index = ['% Change in Appraisal Value', '2025 Appraised Value']
-
-# Build HTML table with centered values
-html_table = "<table style='width:100%; border-collapse:collapse; text-align:center;'>"
-
-# Header row
-html_table += "<thead><tr><th></th>"  # Empty top-left cell
-for col in summary_stats.columns:
-    html_table += f"<th>{col}</th>"
-html_table += "</tr></thead><tbody>"
-
-# Data rows
-for row_name, row_vals in summary_stats.iterrows():
-    html_table += f"<tr><td><strong>{row_name}</strong></td>"
-    for val in row_vals:
-        html_table += f"<td>{val}</td>"
-    html_table += "</tr>"
-
-html_table += "</tbody></table>"
-
-# Display
-st.markdown(html_table, unsafe_allow_html=True)
-
-
-st.markdown("""
-**Do these numbers seem to make sense?**
-
-At a high level, the increase in residential real estate valuation estimated over the past 4 years from both <a href="https://www.redfin.com/city/3059/NC/Chapel-Hill/housing-market" target="_blank">Redfin</a> and <a href="https://www.zillow.com/home-values/17386/chapel-hill-nc/" target="_blank">Zillow</a> seem in line with the increase shown in the tax revaluation.
-
-""", unsafe_allow_html=True)
-
-
-
-
-
-st.markdown("""
-**What factors most correlate with the *increase* in value?**
-
-*Do building characteristics such as Age or Square Footage matter?* It turns out, not so much. The correlation in the change of value is rather small to non-existent.
-
-*What about Land and Building Values? Did they change at the same rate?* No. This is where we see big differences. It turns out that mean changes in building values and land values have gone up at extremely different rates. The tax office finds that, for this sample, building values should increase by roughly 43%, while land values are closer to 115% (i.e. more than double). This also means that property owners who have a lot of land are likely to pay a much higher share of property taxes in the future and that home owners on small plots of land will likely pay less, relatively.
-
-
-""")
-
-
-# Select and summarize
-columns_to_summarize = ['TotalAppraisedLandValue_percent', 'TotalAppraisedBuildingValue_percent']
-selected_data = merged_df_trim_filter01[columns_to_summarize]
-
-# Compute summary statistics
-summary_stats = selected_data.agg([
-    'mean',
-    lambda x: x.quantile(0.25),
-    'median',
-    lambda x: x.quantile(0.75)
-])
-
-# Rename index rows for clarity
-summary_stats.index = ['Mean', '25th Percentile', 'Median', '75th Percentile']
-
-# Transpose for display (rows = land/building, columns = summary stats)
-summary_stats = summary_stats.transpose()
-
-# Format as percent change (e.g., 1.25 → 25.0%)
-summary_stats = summary_stats.applymap(lambda x: f"{x * 100 - 100:.1f}%")
+st.markdown(page_content.VALUE_CHANGE)
 
-# Rename row labels
-summary_stats.index = ['% Change in Land Value', '% Change in Building Value']
 
-# Build HTML table with centered values
-html_table = "<table style='width:100%; border-collapse:collapse; text-align:center;'>"
 
-# Header row
-html_table += "<thead><tr><th></th>"
-for col in summary_stats.columns:
-    html_table += f"<th>{col}</th>"
-html_table += "</tr></thead><tbody>"
+with profiler.stage('value_table'):
+    st.markdown(page_content.value_table(summary), unsafe_allow_html=True)
 
-# Data rows
-for row_name, row_vals in summary_stats.iterrows():
-    html_table += f"<tr><td><strong>{row_name}</strong></td>"
-    for val in row_vals:
-        html_table += f"<td>{val}</td>"
-    html_table += "</tr>"
 
-html_table += "</tbody></table>"
+st.markdown(page_content.SANITY_CHECK, unsafe_allow_html=True)
 
-# Display
-st.markdown(html_table, unsafe_allow_html=True)
 
 
-st.markdown("""
-This also means that if we average change in property values by zip code, we should see larger increases from the outside of town.
 
-This is quite evident as the zip codes with less land (27514 and 27510) show a smaller increase than those farther outside of town."
 
-""")
+st.markdown(page_content.FACTORS)
 
 
-# 3. Plot
-fig2, ax = plt.subplots(figsize=(7,10))
+with profiler.stage('change_table'):
+    st.markdown(page_content.change_table(summary), unsafe_allow_html=True)
 
-# Fill ZIPs with shading by appraisal value
-zip_map_proj.plot(
-    column="AppraisalValueChange",
-    cmap="OrRd",
-    linewidth=0,
-    ax=ax,
-    legend=False,
-    legend_kwds={"label": "Change in Appraised Value", "shrink": 0.6}
-)
 
-# ZIP code boundary lines
-zip_boundaries.plot(ax=ax, linewidth=1, edgecolor="black")
+st.markdown(page_content.ZIP_CHANGE)
 
-# County boundary
-orange_proj.boundary.plot(ax=ax, linewidth=2, edgecolor="blue")
 
-# ZIP code labels
-for idx, row in zip_map_proj.iterrows():
-    if pd.notnull(row["AppraisalValueChange"]) and row.geometry.centroid.is_valid:
-        centroid = row.geometry.centroid
-        label = f"{row['ZIP']}\n{row['AppraisalValueChange']*100:,.1f}%"
-        ax.text(
-            centroid.x,
-            centroid.y,
-            label,
-            fontsize=8,
-            ha="center",
-            va="center",
-            color="black"
-        )
+with profiler.stage('change_map'):
+    st.image(render_page_map('change_map', county, county_name))
 
-# Clean layout
-ax.set_title("Change in Appraised Value by ZIP in Orange County, NC", fontsize=14)
-ax.axis("off")
-plt.tight_layout()
-st.pyplot(fig2)
+# Median ratios of the parcels binned into grid cells by preprocess.py, written with the
+# neighbor index when the parcel layer was available
+@st.cache_resource
+def load_raster_grids(county):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.raster_grids()
+    path = artifact_paths(county)['rasters']
+    if os.path.exists(path):
+        return RasterGrids.read(path)
+    return None
 
+@st.cache_resource(show_spinner=False, max_entries=64)
+def render_raster_map(column, label, cell_size, data_version, raster_version, county, county_name):
+    zip_tier, county_tier = load_map_layers(county, data_version)
+    hist = load_distributions(county)['histograms'][column]
+    return page_figures.parcel_map(load_raster_grids(county), column, label, cell_size, zip_tier, county_tier, hist, county_name)
 
-st.markdown("---")
-
-st.markdown("""
-Of course, many individuals care about how changes in property valuation will compare to that of others in the county. If you want to see how any property compares to the distribution of others in Orange County, please go to the <a href="https://gis.orangecountync.gov/orangeNCGIS/default.htm">Orange County GIS website</a> to lookup the associated **PIN**, and then enter then enter that PIN below. This will show the change in that property's Total Valuation, Building Valuation and Land Valuation from 2024 to 2025.
-""", unsafe_allow_html=True)
-
-# Set up PIN lookup
-pin_lookup = merged_df_trim_filter01.set_index('ParcelID')
-
-# User input
-user_pin = st.text_input('🔎 Enter your PIN:', '')
-
-
-
-
-
-
-# Set up plot for Comparing input pin to Total Appraised Value
-fig1, ax = plt.subplots(figsize=(10, 6))
-
-# Calculate lower and upper bounds
-lower = merged_df_trim_filter01['TotalAppraisedValue_percent'].quantile(0.01)
-upper = merged_df_trim_filter01['TotalAppraisedValue_percent'].quantile(0.99)
-
-# If the user entered a valid PIN
-if user_pin:
-    if user_pin in pin_lookup.index:
-        user_value = pin_lookup.loc[user_pin, 'TotalAppraisedValue_percent']
-        user_value2 = pin_lookup.loc[user_pin, 'TotalAppraisedValue']
-        
-        # Only plot if user_value is within bounds
-        if lower <= user_value <= upper:
-            ax.axvline(user_value, color='red', linestyle='--', linewidth=2, label='🔴 Your Value')
-            st.success(f"PIN `{user_pin}` has a change in Total Appraisal Value of **{user_value:.2f}**X, and is currently **${round(user_value2):,}**.")
+# Changing the ratio or the cell size only re-runs this fragment
+@st.fragment
+def parcel_map_section(raster_grids):
+    section = Profiler(enabled=profiler.enabled, label='parcel_map_section', threaded=True)
+    labels = list(page_content.RATIO_CHOICES)
+    label = st.radio('Change in', labels, index=labels.index(page_content.PARCEL_MAP_DEFAULT_RATIO), horizontal=True,
+                     key='raster_ratio')
+    cell_size = st.select_slider('Grid square (metres)', raster_grids.cell_sizes[::-1],
+                                 value=raster_grids.default_cell_size(), key='raster_cell_size')
+    with section.stage('parcel_map'):
+        column = page_content.RATIO_CHOICES[label]
+        image = bundled_figure(county, 'parcel_map', column, cell_size, county_name)
+        if image is None:
+            path = artifact_paths(county)['rasters']
+            raster_version = file_digest(path, os.path.getmtime(path))
+            image = render_raster_map(column, label, cell_size, map_data_version(county), raster_version, county, county_name)
+        if image is None:
+            st.info('No parcels at this grid size.')
         else:
-            st.warning("Your value is outside the trimmed display range.")
-    else:
-        st.error("PIN not found. Please check your entry.")
-
-
-# Filter values within bounds
-filtered = merged_df_trim_filter01['TotalAppraisedValue_percent']
-filtered = filtered[(filtered >= lower) & (filtered <= upper)]
-
-# Plot
-filtered.dropna().hist(bins=100, edgecolor='black')
-plt.title('Trimmed Distribution of the Change in Total Appraised Property Value')
-plt.xlabel('Value')
-plt.ylabel('Frequency')
-plt.tight_layout()
-st.pyplot(fig1)
+            st.image(image)
+    finish_run(section)
 
+# only grids that located some parcels, see preprocess.write_artifacts
+raster_grids = load_raster_grids(county)
+if raster_grids is not None and len(raster_grids):
+    st.markdown(page_content.PARCEL_MAP)
+    parcel_map_section(raster_grids)
 
 
+st.markdown("---")
 
-# Set up plot for Comparing input pin to Total Building Appraised Value
-fig2, ax = plt.subplots(figsize=(10, 6))
+st.markdown(page_content.PIN_PROMPT, unsafe_allow_html=True)
+
+# The base histograms are drawn once per process (or taken from the bundle) with the
+# position of their axes; a PIN's marker is then drawn over the cached image with PIL,
+# without matplotlib
+@st.cache_resource(show_spinner=False)
+def render_histogram(hist, title):
+    return page_figures.pin_histogram(hist, title)
+
+def base_histogram(county, column, hist, title):
+    # (image, axes extent) of the histogram without a marker
+    key = page_figures.figure_key('pin_histogram', column)
+    bundle = load_bundle(county)
+    if bundle is not None and bundle.image_extent(key) is not None:
+        return bundle.image(key), bundle.image_extent(key)
+    return render_histogram(hist, title)
+
+# Entering a PIN only re-runs this fragment: the maps and tables above are not
+# re-executed, just the three overlays and their messages
+@st.fragment
+def pin_section():
+    # a fragment rerun doesn't re-execute the page, so it is timed as its own run
+    section = Profiler(enabled=profiler.enabled, label='pin_section', threaded=True)
+
+    # User input
+    user_pin = st.text_input('🔎 Enter your PIN:', '')
+
+    # One binary search returns all three ratios, the current values and the percentile ranks
+    with section.stage('pin_lookup'):
+        pin_record = pin_index.lookup(user_pin) if user_pin else None
+
+    for column, value_column, label, title in page_content.PIN_HISTOGRAMS:
+        # Precomputed lower and upper bounds
+        hist = summary['histograms'][column]
+        lower = hist['lower']
+        upper = hist['upper']
+        marker = None
+
+        # If the user entered a valid PIN
+        if user_pin:
+            if pin_record is not None:
+                user_value = pin_record[column]
+                user_value2 = pin_record[value_column]
+                user_rank = pin_record[f'{column}_rank']
+
+                # Only plot if user_value is within bounds
+                if lower <= user_value <= upper:
+                    marker = user_value
+                    st.success(f"PIN `{user_pin}` has a change in {label} **{user_value:.2f}**X, and is currently **${round(user_value2):,}**. That change is higher than **{user_rank:.0%}** of properties in the county.")
+                else:
+                    st.warning("Your value is outside the trimmed display range.")
+            else:
+                st.error("PIN not found. Please check your entry.")
+
+        with section.stage(f'histogram_{column}'):
+            image, extent = base_histogram(county, column, hist, title)
+            st.image(image if marker is None else page_figures.pin_marker(image, extent, marker))
+
+    # How the PIN compares to the parcels around it rather than to the whole county
+    with section.stage('neighbors'):
+        # only loaded (with scipy) once a PIN has been found
+        neighbor_index = load_neighbor_index(county) if pin_record is not None else None
+        if neighbor_index is not None:
+            k = st.slider('Number of nearby parcels to compare against', 10, 500, DEFAULT_K, step=10)
+            comparison = neighbor_index.compare(pin_record['row'], k=k)
+            if comparison is not None:
+                st.markdown(f"Compared to the **{comparison['neighbors']}** nearest parcels (all within **{comparison['max_distance']:,.0f} m**):")
+                st.dataframe(pd.DataFrame({
+                    'Change in': ['Total Value', 'Building Value', 'Land Value'],
+                    'This PIN': [f"{r['value']:.2f}X" for r in comparison['ratios']],
+                    'Neighbor Median': [f"{r['neighbor_median']:.2f}X" for r in comparison['ratios']],
+                    'Higher Than': [f"{r['rank']:.0%} of neighbors" for r in comparison['ratios']],
+                }), hide_index=True)
+
+    finish_run(section)
+
+pin_section()
+
+# County and ZIP ranks of every parcel, computed once per process for batch lookups
+@st.cache_resource(show_spinner=False)
+def load_parcel_ranks(county):
+    # a private numpy-backed copy, so the report's dtypes match the parquet reads
+    return parcel_ranks(load_table(county).to_pandas())
+
+# Batch mode: every PIN in an uploaded file is resolved with a single join
+pin_file = st.file_uploader('📄 Or upload a CSV of PINs (one per row) to compare them all at once:', type=['csv', 'txt'])
+if pin_file is not None:
+    try:
+        pins = read_pins(pin_file)
+    except ValueError:
+        pins = None
+        st.error(f"Couldn't read `{pin_file.name}` as a CSV of PINs.")
+    if pins is not None and not pins:
+        st.warning(f"No PINs found in `{pin_file.name}`.")
+    elif pins:
+        with profiler.stage('batch_compare') as stage:
+            report = compare_pins(pins, load_parcel_ranks(county))
+            stage['rows'] = len(report)
+        st.write(f"Found **{int(report['Found'].sum()):,}** of **{len(report):,}** PINs, largest change in total value relative to the county first.")
+        st.dataframe(report, hide_index=True)
+        st.download_button('Download report', report.to_csv(index=False), file_name='pin_report.csv', mime='text/csv')
 
-# Calculate lower and upper bounds
-lower = merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'].quantile(0.01)
-upper = merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'].quantile(0.99)
+st.markdown("---")
 
-# If the user entered a valid PIN
-if user_pin:
-    if user_pin in pin_lookup.index:
-        user_value = pin_lookup.loc[user_pin, 'TotalAppraisedBuildingValue_percent']
-        user_value2 = pin_lookup.loc[user_pin, 'TotalAppraisedBuildingValue']
-        
-        # Only plot if user_value is within bounds
-        if lower <= user_value <= upper:
-            ax.axvline(user_value, color='red', linestyle='--', linewidth=2, label='🔴 Your Value')
-            st.success(f"PIN `{user_pin}` has a change in Building Appraisal Value of: **{user_value:.2f}**X, and is currently **${round(user_value2):,}**.")
+st.markdown(page_content.SEGMENTS, unsafe_allow_html=True)
+
+# Segment statistics precomputed by preprocess.py for every combination of filters, so
+# a filter change is a dict lookup. Falls back to building the cube from the dataset.
+@st.cache_resource
+def load_segments(county):
+    bundle = load_bundle(county)
+    if bundle is not None:
+        return bundle.segments()
+    path = artifact_paths(county)['segments']
+    if os.path.exists(path):
+        return SegmentCube.read(path)
+    return SegmentCube.from_frame(read_parcels(county, columns=SEGMENT_COLUMNS), load_distributions(county)['histograms'])
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def render_segment_histograms(county, selection, column, compare, label):
+    return page_figures.segment_chart(load_segments(county), dict(selection), column, compare, label)
+
+# Changing a filter only re-runs this fragment
+@st.fragment
+def segment_section():
+    section = Profiler(enabled=profiler.enabled, label='segment_section', threaded=True)
+    with section.stage('load_segments'):
+        segments = load_segments(county)
+
+    selection = {}
+    for box, (dimension, name) in zip(st.columns(len(page_content.SEGMENT_DIMENSIONS)), page_content.SEGMENT_DIMENSIONS.items()):
+        level = box.selectbox(name, [ALL] + segments.levels[dimension], key=f'segment_{dimension}')
+        if level != ALL:
+            selection[dimension] = level
+    labels = list(page_content.RATIO_CHOICES)
+    label = st.radio('Change in', labels, index=labels.index(page_content.SEGMENT_DEFAULT_RATIO), horizontal=True,
+                     key='segment_ratio')
+    column = page_content.RATIO_CHOICES[label]
+    compare_names = {name: dimension for dimension, name in page_content.SEGMENT_DIMENSIONS.items()}
+    compare_options = ['Nothing'] + list(compare_names)
+    default_compare = compare_options.index(page_content.SEGMENT_DIMENSIONS[page_content.SEGMENT_DEFAULT_COMPARE])
+    compare = st.selectbox(f'Compare the {page_content.SEGMENT_COMPARE_TOP} largest groups by',
+                           compare_options, index=default_compare, key='segment_compare')
+    compare = compare_names.get(compare)
+
+    with section.stage('segment_lookup'):
+        if compare is None:
+            cell = segments.cell(selection, column)
+            cells = [('Selected Properties', cell)] if cell is not None and cell['count'] else []
         else:
-            st.warning("Your value is outside the trimmed display range.")
+            cells = segments.largest(compare, selection, column, page_content.SEGMENT_COMPARE_TOP)
+    if not cells:
+        st.info('No properties match these filters.')
     else:
-        st.error("PIN not found. Please check your entry.")
-    
-# Filter values within bounds
-filtered = merged_df_trim_filter01['TotalAppraisedBuildingValue_percent']
-filtered = filtered[(filtered >= lower) & (filtered <= upper)]
-
-# Plot
-filtered.dropna().hist(bins=100, edgecolor='black')
-plt.title('Trimmed Distribution of the Change in Total Appraised Building Value')
-plt.xlabel('Value')
-plt.ylabel('Frequency')
-plt.tight_layout()
-st.pyplot(fig2)
-
-
-
-# Set up plot for Comparing input pin to Total Land Appraised Value
-fig3, ax = plt.subplots(figsize=(10, 6))
-
-# Calculate lower and upper bounds
-lower = merged_df_trim_filter01['TotalAppraisedLandValue_percent'].quantile(0.01)
-upper = merged_df_trim_filter01['TotalAppraisedLandValue_percent'].quantile(0.99)
-
-# If the user entered a valid PIN
-if user_pin:
-    if user_pin in pin_lookup.index:
-        user_value = pin_lookup.loc[user_pin, 'TotalAppraisedLandValue_percent']
-        user_value2 = pin_lookup.loc[user_pin, 'TotalAppraisedLandValue']
-        
-        # Only plot if user_value is within bounds
-        if lower <= user_value <= upper:
-            ax.axvline(user_value, color='red', linestyle='--', linewidth=2, label='🔴 Your Value')
-            st.success(f"PIN `{user_pin}` has a change in Building Appraisal Value of: **{user_value:.2f}**X, and is currently **${round(user_value2):,}**.")
-        else:
-            st.warning("Your value is outside the trimmed display range.")
-    else:
-        st.error("PIN not found. Please check your entry.")
-    
-# Filter values within bounds
-filtered = merged_df_trim_filter01['TotalAppraisedLandValue_percent']
-filtered = filtered[(filtered >= lower) & (filtered <= upper)]
-
-# Plot
-filtered.dropna().hist(bins=100, edgecolor='black')
-plt.title('Trimmed Distribution of the Change in Total Appraised Land Value')
-plt.xlabel('Value')
-plt.ylabel('Frequency')
-plt.tight_layout()
-st.pyplot(fig3)
-
-
-
+        st.markdown(page_content.segment_table([(f"{level} ({cell['count']:,})", cell) for level, cell in cells]), unsafe_allow_html=True)
+        with section.stage('segment_histograms'):
+            selected = tuple(sorted(selection.items()))
+            image = bundled_figure(county, 'segment_chart', selected, column, compare)
+            st.image(image if image is not None else render_segment_histograms(county, selected, column, compare, label))
 
+    finish_run(section)
 
+segment_section()
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-# # Set up plot for Comparing input pin to Total Appraised Value
-# fig2, ax = plt.subplots(figsize=(10, 6))
-
-# # Pre-calculate trimmed bounds
-# lower = merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'].quantile(0.01)
-# upper = merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'].quantile(0.99)
-
-# # Top 3 building types
-# top_btypes = merged_df_trim_filter01['BldgTypeDescription'].value_counts().head(3).index
-
-# # Plot normalized histograms
-# for btype in top_btypes:
-#     subset = merged_df_trim_filter01[
-#         (merged_df_trim_filter01['BldgTypeDescription'] == btype) &
-#         (merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'] >= lower) &
-#         (merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'] <= upper)
-#     ]['TotalAppraisedBuildingValue_percent'].dropna()
-    
-#     ax.hist(subset, bins=100, alpha=0.5, label=btype, edgecolor='black', linewidth=0.5, density=True)
-
-# # If the user entered a valid PIN
-# if user_pin:
-#     if user_pin in pin_lookup.index:
-#         user_value = pin_lookup.loc[user_pin, 'TotalAppraisedBuildingValue_percent']
-        
-#         # Only plot if user_value is within bounds
-#         if lower <= user_value <= upper:
-#             ax.axvline(user_value, color='red', linestyle='--', linewidth=2, label='🔴 Your Value')
-#             st.success(f"Found PIN `{user_pin}` with Building Value Percent: **{user_value:.2f}**")
-#         else:
-#             st.warning("Your value is outside the trimmed display range.")
-#     else:
-#         st.error("PIN not found. Please check your entry.")
-
-# # Final plot settings
-# ax.set_title('Normalized Building Value Distribution (Top 3 Building Types)')
-# ax.set_xlabel('Building Value Percent')
-# ax.set_ylabel('Density')
-# ax.legend(title='Building Type')
-# plt.tight_layout()
-
-# st.pyplot(fig2)
-
 # Footer
 st.markdown("---")
 
-st.markdown("""
-**Wrap up**
+st.markdown(page_content.WRAP_UP, unsafe_allow_html=True)
+
+finish_run(profiler)
 
-Given the above, there are lots of potentially unanswered questions. One which still stands out to me is the "lumpiness" in the change in Land Valuation. While changes in building valuation seem to have a smooth curve, the changes in Land Valuation have many large jumps, most notably around 50%, 100% and a handful of other values. This suggests a rather coarse modeling.
-""", unsafe_allow_html=True)
+# Hidden debug panel, only shown with ?debug=1
+if DEBUG:
+    with st.expander('Debug: stage timings'):
+        st.caption(f'This rerun (process {os.getpid()})')
+        st.dataframe(pd.DataFrame(profiler.stages), hide_index=True)
+        st.caption('Every session of this process')
+        st.dataframe(pd.DataFrame(stage_stats().table()), hide_index=True)
+        st.caption('Wall time of the most recent page reruns, seconds')
+        st.line_chart(pd.DataFrame({'wall_s': [run['wall_s'] for run in stage_stats().recent('page')]}))
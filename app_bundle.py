@@ -0,0 +1,200 @@
+# everything the first page view needs in one file, memory mapped with a single open
+# app_bundle.py
+#
+#   magic            8 bytes, BUNDLE_MAGIC
+#   header length    uint64, little endian
+#   header           JSON: county name, summary, PIN index columns and the section table
+#   sections         each at a multiple of ALIGNMENT bytes:
+#     arrow          Arrow IPC file (the parcel table), used in place from the mapping
+#     array          raw numpy array (the PIN index), used in place from the mapping
+#     parquet        small tables (map tiers, segment cube, raster grids), decoded on use
+#     png            the page's figures in their default state, pre-rendered
+#
+# The app reads the bundle instead of the dozen files preprocess.py writes next to it,
+# and shows the pre-rendered figures until a visitor changes something, so the first
+# view needs neither matplotlib nor geopandas.
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+
+import page_content
+import page_figures
+import plots
+from geo_tiers import tier_layers
+from pin_index import PinIndex
+from raster_grids import RasterGrids
+from segments import SegmentCube
+
+
+BUNDLE_PATH = 'app_bundle.bin'
+
+BUNDLE_MAGIC = b'PTXBNDL1'
+
+# section offsets are aligned for any Arrow or numpy type
+ALIGNMENT = 64
+
+# tables copied into the bundle as parquet sections, by artifact_paths key
+PARQUET_SECTIONS = ['zip_tiers', 'county_tiers', 'segments', 'rasters']
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+def write_bundle(path, header, sections):
+    # sections: [(name, kind, bytes, extra header fields)]. Written under a temporary
+    # name and renamed, so a running app keeps its mapping of the old file.
+    table = {}
+    offset = 0
+    for name, kind, data, extra in sections:
+        table[name] = {'kind': kind, 'offset': offset, 'length': len(data), **extra}
+        offset += len(data) + _padding(len(data))
+    header = json.dumps({**header, 'sections': table}).encode()
+    start = len(BUNDLE_MAGIC) + 8 + len(header)
+    start += _padding(start)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(BUNDLE_MAGIC + len(header).to_bytes(8, 'little') + header)
+        f.write(b'\0' * (start - f.tell()))
+        for name, kind, data, extra in sections:
+            f.write(data)
+            f.write(b'\0' * _padding(len(data)))
+    os.replace(temporary, path)
+
+
+def array_section(name, array):
+    array = np.ascontiguousarray(array)
+    return name, 'array', array.tobytes(), {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+
+class AppBundle:
+    # the mapped file; every accessor returns a view into it
+
+    def __init__(self, buffer):
+        if buffer.size < 16 or buffer.slice(0, 8).to_pybytes() != BUNDLE_MAGIC:
+            raise ValueError('not an app bundle')
+        length = int.from_bytes(buffer.slice(8, 8).to_pybytes(), 'little')
+        self.header = json.loads(buffer.slice(16, length).to_pybytes())
+        start = 16 + length
+        self.start = start + _padding(start)
+        self.buffer = buffer
+        self.sections = self.header['sections']
+
+    @classmethod
+    def read(cls, path=BUNDLE_PATH):
+        return cls(pa.memory_map(path).read_buffer())
+
+    @property
+    def county_name(self):
+        return self.header['county_name']
+
+    @property
+    def summary(self):
+        return self.header['summary']
+
+    def has(self, name):
+        return name in self.sections
+
+    def section(self, name):
+        entry = self.sections[name]
+        return self.buffer.slice(self.start + entry['offset'], entry['length'])
+
+    def reader(self, name):
+        # a file-like view, for readers that take a path or an open file
+        return pa.BufferReader(self.section(name))
+
+    def table(self, name):
+        return pa.ipc.open_file(self.section(name)).read_all()
+
+    def array(self, name):
+        entry = self.sections[name]
+        return np.frombuffer(self.section(name), dtype=entry['dtype']).reshape(entry['shape'])
+
+    def image(self, key):
+        # pre-rendered figure, or None if this one wasn't
+        name = f'figure:{key}'
+        return self.section(name).to_pybytes() if name in self.sections else None
+
+    def image_extent(self, key):
+        # plots.axes_extent of a pre-rendered histogram, or None
+        return self.sections.get(f'figure:{key}', {}).get('extent')
+
+    def pin_index(self):
+        meta = self.header['pin_index']
+        sorted_ratios = {column: self.array(f'pin_index:sorted:{column}') for column in meta['ratios']}
+        return PinIndex(self.array('pin_index:ids'), self.array('pin_index:rows'), self.array('pin_index:values'),
+                        meta['columns'], sorted_ratios)
+
+    def segments(self):
+        return SegmentCube.read(self.reader('segments'))
+
+    def raster_grids(self):
+        return RasterGrids.read(self.reader('rasters')) if self.has('rasters') else None
+
+    def map_layers(self, figsize, dpi):
+        return tier_layers(self.reader('zip_tiers'), self.reader('county_tiers'), figsize, dpi)
+
+
+def default_figures(bundle, county_name):
+    # the figures app.py shows before a visitor picks anything, drawn from the bundle
+    # itself so they match what the app would draw from it, as {key: (png, extra header
+    # fields)}; the PIN histograms carry their axes extent for the PIN's marker
+    figures = {}
+    zip_tier, county_tier = bundle.map_layers(plots.MAP_FIGSIZE, plots.SAVEFIG_OPTIONS['dpi'])
+    for name in page_content.ZIP_MAPS:
+        figures[page_figures.figure_key('zip_map', name, county_name)] = (
+            page_figures.zip_map(name, zip_tier, county_tier, county_name), {})
+
+    histograms = bundle.summary['histograms']
+    for column, value_column, label, title in page_content.PIN_HISTOGRAMS:
+        image, extent = page_figures.pin_histogram(histograms[column], title)
+        figures[page_figures.figure_key('pin_histogram', column)] = (image, {'extent': extent})
+
+    label = page_content.SEGMENT_DEFAULT_RATIO
+    column, compare = page_content.RATIO_CHOICES[label], page_content.SEGMENT_DEFAULT_COMPARE
+    figures[page_figures.figure_key('segment_chart', [], column, compare)] = (
+        page_figures.segment_chart(bundle.segments(), {}, column, compare, label), {})
+
+    raster_grids = bundle.raster_grids()
+    if raster_grids is not None and len(raster_grids):
+        label = page_content.PARCEL_MAP_DEFAULT_RATIO
+        column, cell_size = page_content.RATIO_CHOICES[label], raster_grids.default_cell_size()
+        image = page_figures.parcel_map(raster_grids, column, label, cell_size, zip_tier, county_tier,
+                                        histograms[column], county_name)
+        if image is not None:
+            figures[page_figures.figure_key('parcel_map', column, cell_size, county_name)] = (image, {})
+    return figures
+
+
+def build_app_bundle(paths, county_name, path=BUNDLE_PATH):
+    # paths: artifact_paths() of the files preprocess.py just wrote
+    with open(paths['summary']) as f:
+        summary = json.load(f)
+    with open(paths['shared'], 'rb') as f:
+        sections = [('parcels', 'arrow', f.read(), {})]
+
+    index = PinIndex.load(paths['pin_index'], mmap=False)
+    sections.append(array_section('pin_index:ids', index.ids))
+    sections.append(array_section('pin_index:rows', index.rows))
+    sections.append(array_section('pin_index:values', index.values))
+    for column, values in index.sorted_ratios.items():
+        sections.append(array_section(f'pin_index:sorted:{column}', values))
+
+    for name in PARQUET_SECTIONS:
+        if os.path.exists(paths[name]):
+            with open(paths[name], 'rb') as f:
+                sections.append((name, 'parquet', f.read(), {}))
+
+    header = {
+        'county_name': county_name,
+        'summary': summary,
+        'pin_index': {'columns': index.columns, 'ratios': list(index.sorted_ratios)},
+    }
+    # the figures are drawn from a bundle of the data sections, then added to it
+    write_bundle(path, header, sections)
+    figures = default_figures(AppBundle.read(path), county_name)
+    write_bundle(path, header, sections + [(f'figure:{key}', 'png', data, extra) for key, (data, extra) in figures.items()])
+    return AppBundle.read(path)
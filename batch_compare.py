@@ -0,0 +1,93 @@
+# batch PIN comparison: a file of PINs in, a ranked report out
+# batch_compare.py
+#
+#   python batch_compare.py pins.csv -o report.csv
+import argparse
+
+import pandas as pd
+
+from county_dataset import read_parcels
+from pin_index import RATIO_COLUMNS, VALUE_COLUMNS
+
+
+PROCESSED_PATH = 'processed_data.parquet'
+
+# columns read from processed_data.parquet
+PARCEL_COLUMNS = ['ParcelID', 'Zip'] + RATIO_COLUMNS + VALUE_COLUMNS
+
+# header names tried, in order, when the PIN column isn't given
+PIN_COLUMN_NAMES = ['PIN', 'ParcelID', 'pin', 'parcel_id']
+
+
+def read_pins(source, column=None):
+    # one PIN per row; blank rows and repeats are dropped, the input order is kept. The
+    # first row is a header only if it names the PIN column (column, or one of
+    # PIN_COLUMN_NAMES), so a plain list of PINs keeps its first PIN. An empty file has
+    # no PINs; one that isn't CSV text raises ValueError (pandas' ParserError, or
+    # UnicodeDecodeError).
+    try:
+        rows = pd.read_csv(source, dtype=str, header=None)
+    except pd.errors.EmptyDataError:
+        return []
+    first = rows.iloc[0].str.strip().tolist() if len(rows) else []
+    header = next((name for name in ([column] if column else PIN_COLUMN_NAMES) if name in first), None)
+    if header is not None:
+        pins = rows.iloc[1:, first.index(header)]
+    elif column is not None:
+        raise ValueError(f'no {column!r} column in the header of the PIN file')
+    else:
+        pins = rows.iloc[:, 0] if len(rows.columns) else pd.Series(dtype=str)
+    pins = pins.str.strip()
+    return pins[pins.notna() & (pins != '')].drop_duplicates().tolist()
+
+
+def parcel_ranks(parcels):
+    # county and ZIP percentile rank of every parcel's ratios: the share of parcels
+    # with a ratio strictly below it, the same definition the PIN index uses
+    ranks = parcels[PARCEL_COLUMNS].copy()
+    by_zip = parcels.groupby('Zip', observed=True)
+    for column in RATIO_COLUMNS:
+        ranks[f'{column}_county_rank'] = (parcels[column].rank(method='min') - 1) / parcels[column].count()
+        ranks[f'{column}_zip_rank'] = (by_zip[column].rank(method='min') - 1) / by_zip[column].transform('count')
+    return ranks
+
+
+def compare_pins(pins, ranks):
+    # one join resolves every PIN; unknown PINs are kept with Found=False
+    report = pd.DataFrame({'PIN': pd.Series(pins, dtype=ranks['ParcelID'].dtype)})
+    report = report.merge(ranks, left_on='PIN', right_on='ParcelID', how='left')
+    report.insert(1, 'Found', report.pop('ParcelID').notna())
+
+    # largest increase in total value relative to the county first
+    return report.sort_values('TotalAppraisedValue_percent_county_rank', ascending=False,
+                              na_position='last', ignore_index=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare a file of PINs to the county and ZIP distributions')
+    parser.add_argument('pins', help='CSV with one PIN per row')
+    parser.add_argument('-o', '--output', default='pin_report.csv', help='where to write the report')
+    parser.add_argument('--column', help='name of the PIN column (default: PIN, ParcelID or the first column; without one of those headers every row is a PIN)')
+    parser.add_argument('--data', default=PROCESSED_PATH, help='processed parcel table')
+    parser.add_argument('--county', metavar='FIPS', help='read this county (e.g. 37135) from the partitioned dataset instead of --data')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        pins = read_pins(args.pins, args.column)
+    except ValueError as error:
+        raise SystemExit(f'could not read PINs from {args.pins}: {error}')
+    if args.county:
+        parcels = read_parcels(args.county, columns=PARCEL_COLUMNS)
+    else:
+        parcels = pd.read_parquet(args.data, columns=PARCEL_COLUMNS)
+    ranks = parcel_ranks(parcels)
+    report = compare_pins(pins, ranks)
+    report.to_csv(args.output, index=False)
+    print(f"{int(report['Found'].sum()):,} of {len(report):,} PINs found, report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# cold start of app.py: a fresh interpreter rendering the page once, as a new container
+# does for its first visitor, checked against a time budget
+# benchmarks/cold_start.py
+#
+#   python benchmarks/cold_start.py --dir .                  # where preprocess.py wrote its outputs
+#   python benchmarks/cold_start.py --dir . --runs 5 --budget 2
+#
+# Each run is its own process: the time from launching the interpreter to the end of
+# the first page run, split into start up (interpreter, streamlit) and the page run
+# (the app's imports, loads and renders). Exits with status 1 when the median total is
+# over --budget seconds or the page raised.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'app.py')
+
+# seconds from launch to the first rendered page
+COLD_START_BUDGET = 2.0
+
+# imports that a page run should only pay for once a section needs them
+HEAVY_MODULES = ['matplotlib', 'geopandas', 'shapely', 'scipy', 'pyproj', 'duckdb']
+
+
+def first_run():
+    # runs in the fresh process, under the directory holding the app's data
+    started = time.time()
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=600)
+    ready = time.time()
+    app.run()
+    rendered = time.time()
+    app.run()
+    return {
+        'ready': ready, 'started': started, 'rendered': rendered, 'rerun_s': time.time() - rendered,
+        'exceptions': [exception.value for exception in app.exception],
+        'heavy_modules': [module for module in HEAVY_MODULES if module in sys.modules],
+    }
+
+
+def cold_start(data_dir):
+    launched = time.time()
+    command = [sys.executable, os.path.abspath(__file__), '--worker']
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=data_dir).stdout
+    run = json.loads(output.strip().splitlines()[-1])
+    return {
+        'startup_s': run['ready'] - launched,
+        'page_s': run['rendered'] - run['ready'],
+        'total_s': run['rendered'] - launched,
+        'rerun_s': run['rerun_s'],
+        'exceptions': run['exceptions'],
+        'heavy_modules': run['heavy_modules'],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time a fresh process rendering app.py once')
+    parser.add_argument('--dir', default='.', help='directory with the preprocess.py outputs the app reads')
+    parser.add_argument('--runs', type=int, default=3, help='fresh processes to time, the median is reported')
+    parser.add_argument('--budget', type=float, default=COLD_START_BUDGET, help='seconds allowed from launch to first page')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        print(json.dumps(first_run()))
+        return
+
+    runs = [cold_start(args.dir) for _ in range(args.runs)]
+    print(f"{'run':>4} {'startup s':>10} {'page s':>8} {'total s':>8} {'rerun s':>8}")
+    for i, run in enumerate(runs, 1):
+        print(f"{i:>4} {run['startup_s']:>10.2f} {run['page_s']:>8.2f} {run['total_s']:>8.2f} {run['rerun_s']:>8.2f}")
+    total = statistics.median(run['total_s'] for run in runs)
+    print(f"heavy modules loaded by the first page: {', '.join(runs[-1]['heavy_modules']) or 'none'}")
+
+    exceptions = [exception for run in runs for exception in run['exceptions']]
+    if exceptions:
+        print(f'the page raised: {exceptions[0]}')
+        sys.exit(1)
+    if total > args.budget:
+        print(f'cold start {total:.2f} s, over the {args.budget:.2f} s budget')
+        sys.exit(1)
+    print(f'cold start {total:.2f} s, within the {args.budget:.2f} s budget')
+
+
+if __name__ == '__main__':
+    main()
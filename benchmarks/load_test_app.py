@@ -0,0 +1,299 @@
+# load test for app.py: concurrent headless sessions on one Streamlit server, each
+# loading the page and then entering PINs, reporting latency percentiles, throughput
+# and the server's CPU time and memory per session
+# benchmarks/load_test_app.py
+#
+#   python benchmarks/load_test_app.py --dir .                     # where preprocess.py wrote its outputs
+#   python benchmarks/load_test_app.py --dir . --sessions 1 4 16 32 --pins 20 --max-p99 2
+#
+# Every session count gets a fresh `streamlit run app.py` process. The sessions speak
+# the browser's protocol over the websocket: a page load is a rerun_script message, a
+# PIN entry a rerun of the PIN fragment with the text input's new value, and each
+# action ends when the server reports the script finished and every image it sent has
+# been fetched. The server is warmed up with one session first, so the numbers are for
+# a running instance, not a cold start (benchmarks/cold_start.py covers that).
+#
+# CPU and memory are the server process's, over the timed run, divided by the session
+# count: the sessions share one interpreter, so no finer split exists. Exits with
+# status 1 when the PIN entry p99 is over --max-p99 seconds or an action failed.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from instrument import cpu_s, rss_mb
+
+APP = os.path.join(ROOT, 'app.py')
+
+SESSIONS = [1, 4, 16]
+
+# PIN entries per session after the page load
+PINS_PER_SESSION = 10
+
+# seconds a visitor waits between actions, drawn uniformly from this range
+THINK_TIME = (0.5, 2.0)
+
+# share of PIN entries for a PIN that doesn't exist
+MISS_SHARE = 0.05
+
+# seconds over which the sessions of one run arrive
+RAMP_UP = 2.0
+
+# seconds between samples of the server's resident memory
+SAMPLE_INTERVAL = 0.1
+
+ACTIONS = ['page', 'pin']
+
+PIN_LABEL = '🔎 Enter your PIN:'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(data_dir, port):
+    # the app in its own process, so the sessions and the server don't share an interpreter
+    command = [sys.executable, '-m', 'streamlit', 'run', APP, '--server.headless', 'true',
+               '--server.port', str(port), '--server.address', '127.0.0.1',
+               '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none']
+    server = subprocess.Popen(command, cwd=data_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1).read()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise SystemExit('streamlit run app.py exited during startup')
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit('streamlit run app.py did not start within 120 s')
+
+
+def session_script(pins, n_pins, seed):
+    # the PINs one visitor enters, in order
+    rng = random.Random(seed)
+    return [rng.choice(pins) if rng.random() >= MISS_SHARE else 'NOT-A-PIN' for _ in range(n_pins)]
+
+
+class Session:
+    # one browser tab: a websocket to the server and the widgets it has been sent
+
+    def __init__(self, port):
+        self.port = port
+        self.pin_widget = None
+        self.pin_fragment = ''
+
+    async def __aenter__(self):
+        import websockets
+
+        self.ws = await websockets.connect(f'ws://127.0.0.1:{self.port}/_stcore/stream',
+                                           subprotocols=['streamlit'], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def rerun(self, widget=None, value=None, fragment=''):
+        # one script run; returns whether it finished cleanly. Images are fetched the
+        # way the browser does, once their element arrives.
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.page_script_hash = ''
+        message.rerun_script.fragment_id = fragment
+        if widget is not None:
+            message.rerun_script.widget_states.widgets.add(id=widget, string_value=value)
+        await self.ws.send(message.SerializeToString())
+
+        fetches, ok = [], True
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.ws.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'script_finished':
+                ok = ok and forward.script_finished in (
+                    ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+                break
+            if kind != 'delta' or forward.delta.WhichOneof('type') != 'new_element':
+                continue
+            element = forward.delta.new_element
+            element_kind = element.WhichOneof('type')
+            if element_kind == 'exception':
+                ok = False
+            elif element_kind == 'imgs':
+                for image in element.imgs.imgs:
+                    fetches.append(asyncio.to_thread(self.fetch, image.url))
+            elif element_kind == 'text_input' and element.text_input.label == PIN_LABEL:
+                self.pin_widget, self.pin_fragment = element.text_input.id, forward.delta.fragment_id
+        return all(await asyncio.gather(*fetches)) and ok
+
+    def fetch(self, url):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{self.port}{url}', timeout=60).read()
+            return True
+        except OSError:
+            return False
+
+    async def load_page(self):
+        return await self.rerun()
+
+    async def enter_pin(self, pin):
+        # only the PIN fragment reruns, as when a visitor types into the box
+        return await self.rerun(self.pin_widget, pin, self.pin_fragment)
+
+
+async def visit(port, pins, think, seed, start_delay, latencies, errors):
+    rng = random.Random(seed)
+    await asyncio.sleep(start_delay)
+    async with Session(port) as session:
+        actions = [('page', None)] + [('pin', pin) for pin in pins]
+        for i, (action, pin) in enumerate(actions):
+            if i:
+                await asyncio.sleep(rng.uniform(*think))
+            start = time.perf_counter()
+            ok = await (session.load_page() if action == 'page' else session.enter_pin(pin))
+            latencies[action].append(time.perf_counter() - start)
+            if not ok or (action == 'page' and session.pin_widget is None):
+                errors[action] += 1
+
+
+def sample_rss(pid, stop, samples):
+    while not stop.is_set():
+        samples.append(rss_mb(pid))
+        stop.wait(SAMPLE_INTERVAL)
+
+
+async def run_load(port, scripts, think, ramp_up):
+    latencies = {action: [] for action in ACTIONS}
+    errors = {action: 0 for action in ACTIONS}
+    await asyncio.gather(*[
+        visit(port, pins, think, seed, ramp_up * seed / len(scripts), latencies, errors)
+        for seed, pins in enumerate(scripts)
+    ])
+    return latencies, errors
+
+
+def percentile_ms(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return 1000 * values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load_test(args, sessions, pins):
+    port = free_port()
+    server = start_app(args.dir, port)
+    try:
+        # one visitor first, so imports and caches are warm before the clock starts
+        asyncio.run(run_load(port, [session_script(pins, 1, seed=-1)], (0, 0), 0))
+
+        scripts = [session_script(pins, args.pins, seed) for seed in range(sessions)]
+        rss_before, cpu_before = rss_mb(server.pid), cpu_s(server.pid)
+        stop, samples = threading.Event(), []
+        sampler = threading.Thread(target=sample_rss, args=(server.pid, stop, samples), daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        latencies, errors = asyncio.run(run_load(port, scripts, args.think, args.ramp_up))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        cpu = cpu_s(server.pid) - cpu_before
+    finally:
+        server.terminate()
+        server.wait()
+
+    actions = sum(len(values) for values in latencies.values())
+    peak_rss = max(sample for sample in samples if sample is not None)
+    return {
+        'sessions': sessions,
+        'duration_s': elapsed,
+        'actions': actions,
+        'actions_per_s': actions / elapsed,
+        'server_cpu_s': cpu,
+        'server_cpu_share': cpu / elapsed,
+        'cpu_s_per_session': cpu / sessions,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss,
+        'rss_mb_per_session': (peak_rss - rss_before) / sessions,
+        'actions_by_kind': {
+            action: {
+                'count': len(values),
+                'errors': errors[action],
+                'p50_ms': percentile_ms(values, 0.50),
+                'p90_ms': percentile_ms(values, 0.90),
+                'p99_ms': percentile_ms(values, 0.99),
+            }
+            for action, values in latencies.items()
+        },
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test app.py with concurrent headless sessions')
+    parser.add_argument('--dir', default='.', help='directory with the preprocess.py outputs the app reads')
+    parser.add_argument('--data', default='processed_data.parquet', help='parcel table the PINs are drawn from, under --dir')
+    parser.add_argument('--sessions', type=int, nargs='+', default=SESSIONS, help='concurrent session counts to run')
+    parser.add_argument('--pins', type=int, default=PINS_PER_SESSION, help='PIN entries per session after the page load')
+    parser.add_argument('--think', type=float, nargs=2, default=THINK_TIME, metavar=('MIN', 'MAX'),
+                        help='seconds between a session\'s actions')
+    parser.add_argument('--ramp-up', type=float, default=RAMP_UP, help='seconds over which the sessions arrive')
+    parser.add_argument('--max-p99', type=float, help='seconds the PIN entry p99 may take before the check fails')
+    parser.add_argument('-o', '--output', help='also write the results here as JSON')
+    return parser.parse_args()
+
+
+def main():
+    import pandas as pd
+
+    args = parse_args()
+    if rss_mb() is None:
+        raise SystemExit('server CPU and memory are read from /proc, which this platform does not have')
+    args.dir = os.path.abspath(args.dir)
+    pins = pd.read_parquet(os.path.join(args.dir, args.data), columns=['ParcelID'])['ParcelID'].astype(str).tolist()
+
+    results = [load_test(args, sessions, pins) for sessions in args.sessions]
+
+    print(f"{'sessions':>8} {'actions/s':>9} {'page p50':>9} {'p90':>7} {'p99':>7} "
+          f"{'pin p50':>8} {'p90':>7} {'p99':>7} {'cpu s/sess':>10} {'MB/sess':>8} {'errors':>6}")
+    for run in results:
+        page, pin = run['actions_by_kind']['page'], run['actions_by_kind']['pin']
+        errors = page['errors'] + pin['errors']
+        pin_ms = [pin[q] or 0 for q in ['p50_ms', 'p90_ms', 'p99_ms']]
+        print(f"{run['sessions']:>8} {run['actions_per_s']:>9.2f} {page['p50_ms']:>9.0f} {page['p90_ms']:>7.0f} "
+              f"{page['p99_ms']:>7.0f} {pin_ms[0]:>8.0f} {pin_ms[1]:>7.0f} {pin_ms[2]:>7.0f} "
+              f"{run['cpu_s_per_session']:>10.2f} {run['rss_mb_per_session']:>8.1f} {errors:>6}")
+    print(f'latencies in ms; server busy {results[-1]["server_cpu_share"]:.0%} of the last run '
+          f'on {os.cpu_count()} CPUs, peak RSS {results[-1]["peak_rss_mb"]:.0f} MB')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'pins_per_session': args.pins, 'runs': results}, f, indent=1)
+
+    failed = [run for run in results if any(kind['errors'] for kind in run['actions_by_kind'].values())]
+    if failed:
+        print(f"{failed[0]['sessions']} sessions: some actions failed or raised")
+        sys.exit(1)
+    if args.max_p99 is not None:
+        worst = max(run['actions_by_kind']['pin']['p99_ms'] or 0 for run in results) / 1000
+        if worst > args.max_p99:
+            print(f'PIN entry p99 {worst:.2f} s, over the {args.max_p99:.2f} s budget')
+            sys.exit(1)
+        print(f'PIN entry p99 {worst:.2f} s, within the {args.max_p99:.2f} s budget')
+
+
+if __name__ == '__main__':
+    main()
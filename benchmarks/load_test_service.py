@@ -0,0 +1,188 @@
+# load test for lookup_service.py: keep-alive connections sending a mix of PIN,
+# batch PIN and ZIP requests, reporting throughput and latency percentiles
+# benchmarks/load_test_service.py
+#
+#   python benchmarks/load_test_service.py --data processed_data.parquet
+#   python benchmarks/load_test_service.py --url http://127.0.0.1:8000 --data processed_data.parquet
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# share of requests per endpoint
+MIX = {'pin': 0.90, 'pins': 0.05, 'zip': 0.05}
+
+# PINs per batch request
+BATCH_SIZE = 100
+
+# share of single PIN requests for a PIN that doesn't exist
+MISS_SHARE = 0.05
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(args, port):
+    # the service in its own process, so the test and the server don't share an interpreter
+    command = [sys.executable, os.path.join(ROOT, 'lookup_service.py'), '--port', str(port), '--data', args.data]
+    if args.county:
+        command += ['--county', args.county]
+    server = subprocess.Popen(command)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise SystemExit('lookup_service.py exited during startup')
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit('lookup_service.py did not start within 120 s')
+
+
+def make_requests(pins, zips, n, seed=0):
+    # pre-encoded HTTP/1.1 requests, so the client spends its time on the network
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        kind = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        if kind == 'pin':
+            pin = rng.choice(pins) if rng.random() >= MISS_SHARE else 'NOT-A-PIN'
+            raw = f'GET /pin/{urllib.parse.quote(pin)} HTTP/1.1\r\nHost: lookup\r\n\r\n'.encode()
+        elif kind == 'pins':
+            body = json.dumps({'pins': rng.sample(pins, min(BATCH_SIZE, len(pins)))}).encode()
+            raw = (f'POST /pins HTTP/1.1\r\nHost: lookup\r\nContent-Type: application/json\r\n'
+                   f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+        else:
+            raw = f'GET /zip/{rng.choice(zips)} HTTP/1.1\r\nHost: lookup\r\n\r\n'.encode()
+        requests.append((kind, raw))
+    return requests
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def connection(host, port, requests, stop_at, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    while time.perf_counter() < stop_at:
+        kind, raw = requests[i % len(requests)]
+        i += 1
+        start = time.perf_counter()
+        writer.write(raw)
+        status = await read_response(reader)
+        latencies[kind].append(time.perf_counter() - start)
+        if status >= 500 or (status >= 400 and kind != 'pin'):
+            errors[kind] += 1
+    writer.close()
+
+
+async def run_load(host, port, requests, connections, duration):
+    latencies = {kind: [] for kind in MIX}
+    errors = {kind: 0 for kind in MIX}
+    stop_at = time.perf_counter() + duration
+    await asyncio.gather(*[
+        connection(host, port, requests[i::connections] or requests, stop_at, latencies, errors)
+        for i in range(connections)
+    ])
+    return latencies, errors
+
+
+def percentile_ms(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return 1000 * values[min(len(values) - 1, int(q * len(values)))]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test lookup_service.py')
+    parser.add_argument('--url', help='running service to test (default: start one on a free port)')
+    parser.add_argument('--data', default='processed_data.parquet', help='parcel table the PINs are drawn from')
+    parser.add_argument('--county', metavar='FIPS', help='draw PINs from this county of the partitioned dataset')
+    parser.add_argument('--connections', type=int, default=32, help='concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run')
+    parser.add_argument('-o', '--output', help='also write the results here as JSON')
+    return parser.parse_args()
+
+
+def main():
+    import pandas as pd
+
+    from county_dataset import read_parcels
+
+    args = parse_args()
+    columns = ['ParcelID', 'Zip']
+    parcels = read_parcels(args.county, columns) if args.county else pd.read_parquet(args.data, columns=columns)
+    pins = parcels['ParcelID'].astype(str).tolist()
+    zips = sorted(int(zip_code) for zip_code in parcels['Zip'].dropna().unique())
+    requests = make_requests(pins, zips, n=20_000)
+
+    server = None
+    if args.url:
+        url = urllib.parse.urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = start_service(args, port)
+    try:
+        latencies, errors = asyncio.run(run_load(host, port, requests, args.connections, args.duration))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    total = sum(len(values) for values in latencies.values())
+    results = {
+        'connections': args.connections,
+        'duration_s': args.duration,
+        'requests': total,
+        'requests_per_s': total / args.duration,
+        'cpu_count': os.cpu_count(),
+        'endpoints': {
+            kind: {
+                'requests': len(values),
+                'errors': errors[kind],
+                'p50_ms': percentile_ms(values, 0.50),
+                'p90_ms': percentile_ms(values, 0.90),
+                'p99_ms': percentile_ms(values, 0.99),
+            }
+            for kind, values in latencies.items()
+        },
+    }
+
+    print(f"{total:,} requests in {args.duration:.0f} s over {args.connections} connections: "
+          f"{results['requests_per_s']:,.0f} requests/s")
+    for kind, stats in results['endpoints'].items():
+        if stats['requests']:
+            print(f"  {kind:<5} {stats['requests']:>8,}  p50 {stats['p50_ms']:6.2f} ms  "
+                  f"p90 {stats['p90_ms']:6.2f} ms  p99 {stats['p99_ms']:6.2f} ms  errors {stats['errors']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# times the preprocess stages and the app's load / lookup / render steps on synthetic data
+# benchmarks/run_benchmarks.py
+#
+#   python benchmarks/run_benchmarks.py                          # 40K, 1M and 5M parcels
+#   python benchmarks/run_benchmarks.py --sizes 40000 --compare benchmarks/results/abc1234.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from instrument import peak_rss_mb
+from shared_data import APP_COLUMNS
+
+SIZES = [40_000, 1_000_000, 5_000_000]
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# PIN lookups timed per size
+LOOKUPS = 1_000
+
+
+class Timings:
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stages.append({
+            'stage': name,
+            'seconds': round(time.perf_counter() - start, 6),
+            'rows': len(result) if hasattr(result, '__len__') and not isinstance(result, (bytes, dict, tuple)) else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        })
+        return result
+
+
+def bench_size(n_parcels, workdir):
+    import numpy as np
+    import pandas as pd
+
+    import plots
+    import preprocess
+    from benchmarks.synthetic import synthetic_extracts
+    from distributions import build_summary
+    from geo_tiers import base_year, build_county_tiers, build_zip_tiers, pick_tolerance
+    from pin_index import PinIndex, build_pin_index
+
+    timings = Timings()
+    base, target = timings.run('generate', synthetic_extracts, n_parcels)
+
+    # preprocess stages
+    base = timings.run('dedupe_base', preprocess.dedupe_extract, base, '2024')
+    target = timings.run('dedupe_target', preprocess.dedupe_extract, target, '2025')
+    merged = timings.run('merge', preprocess.merge_years, base, target, '2024')
+    del base, target
+    filtered = timings.run('filter', preprocess.filter_parcels, merged, '2024')
+    del merged
+    ratios = timings.run('ratios', preprocess.add_ratios, filtered, '2024')
+    del filtered
+    timings.run('zip_medians', preprocess.zip_medians, ratios, preprocess.EXCLUDED_ZIPS, '2024')
+    processed_path = os.path.join(workdir, 'processed_data.parquet')
+    processed = timings.run('write_processed', preprocess.write_processed, ratios, processed_path)
+    del ratios
+    index_dir = os.path.join(workdir, 'pin_index')
+    timings.run('pin_index', build_pin_index, processed, index_dir)
+    summary = timings.run('summary', build_summary, processed)
+    pins = processed['ParcelID'].sample(LOOKUPS, replace=True, random_state=0).tolist()
+    del processed
+
+    # app steps
+    timings.run('app_load_data', pd.read_parquet, processed_path, columns=APP_COLUMNS)
+    index = timings.run('app_load_pin_index', PinIndex.load, index_dir)
+    timings.run(f'app_lookup_x{LOOKUPS}', lambda: [index.lookup(pin) for pin in pins])
+    for column in summary['histograms']:
+        timings.run(f'app_render_{column}', lambda: plots.figure_bytes(
+            plots.trimmed_histogram(summary['histograms'][column], column, marker=1.5)))
+
+    import geopandas as gpd
+    zip_map = gpd.read_parquet(os.path.join(ROOT, 'zip_map.parquet'))
+    zip_tiers = build_zip_tiers(zip_map, base_year(zip_map))
+    tolerance = pick_tolerance(zip_tiers.total_bounds, (7, 10), plots.SAVEFIG_OPTIONS['dpi'])
+    county_tiers = build_county_tiers(gpd.read_parquet(os.path.join(ROOT, 'orange.parquet')), [tolerance])
+    zip_tier = zip_tiers[zip_tiers['tolerance'] == tolerance]
+    timings.run('app_render_zip_map', lambda: plots.figure_bytes(plots.zip_choropleth(
+        zip_tier, county_tiers, 'AvgAppraisalValue', 'Median Appraised Value', '{zip}\n${value:,.0f}')))
+
+    return {
+        'parcels': n_parcels,
+        'stages': timings.stages,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def run_in_subprocess(n_parcels):
+    # a fresh process per size, so peak RSS belongs to that size alone
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--single', str(n_parcels)],
+                            check=True, capture_output=True, text=True, cwd=ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True, capture_output=True,
+                              text=True, cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, baseline_path):
+    # seconds per stage against an earlier results file, slower stages flagged
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r['parcels'], s['stage']): s['seconds'] for r in baseline['results'] for s in r['stages']}
+    print(f"\n{'parcels':>10} {'stage':<48} {'before':>9} {'now':>9} {'ratio':>7}")
+    for result in current['results']:
+        for stage in result['stages']:
+            old = before.get((result['parcels'], stage['stage']))
+            if old is None:
+                continue
+            ratio = stage['seconds'] / old if old else float('inf')
+            flag = '  <- slower' if ratio > 1.2 and stage['seconds'] - old > 0.05 else ''
+            print(f"{result['parcels']:>10,} {stage['stage']:<48} {old:>9.3f} {stage['seconds']:>9.3f} {ratio:>7.2f}{flag}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark preprocess.py and the app on synthetic parcels')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='parcel counts to benchmark')
+    parser.add_argument('-o', '--output', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='earlier results file to compare against')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.single:
+        import matplotlib
+        matplotlib.use('Agg')
+        with tempfile.TemporaryDirectory() as workdir:
+            print(json.dumps(bench_size(args.single, workdir)))
+        return
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': [],
+    }
+    for n_parcels in args.sizes:
+        result = run_in_subprocess(n_parcels)
+        results['results'].append(result)
+        total = sum(stage['seconds'] for stage in result['stages'] if stage['stage'] != 'generate')
+        print(f"{n_parcels:>10,} parcels  {total:8.2f} s  peak {result['peak_rss_mb']:,.0f} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'results written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# resident memory of one app process as concurrent sessions are added, with the parcel
+# table behind st.cache_data (what load_data() used, one unpickled copy per session)
+# and behind the memory mapped shared_data table (one mapping per process)
+# benchmarks/shared_memory.py
+#
+#   python benchmarks/shared_memory.py --data processed_data.parquet
+#   python benchmarks/shared_memory.py --data processed_data.parquet --sessions 1 2 4 8 16 32 --max-growth 1
+#
+# Exits with status 1 when the shared table grows RSS by more than --max-growth MB per
+# session, so it can run as a check.
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from instrument import rss_mb
+
+SESSIONS = [1, 2, 4, 8, 16, 32]
+
+MODES = ['cache_data', 'shared']
+
+
+def run_sessions(mode, path, sessions):
+    # One process, like a Streamlit server: every session calls the cached loader and
+    # keeps the frame it got while it works on it, as a rerun does.
+    import logging
+
+    import pandas as pd
+    import streamlit as st
+
+    from shared_data import APP_COLUMNS, map_shared, shared_frame
+
+    # the caches work without a running server, but say so on every call
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    if mode == 'cache_data':
+        load = st.cache_data(lambda: pd.read_parquet(path, columns=APP_COLUMNS))
+    else:
+        load = st.cache_resource(lambda: shared_frame(map_shared(path)))
+
+    held = []
+    rows = []
+    for count in range(1, max(sessions) + 1):
+        frame = load()
+        # touch every ratio, as the page's statistics would
+        for column in APP_COLUMNS:
+            if column.endswith('_percent'):
+                frame[column].median()
+        held.append(frame)
+        gc.collect()
+        if count in sessions:
+            rows.append({'sessions': count, 'rss_mb': round(rss_mb(), 1)})
+    return rows
+
+
+def growth_per_session(rows):
+    # least squares slope of RSS against the session count, MB per session
+    if len(rows) < 2:
+        return 0.0
+    return float(np.polyfit([row['sessions'] for row in rows], [row['rss_mb'] for row in rows], 1)[0])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='RSS of one process as sessions share or copy the parcel table')
+    parser.add_argument('--data', default='processed_data.parquet', help='processed parcel table')
+    parser.add_argument('--sessions', type=int, nargs='+', default=SESSIONS, help='session counts to measure at')
+    parser.add_argument('--max-growth', type=float, default=1.0,
+                        help='MB of RSS per session the shared table may add before the check fails')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        print(json.dumps(run_sessions(args.worker, args.path, args.sessions)))
+        return
+
+    import pandas as pd
+
+    from shared_data import APP_COLUMNS, write_shared
+
+    if rss_mb() is None:
+        raise SystemExit('RSS is read from /proc, which this platform does not have')
+
+    # each mode in a fresh process, so neither sees the other's allocations
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_path = os.path.join(tmp, 'parcels.arrow')
+        rows = write_shared(pd.read_parquet(args.data, columns=APP_COLUMNS), shared_path).num_rows
+        for mode in MODES:
+            path = os.path.abspath(args.data) if mode == 'cache_data' else shared_path
+            command = [sys.executable, os.path.abspath(__file__), '--worker', mode, '--path', path,
+                       '--sessions', *map(str, args.sessions)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=ROOT).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{rows:,} parcels, RSS in MB')
+    print(f"{'sessions':>8} " + ' '.join(f'{mode:>12}' for mode in MODES))
+    for i, count in enumerate(args.sessions):
+        print(f'{count:>8} ' + ' '.join(f"{results[mode][i]['rss_mb']:>12.1f}" for mode in MODES))
+    growth = {mode: growth_per_session(results[mode]) for mode in MODES}
+    print(f"{'MB/sess':>8} " + ' '.join(f'{growth[mode]:>12.2f}' for mode in MODES))
+
+    if growth['shared'] > args.max_growth:
+        print(f"shared table grows {growth['shared']:.2f} MB per session, more than {args.max_growth} MB")
+        sys.exit(1)
+    print(f"shared table: flat within {args.max_growth} MB per session")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# synthetic county extracts with the same schema as the Real Property "Detailed" extract
+# benchmarks/synthetic.py
+import numpy as np
+import pandas as pd
+
+
+# the Orange County ZIPs, repeated with offsets to stand in for the rest of the state
+ORANGE_ZIPS = [27231, 27243, 27278, 27302, 27510, 27514, 27516, 27517, 27541, 27572, 27583, 27705, 27707, 27712]
+
+BUILDING_TYPES = ['SINGLE FAMILY', 'CONDOMINIUM', 'TOWNHOUSE', 'MANUFACTURED HOME', 'DUPLEX', 'APARTMENT']
+BUILDING_TYPE_SHARES = [0.72, 0.09, 0.08, 0.06, 0.03, 0.02]
+
+# land value multipliers are coarse in the real data ("lumpy"), building multipliers are smooth
+LAND_MULTIPLIERS = [1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 3.0]
+LAND_MULTIPLIER_SHARES = [0.08, 0.22, 0.15, 0.30, 0.10, 0.10, 0.05]
+
+
+def zip_codes(n_parcels):
+    # roughly one ZIP per 3,000 parcels, like Orange County
+    n_zips = max(len(ORANGE_ZIPS), n_parcels // 3_000)
+    extra = 27000 + np.arange(n_zips - len(ORANGE_ZIPS))
+    return np.concatenate([ORANGE_ZIPS, extra[~np.isin(extra, ORANGE_ZIPS)]])[:n_zips]
+
+
+def synthetic_extracts(n_parcels, seed=0, duplicate_share=0.01, exempt_share=0.05, changed_area_share=0.02):
+    # (base, target) extracts for n_parcels parcels; the target is the revaluation year
+    rng = np.random.default_rng(seed)
+    ids = (9_700_000_000 + rng.choice(299_999_999, size=n_parcels, replace=False)).astype(str)
+
+    land = np.round(rng.lognormal(11.5, 0.7, n_parcels), -2)
+    building = np.round(rng.lognormal(12.2, 0.6, n_parcels), -2)
+    building[rng.random(n_parcels) < 0.08] = 0  # land only plots
+    area = rng.integers(600, 6_000, n_parcels)
+    area[building == 0] = 0
+
+    base = pd.DataFrame({
+        'ParcelID': ids,
+        'TotalAppraisedValue': land + building,
+        'TotalAppraisedLandValue': land,
+        'TotalAppraisedBuildingValue': building,
+        'TotalFinishedArea': area.astype('float64'),
+        'LandArea': np.round(rng.gamma(1.5, 0.4, n_parcels), 3),
+        'TotalValueExemption': np.where(rng.random(n_parcels) < exempt_share, land + building, 0.0),
+        'Zip': rng.choice(zip_codes(n_parcels), n_parcels).astype('int32'),
+        'BldgTypeDescription': rng.choice(BUILDING_TYPES, n_parcels, p=BUILDING_TYPE_SHARES),
+        'YearBuilt': rng.integers(1900, 2024, n_parcels).astype('int32'),
+    })
+
+    target = base.copy()
+    target['TotalAppraisedLandValue'] = np.round(land * rng.choice(LAND_MULTIPLIERS, n_parcels, p=LAND_MULTIPLIER_SHARES), -2)
+    target['TotalAppraisedBuildingValue'] = np.round(building * rng.normal(1.43, 0.12, n_parcels), -2)
+    target['TotalAppraisedValue'] = target['TotalAppraisedLandValue'] + target['TotalAppraisedBuildingValue']
+    changed = rng.random(n_parcels) < changed_area_share
+    target.loc[changed, 'TotalFinishedArea'] += 250
+
+    return _with_duplicates(base, duplicate_share, rng), _with_duplicates(target, duplicate_share, rng)
+
+
+def _with_duplicates(df, share, rng):
+    # the real extracts repeat some parcels (one row per building); the copies come after
+    # the original so keep='first' keeps the original
+    copies = df.sample(frac=share, random_state=int(rng.integers(1 << 31)))
+    return pd.concat([df, copies], ignore_index=True)
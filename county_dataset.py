@@ -0,0 +1,128 @@
+# county / ZIP partitioned copy of the preprocess outputs, for serving several counties
+# county_dataset.py
+#
+#   dataset/
+#     counties.json                               county FIPS -> name
+#     parcels/county=37135/Zip=27514/part-0.parquet
+#     zip_map/county=37135/part-0.parquet
+#     artifacts/county=37135/                     PIN index, summary, map tiers, segment cube, ...
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from app_bundle import BUNDLE_PATH
+from distributions import SUMMARY_PATH
+from geo_tiers import COUNTY_TIERS_PATH, ZIP_TIERS_PATH
+from neighbors import NEIGHBOR_DIR
+from pin_index import INDEX_DIR
+from raster_grids import RASTER_PATH
+from segments import SEGMENTS_PATH
+from shared_data import SHARED_PATH
+
+
+DATASET_DIR = 'dataset'
+
+# partition columns of the parcel table, typed so ZIPs read back as integers
+PARTITIONING = ds.partitioning(pa.schema([('county', pa.string()), ('Zip', pa.int32())]), flavor='hive')
+
+
+def _counties_path(root):
+    return os.path.join(root, 'counties.json')
+
+
+def read_counties(root=DATASET_DIR):
+    # {county FIPS: county name} of every county written so far, empty without a dataset
+    path = _counties_path(root)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def artifact_paths(county=None, root=DATASET_DIR):
+    # where each per-county file lives; county=None is the single county layout that
+    # preprocess.py also writes next to app.py
+    if county is None:
+        return {
+            'parcels': 'processed_data.parquet',
+            'zip_map': 'zip_map.parquet',
+            'county': 'orange.parquet',
+            'zip_tiers': ZIP_TIERS_PATH,
+            'county_tiers': COUNTY_TIERS_PATH,
+            'summary': SUMMARY_PATH,
+            'pin_index': INDEX_DIR,
+            'neighbors': NEIGHBOR_DIR,
+            'segments': SEGMENTS_PATH,
+            'rasters': RASTER_PATH,
+            'shared': SHARED_PATH,
+            'bundle': BUNDLE_PATH,
+        }
+    artifacts = os.path.join(root, 'artifacts', f'county={county}')
+    return {
+        'parcels': os.path.join(root, 'parcels'),
+        'zip_map': os.path.join(root, 'zip_map', f'county={county}', 'part-0.parquet'),
+        'county': os.path.join(artifacts, 'county.parquet'),
+        'zip_tiers': os.path.join(artifacts, 'zip_map_tiers.parquet'),
+        'county_tiers': os.path.join(artifacts, 'county_tiers.parquet'),
+        'summary': os.path.join(artifacts, 'summary.json'),
+        'pin_index': os.path.join(artifacts, 'pin_index'),
+        'neighbors': os.path.join(artifacts, 'neighbors'),
+        'segments': os.path.join(artifacts, 'segment_cube.parquet'),
+        'rasters': os.path.join(artifacts, 'raster_grids.parquet'),
+        'shared': os.path.join(artifacts, 'parcels.arrow'),
+        'bundle': os.path.join(artifacts, 'app_bundle.bin'),
+    }
+
+
+def write_parcels(df, county, root=DATASET_DIR):
+    # replaces this county's partitions (including ZIPs that no longer appear), the
+    # other counties are left alone
+    parcels = os.path.join(root, 'parcels')
+    shutil.rmtree(os.path.join(parcels, f'county={county}'), ignore_errors=True)
+    table = pa.Table.from_pandas(df.assign(county=county), preserve_index=False)
+    ds.write_dataset(
+        table, parcels, format='parquet', partitioning=PARTITIONING,
+        existing_data_behavior='overwrite_or_ignore', basename_template='part-{i}.parquet',
+    )
+
+
+def read_parcels(county=None, columns=None, root=DATASET_DIR):
+    # The county filter is applied to the directory names, so only that county's
+    # files are opened, and only the requested columns are read from them.
+    path = artifact_paths(county, root)['parcels']
+    if county is None:
+        return ds.dataset(path).to_table(columns=columns).to_pandas()
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    return dataset.to_table(columns=columns, filter=ds.field('county') == county).to_pandas()
+
+
+def register_county(county, name, root=DATASET_DIR):
+    counties = read_counties(root)
+    counties[county] = name
+    os.makedirs(root, exist_ok=True)
+    with open(_counties_path(root), 'w') as f:
+        json.dump(dict(sorted(counties.items())), f, indent=1)
+
+
+def publish_county(county, name, root=DATASET_DIR):
+    # copies the single county layout written by preprocess.py into this county's
+    # place in the dataset (the parcel table is written by write_parcels)
+    source, target = artifact_paths(None), artifact_paths(county, root)
+    for key in source:
+        if key == 'parcels':
+            continue
+        if os.path.isdir(target[key]):
+            shutil.rmtree(target[key])
+        elif os.path.exists(target[key]):
+            os.remove(target[key])
+        if not os.path.exists(source[key]):
+            continue
+        os.makedirs(os.path.dirname(target[key]), exist_ok=True)
+        if os.path.isdir(source[key]):
+            shutil.copytree(source[key], target[key])
+        else:
+            shutil.copyfile(source[key], target[key])
+    register_county(county, name, root)
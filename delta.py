@@ -0,0 +1,49 @@
+# row hashes and ParcelID diffs between two builds of the same extract, for
+# patching the preprocess outputs instead of rebuilding them
+# delta.py
+import pandas as pd
+
+
+def row_hashes(df, columns):
+    # one 64-bit hash per row over `columns`, indexed by ParcelID (the key, not hashed).
+    # Numbers are hashed as float64 and everything else as strings, so a column read back
+    # as Int32 in one build and float64 in another still hashes the same; the strings are
+    # categorized first so each distinct value is hashed once.
+    canonical = pd.DataFrame({
+        column: df[column].astype('float64') if pd.api.types.is_numeric_dtype(df[column])
+        else df[column].astype('string').astype('category')
+        for column in columns if column != 'ParcelID'
+    })
+    return pd.Series(pd.util.hash_pandas_object(canonical, index=False).to_numpy(), index=df['ParcelID'].to_numpy())
+
+
+def diff_extract(old, new, columns):
+    # ParcelIDs inserted, updated (any hashed column changed) and removed between two
+    # deduplicated copies of one year's extract
+    old_hashes = row_hashes(old, columns)
+    new_hashes = row_hashes(new, columns)
+    both = old_hashes.index.intersection(new_hashes.index)
+    return {
+        'inserted': new_hashes.index.difference(old_hashes.index),
+        'updated': both[old_hashes[both].to_numpy() != new_hashes[both].to_numpy()],
+        'removed': old_hashes.index.difference(new_hashes.index),
+    }
+
+
+def changed_ids(diff):
+    return diff['inserted'].union(diff['updated']).union(diff['removed'])
+
+
+def patch_rows(table, changed, rows):
+    # the table without the changed parcels, plus their recomputed rows; parcels that no
+    # longer pass the filters simply aren't in `rows`
+    kept = table[~table['ParcelID'].isin(changed)]
+    # categoricals would turn into object columns on a mixed concat anyway
+    kept = kept.astype({column: 'object' for column in kept.columns if isinstance(kept[column].dtype, pd.CategoricalDtype)})
+    return pd.concat([kept, rows[kept.columns]], ignore_index=True)
+
+
+def affected_zips(table, changed, rows):
+    # ZIPs whose median can have moved: where the changed parcels were and where they are now
+    before = table.loc[table['ParcelID'].isin(changed), 'Zip']
+    return sorted({int(zip_code) for zip_code in pd.concat([before, rows['Zip']]).dropna()})
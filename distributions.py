@@ -0,0 +1,71 @@
+# precomputed summary statistics and histograms for the page
+# distributions.py
+import json
+
+import numpy as np
+
+
+SUMMARY_PATH = 'summary.json'
+
+# columns shown in the two summary tables
+TABLE_COLUMNS = [
+    'TotalAppraisedValue_percent',
+    'TotalAppraisedValue',
+    'TotalAppraisedLandValue_percent',
+    'TotalAppraisedBuildingValue_percent',
+]
+
+# ratio columns drawn as trimmed histograms
+HISTOGRAM_COLUMNS = [
+    'TotalAppraisedValue_percent',
+    'TotalAppraisedBuildingValue_percent',
+    'TotalAppraisedLandValue_percent',
+]
+
+# share trimmed off each end before binning, and the number of bins
+TRIM = (0.01, 0.99)
+BINS = 100
+
+
+def summary_stats(values):
+    # the four statistics shown in the tables
+    values = values.dropna().astype('float64')
+    return {
+        'Mean': float(values.mean()),
+        '25th Percentile': float(values.quantile(0.25)),
+        'Median': float(values.median()),
+        '75th Percentile': float(values.quantile(0.75)),
+    }
+
+
+def trimmed_histogram(values, trim=TRIM, bins=BINS):
+    # same bins Series.hist(bins=100) draws for the values inside the trim bounds
+    values = values.dropna().astype('float64')
+    lower = float(values.quantile(trim[0]))
+    upper = float(values.quantile(trim[1]))
+    kept = values[(values >= lower) & (values <= upper)].to_numpy()
+    counts, edges = np.histogram(kept, bins=bins)
+    return {
+        'lower': lower,
+        'upper': upper,
+        'counts': counts.tolist(),
+        'edges': edges.tolist(),
+    }
+
+
+def build_summary(df):
+    return {
+        'rows': int(len(df)),
+        'stats': {column: summary_stats(df[column]) for column in TABLE_COLUMNS},
+        'histograms': {column: trimmed_histogram(df[column]) for column in HISTOGRAM_COLUMNS},
+    }
+
+
+def write_summary(summary, path=SUMMARY_PATH):
+    with open(path, 'w') as f:
+        json.dump(summary, f)
+
+
+def load_summary(path=SUMMARY_PATH):
+    with open(path) as f:
+        return json.load(f)
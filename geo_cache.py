@@ -0,0 +1,49 @@
+# local, versioned copies of downloaded geometry
+# geo_cache.py
+import datetime
+import hashlib
+import json
+import os
+import urllib.request
+
+
+CACHE_DIR = 'cache/geo'
+MANIFEST = 'manifest.json'
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def cached_download(url, cache_dir=CACHE_DIR, refresh=False):
+    # Each download is stored under its content hash and recorded in the manifest, so
+    # later runs work offline and a refreshed file never overwrites an older version.
+    manifest = _read_manifest(cache_dir)
+    entry = manifest.get(url)
+    if entry and not refresh and os.path.exists(entry['path']):
+        return entry['path']
+
+    with urllib.request.urlopen(url) as response:
+        content = response.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+    stem, ext = os.path.splitext(os.path.basename(url))
+    path = os.path.join(cache_dir, f'{stem}.{sha256[:12]}{ext}')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+
+    manifest[url] = {
+        'path': path,
+        'sha256': sha256,
+        'fetched': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(cache_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return path
@@ -0,0 +1,117 @@
+# pre-projected, simplified geometry for the ZIP maps
+# geo_tiers.py
+#
+# geopandas is imported where geometry is built or read, not for the tier metadata
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+ZIP_TIERS_PATH = 'zip_map_tiers.parquet'
+COUNTY_TIERS_PATH = 'orange_tiers.parquet'
+
+# web mercator, the CRS the maps are drawn in
+MAP_CRS = 3857
+
+# simplification tolerances in metres; 0 keeps the full resolution outline
+TOLERANCES = [0, 20, 80, 320]
+
+
+def _simplify(geometry, tolerance):
+    if tolerance == 0:
+        return geometry
+    return geometry.simplify(tolerance, preserve_topology=True)
+
+
+def base_year(zip_map):
+    # the base year of the comparison a ZIP map was built for, from its AvgAppraisalValue_<base> column
+    return next(column.split('_', 1)[1] for column in zip_map.columns if column.startswith('AvgAppraisalValue_'))
+
+
+def build_zip_tiers(zip_map, base, tolerances=TOLERANCES):
+    # one copy of every ZIP per tolerance, with its outline and a label point that is
+    # guaranteed to fall inside the polygon (unlike the centroid)
+    import geopandas as gpd
+
+    zip_map = zip_map.to_crs(epsg=MAP_CRS)
+    labels = zip_map.geometry.representative_point()
+    base_values = zip_map[f'AvgAppraisalValue_{base}']
+    values = pd.DataFrame({
+        'ZIP': zip_map['ZIP'].to_numpy(),
+        'AvgAppraisalValue': zip_map['AvgAppraisalValue'].to_numpy(),
+        f'AvgAppraisalValue_{base}': base_values.to_numpy(),
+        'AppraisalValueChange': (zip_map['AvgAppraisalValue'] / base_values - 1).to_numpy(),
+        'label_x': labels.x.to_numpy(),
+        'label_y': labels.y.to_numpy(),
+    })
+
+    tiers = []
+    for tolerance in tolerances:
+        geometry = _simplify(zip_map.geometry, tolerance)
+        tier = gpd.GeoDataFrame(values.assign(tolerance=tolerance), geometry=geometry.to_numpy(), crs=zip_map.crs)
+        tier['boundary'] = gpd.GeoSeries(geometry.boundary.to_numpy(), crs=zip_map.crs)
+        tiers.append(tier)
+    return gpd.GeoDataFrame(pd.concat(tiers, ignore_index=True), geometry='geometry', crs=zip_map.crs)
+
+
+def build_county_tiers(county, tolerances=TOLERANCES):
+    # county outline only, as lines
+    import geopandas as gpd
+
+    county = county.to_crs(epsg=MAP_CRS)
+    tiers = []
+    for tolerance in tolerances:
+        geometry = _simplify(county.geometry, tolerance).boundary
+        tiers.append(gpd.GeoDataFrame({'tolerance': tolerance}, geometry=geometry.to_numpy(), crs=county.crs,
+                                      index=range(len(county))))
+    return gpd.GeoDataFrame(pd.concat(tiers, ignore_index=True), geometry='geometry', crs=county.crs)
+
+
+def write_tiers(tiers, path):
+    tiers.to_parquet(path, index=False)
+
+
+def tier_bounds(path):
+    # extent of the layer, read from the GeoParquet metadata without loading geometry
+    geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+    return geo['columns'][geo['primary_column']]['bbox']
+
+
+def tier_tolerances(path):
+    return sorted(pq.read_table(path, columns=['tolerance']).column('tolerance').unique().to_pylist())
+
+
+def pick_tolerance(bounds, figsize, dpi, tolerances=TOLERANCES):
+    # coarsest tier whose tolerance is still under one output pixel
+    minx, miny, maxx, maxy = bounds
+    pixel = max((maxx - minx) / (figsize[0] * dpi), (maxy - miny) / (figsize[1] * dpi))
+    usable = [tolerance for tolerance in tolerances if tolerance <= pixel]
+    return max(usable) if usable else min(tolerances)
+
+
+def read_tier(path, tolerance):
+    import geopandas as gpd
+
+    return gpd.read_parquet(path, filters=[('tolerance', '=', tolerance)])
+
+
+def tier_layers(zip_tiers, county_tiers, figsize, dpi):
+    # zip_tiers / county_tiers: tier files, as paths or open files (app_bundle sections)
+    tolerance = pick_tolerance(tier_bounds(zip_tiers), figsize, dpi, tier_tolerances(zip_tiers))
+    return read_tier(zip_tiers, tolerance), read_tier(county_tiers, tolerance)
+
+
+def map_layers(paths, figsize, dpi):
+    # ZIP and county layers for one map: the coarsest tier that still resolves one output
+    # pixel, or the raw layers (paths['zip_map'], paths['county']) when the tiers haven't been built
+    import geopandas as gpd
+
+    if os.path.exists(paths['zip_tiers']) and os.path.exists(paths['county_tiers']):
+        return tier_layers(paths['zip_tiers'], paths['county_tiers'], figsize, dpi)
+    zip_map = gpd.read_parquet(paths['zip_map'])
+    zip_tiers = build_zip_tiers(zip_map, base_year(zip_map))
+    tolerance = pick_tolerance(zip_tiers.total_bounds, figsize, dpi)
+    county_tiers = build_county_tiers(gpd.read_parquet(paths['county']), [tolerance])
+    return zip_tiers[zip_tiers['tolerance'] == tolerance], county_tiers
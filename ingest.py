@@ -0,0 +1,174 @@
+# streaming ingestion of the county Real Property Excel extracts
+# ingest.py
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from stage_cache import file_hash
+
+
+# where the typed columnar copies of each workbook are kept
+CACHE_DIR = 'cache/extracts'
+
+# number of spreadsheet rows held in memory before they are flushed to the cache
+BATCH_ROWS = 50_000
+
+# columns kept from each extract, and the type they are stored as in the cache
+EXTRACT_COLUMNS = {
+    'ParcelID': pa.string(),
+    'TotalAppraisedValue': pa.float64(),
+    'TotalAppraisedLandValue': pa.float64(),
+    'TotalAppraisedBuildingValue': pa.float64(),
+    'TotalFinishedArea': pa.float64(),
+    'LandArea': pa.float64(),
+    'TotalValueExemption': pa.float64(),
+    'Zip': pa.int32(),
+    'BldgTypeDescription': pa.string(),
+    'YearBuilt': pa.int32(),
+}
+
+# columns every extract must have, the rest are kept only when present
+REQUIRED_COLUMNS = [
+    'ParcelID',
+    'TotalAppraisedValue',
+    'TotalAppraisedLandValue',
+    'TotalAppraisedBuildingValue',
+    'TotalFinishedArea',
+    'LandArea',
+    'TotalValueExemption',
+    'Zip',
+]
+
+
+def _to_float(value):
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, (int, bool)):
+        return float(value)
+    value = str(value).replace(',', '').replace('$', '').strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _to_int(value):
+    value = _to_float(value)
+    if value is None or value != value:
+        return None
+    return int(value)
+
+
+def _to_str(value):
+    if value is None:
+        return None
+    # PINs typed in as numbers come back from Excel as floats (e.g. 9788123456.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _to_zip(value):
+    # ZIP+4 values ("27514-1234") keep only the five digit ZIP
+    if isinstance(value, str):
+        value = value.strip()[:5]
+    return _to_int(value)
+
+
+_CONVERTERS = {
+    'ParcelID': _to_str,
+    'Zip': _to_zip,
+}
+
+
+def _converter(column, dtype):
+    if column in _CONVERTERS:
+        return _CONVERTERS[column]
+    if pa.types.is_floating(dtype):
+        return _to_float
+    if pa.types.is_integer(dtype):
+        return _to_int
+    return _to_str
+
+
+def cache_path(xlsx_path, source_hash, cache_dir=CACHE_DIR):
+    # named after the workbook's contents, so extracts with the same file name in
+    # different folders get a cache each; the stem only makes the folder readable
+    stem = os.path.splitext(os.path.basename(xlsx_path))[0]
+    return os.path.join(cache_dir, f'{stem}-{source_hash[:16]}.parquet')
+
+
+def _cache_is_fresh(path, source_hash, columns):
+    if not os.path.exists(path):
+        return False
+    metadata = pq.read_schema(path).metadata or {}
+    return (metadata.get(b'oc_source_sha256', b'').decode() == source_hash and
+            metadata.get(b'oc_columns', b'').decode() == ','.join(columns))
+
+
+def stream_workbook(xlsx_path, out_path, columns=EXTRACT_COLUMNS, batch_rows=BATCH_ROWS, source_hash=None):
+    # openpyxl's read-only mode hands back one row at a time instead of building the
+    # whole sheet, so only the projected columns of one batch are ever held in memory
+    from openpyxl import load_workbook
+
+    wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+    writer = None
+    # per process, so two workers caching the same workbook don't write one file
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(rows)]
+
+        missing = [name for name in REQUIRED_COLUMNS if name in columns and name not in header]
+        if missing:
+            raise ValueError(f'{xlsx_path} is missing required columns: {missing}')
+
+        kept = [name for name in columns if name in header]
+        positions = [header.index(name) for name in kept]
+        converters = [_converter(name, columns[name]) for name in kept]
+        schema = pa.schema([(name, columns[name]) for name in kept],
+                           metadata={'oc_columns': ','.join(columns), 'oc_source': os.path.basename(xlsx_path),
+                                     'oc_source_sha256': source_hash or file_hash(xlsx_path)})
+
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+        writer = pq.ParquetWriter(tmp_path, schema)
+        batch = [[] for _ in kept]
+
+        def flush():
+            arrays = [pa.array(values, type=field.type) for values, field in zip(batch, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            for values in batch:
+                values.clear()
+
+        for row in rows:
+            if row is None or all(cell is None for cell in row):
+                continue
+            for values, position, convert in zip(batch, positions, converters):
+                values.append(convert(row[position]) if position < len(row) else None)
+            if len(batch[0]) >= batch_rows:
+                flush()
+        if batch[0]:
+            flush()
+    finally:
+        wb.close()
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def extract_cache(xlsx_path, columns=EXTRACT_COLUMNS, cache_dir=CACHE_DIR):
+    # parse the workbook once, every later run reads the parquet copy instead
+    source_hash = file_hash(xlsx_path)
+    path = cache_path(xlsx_path, source_hash, cache_dir)
+    if not _cache_is_fresh(path, source_hash, list(columns)):
+        stream_workbook(xlsx_path, path, columns, source_hash=source_hash)
+    return path
+
+
+def read_extract(xlsx_path, columns=EXTRACT_COLUMNS, cache_dir=CACHE_DIR):
+    return pd.read_parquet(extract_cache(xlsx_path, columns, cache_dir))
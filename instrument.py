@@ -0,0 +1,190 @@
+# opt-in stage instrumentation: wall time, CPU time, peak RSS (or RSS change) and row counts per named stage
+# instrument.py
+import collections
+import contextlib
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# set to a file path to turn instrumentation on; preprocess.py writes one JSON document
+# there, app.py appends one JSON line per rerun
+PROFILE_ENV = 'PROPERTY_TAX_PROFILE'
+
+# runs kept per kind for the app's debug panel
+RECENT_RUNS = 50
+
+_append_lock = threading.Lock()
+
+
+def peak_rss_mb(who=None):
+    # high-water resident memory of this process (or of its largest reaped child);
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def rss_mb(pid=None):
+    # current resident memory of this process (or of pid), from /proc; None where
+    # there is no /proc (macOS, Windows)
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def cpu_s(pid=None):
+    # user + system CPU seconds of this process (or of pid) so far, all threads, from
+    # /proc; None where there is no /proc
+    try:
+        with open(f"/proc/{pid or 'self'}/stat") as f:
+            # fields after the command name, which may hold spaces; utime and stime are 14 and 15
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _children_cpu():
+    # CPU seconds of finished worker processes, e.g. the extract workers
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler:
+    # Collects one record per stage block. When disabled the blocks still run but
+    # nothing is measured, so the instrumented code doesn't need a second path.
+    #
+    #   with profiler.stage('merge') as stage:
+    #       df = merge(...)
+    #       stage['rows'] = len(df)
+    #
+    # threaded is for runs that share the process with others, like the sessions of a
+    # Streamlit server: CPU is the calling thread's, and memory is the change in RSS
+    # over the stage instead of the process's lifetime peak, which would be the same
+    # for every stage.
+
+    def __init__(self, enabled=True, label=None, threaded=False):
+        self.enabled = enabled
+        self.label = label
+        self.threaded = threaded
+        self.started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name, **extra):
+        if not self.enabled:
+            yield {}
+            return
+        record = {'stage': name, 'rows': None, **extra}
+        if self.threaded:
+            with self._thread_stage(record):
+                yield record
+            return
+        wall, cpu, children = time.perf_counter(), time.process_time(), _children_cpu()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(time.process_time() - cpu, 6)
+            worker_cpu = _children_cpu() - children
+            if worker_cpu:
+                record['worker_cpu_s'] = round(worker_cpu, 6)
+                record['worker_peak_rss_mb'] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+            peak = peak_rss_mb()
+            record['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+            self.stages.append(record)
+
+    @contextlib.contextmanager
+    def _thread_stage(self, record):
+        # other threads allocate meanwhile too, so the RSS change is only this stage's
+        # when the process is otherwise idle; it still shows which stages allocate
+        wall, cpu, rss = time.perf_counter(), time.thread_time(), rss_mb()
+        try:
+            yield
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(time.thread_time() - cpu, 6)
+            after = rss_mb()
+            record['rss_mb'] = round(after, 1) if after is not None else None
+            record['rss_delta_mb'] = round(after - rss, 1) if after is not None else None
+            self.stages.append(record)
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'started': self.started,
+            'pid': os.getpid(),
+            'wall_s': round(sum(stage['wall_s'] for stage in self.stages), 6),
+            'stages': self.stages,
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def append(self, path):
+        # one JSON line per run; app sessions share the file, so writes are serialized
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        line = json.dumps(self.to_dict())
+        with _append_lock, open(path, 'a') as f:
+            f.write(line + '\n')
+
+
+class StageStats:
+    # per-stage totals across runs, shared by every session of a process
+
+    def __init__(self, recent=RECENT_RUNS):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.runs = collections.defaultdict(lambda: collections.deque(maxlen=recent))
+
+    def add(self, profiler):
+        with self.lock:
+            self.runs[profiler.label].append(profiler.to_dict())
+            for stage in profiler.stages:
+                key = (profiler.label, stage['stage'])
+                total = self.totals.setdefault(key, {'runs': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'max_wall_s': 0.0,
+                                                     'rss_delta_mb': 0.0})
+                total['runs'] += 1
+                total['wall_s'] += stage['wall_s']
+                total['cpu_s'] += stage['cpu_s']
+                total['max_wall_s'] = max(total['max_wall_s'], stage['wall_s'])
+                total['last_rows'] = stage['rows']
+                total['rss_delta_mb'] += stage.get('rss_delta_mb') or 0.0
+                total['rss_mb'] = stage.get('rss_mb', stage.get('peak_rss_mb'))
+
+    def table(self):
+        # one row per (run kind, stage): run count, mean and max wall time, mean CPU time
+        # and RSS change, and the RSS after the last run
+        with self.lock:
+            return [{
+                'run': label,
+                'stage': name,
+                'runs': total['runs'],
+                'mean_wall_ms': 1000 * total['wall_s'] / total['runs'],
+                'max_wall_ms': 1000 * total['max_wall_s'],
+                'mean_cpu_ms': 1000 * total['cpu_s'] / total['runs'],
+                'last_rows': total['last_rows'],
+                'mean_rss_delta_mb': total['rss_delta_mb'] / total['runs'],
+                'rss_mb': total['rss_mb'],
+            } for (label, name), total in self.totals.items()]
+
+    def recent(self, label):
+        with self.lock:
+            return list(self.runs[label])
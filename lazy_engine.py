@@ -0,0 +1,213 @@
+# out-of-core engine for the extract, merge, filter and ratio stages
+# lazy_engine.py
+#
+# Each stage is one DuckDB query over the parquet caches, written straight back to
+# parquet. DuckDB plans the whole query before running it (projection and filter
+# pushdown into the scans, the left join plus equality filters planned as an inner
+# join) and spills sorts, aggregates and joins to TEMP_DIR once MEMORY_LIMIT is reached,
+# so peak memory stays flat however large the extracts are.
+#
+# That covers the extracts, the long table, the ratios, the ZIP medians and the write
+# of processed_data.parquet. The artifacts built from processed_data.parquet (PIN and
+# neighbor indexes, grids, summary, app bundle, dataset) and the parcel layer's
+# centroids are still built in memory, from the compacted table.
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ingest import EXTRACT_COLUMNS, extract_cache
+
+
+# memory DuckDB may use before spilling to disk
+MEMORY_LIMIT = '2GB'
+TEMP_DIR = 'cache/duckdb'
+
+# parquet row group size of the files written here
+ROW_GROUP_SIZE = 122_880
+
+# largest magnitude stored as Int32 by write_processed_table, as in compact_dtypes
+INT32_LIMIT = 2**31
+
+# DuckDB column types read back as numbers
+FLOAT_TYPES = {'FLOAT', 'DOUBLE'}
+INTEGER_TYPES = {'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT'}
+
+# the values add_ratios turns into change ratios
+RATIO_VALUES = ['TotalAppraisedValue', 'TotalAppraisedLandValue', 'TotalAppraisedBuildingValue']
+
+
+def connect(memory_limit=None, temp_dir=None):
+    import duckdb
+
+    memory_limit = memory_limit or MEMORY_LIMIT
+    temp_dir = temp_dir or TEMP_DIR
+    os.makedirs(temp_dir, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET temp_directory = {_literal(temp_dir)}")
+    # row order is set by the ORDER BY of each query, so the scans don't need to keep it
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _name(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _copy(con, query, out_path):
+    con.execute(f"COPY ({query}) TO {_literal(out_path)} (FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_SIZE})")
+
+
+def write_deduped_extract(xlsx_path, year, out_path, columns=EXTRACT_COLUMNS):
+    # same as preprocess.normalize_extract: the first row of each ParcelID in workbook
+    # order, with the Year label in front. The first rows are found with a grouped min,
+    # which spills to disk, rather than a window over every row, which doesn't.
+    rows = f"read_parquet({_literal(extract_cache(xlsx_path, columns))}, file_row_number = true)"
+    con = connect()
+    _copy(con, f"""
+        SELECT {_literal(year)} AS Year, e.* EXCLUDE (file_row_number)
+        FROM {rows} AS e
+        SEMI JOIN (SELECT min(file_row_number) AS first_row FROM {rows} GROUP BY ParcelID) AS f
+            ON e.file_row_number = f.first_row
+        ORDER BY e.file_row_number
+    """, out_path)
+    return out_path
+
+
+def write_long_table(*paths, out_path):
+    # same as preprocess.build_long_table: the extracts stacked in order, missing
+    # columns filled with NULL. Each extract is streamed into the file in turn, from a
+    # scan of its own file (which keeps its order, where a UNION ALL doesn't), instead
+    # of sorting every row of every year, which ran out of memory under a tight limit.
+    con = connect()
+    con.execute("SET preserve_insertion_order = true")
+    union = ' UNION ALL BY NAME '.join(f"SELECT * FROM read_parquet({_literal(path)})" for path in paths)
+    columns = con.execute(f"DESCRIBE {union}").fetchall()
+    schema = con.execute(f"SELECT * FROM ({union}) LIMIT 0").fetch_record_batch().schema
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for path in paths:
+            present = set(pq.read_schema(path).names)
+            select = ', '.join(f"CAST({_name(name) if name in present else 'NULL'} AS {kind}) AS {_name(name)}"
+                               for name, kind, *_ in columns)
+            reader = con.execute(f"SELECT {select} FROM read_parquet({_literal(path)})").fetch_record_batch(ROW_GROUP_SIZE)
+            for batch in reader:
+                writer.write_batch(batch, row_group_size=ROW_GROUP_SIZE)
+    return out_path
+
+
+def write_ratios(base_path, target_path, out_path, base, base_columns):
+    # merge_years, filter_parcels and add_ratios as one query, with the same columns in
+    # the same order and rows in base extract order
+    target_columns = [name for name in pq.read_schema(target_path).names if name not in ('Year', 'ParcelID')]
+    columns = ['b.ParcelID']
+    columns += [f"b.{_name(column)} AS {_name(f'{column}_{base}')}" for column in base_columns]
+    columns += [f"t.{_name(column)}" for column in target_columns]
+    columns += [f"CASE WHEN b.{value} > 1 THEN t.{value} / b.{value} END AS {value}_percent" for value in RATIO_VALUES]
+    # building share of the new total; a zero total gives NULL here, inf in pandas
+    columns += ["CASE WHEN b.TotalAppraisedBuildingValue > 1 "
+                "THEN t.TotalAppraisedBuildingValue / t.TotalAppraisedValue END AS Percent_TotalAppraisedValue_from_building"]
+
+    con = connect()
+    _copy(con, f"""
+        SELECT {', '.join(columns)}
+        FROM read_parquet({_literal(base_path)}, file_row_number = true) AS b
+        LEFT JOIN (
+            SELECT * FROM read_parquet({_literal(target_path)}) WHERE TotalValueExemption = 0
+        ) AS t ON b.ParcelID = t.ParcelID
+        WHERE b.LandArea = t.LandArea
+          AND b.TotalFinishedArea = t.TotalFinishedArea
+          AND b.TotalAppraisedValue > 1
+          AND b.TotalAppraisedLandValue > 1
+          AND b.TotalAppraisedBuildingValue > 1
+        ORDER BY b.file_row_number
+    """, out_path)
+    return out_path
+
+
+def write_zip_medians(ratios_path, out_path, excluded_zips, base):
+    # same as preprocess.zip_medians
+    excluded = f"AND Zip NOT IN ({', '.join(str(int(zip_code)) for zip_code in excluded_zips)})" if excluded_zips else ''
+    con = connect()
+    _copy(con, f"""
+        SELECT CAST(Zip AS BIGINT) AS ZIP,
+               median(TotalAppraisedValue) AS AvgAppraisalValue,
+               median({_name(f'TotalAppraisedValue_{base}')}) AS {_name(f'AvgAppraisalValue_{base}')}
+        FROM read_parquet({_literal(ratios_path)})
+        WHERE Zip IS NOT NULL {excluded}
+        GROUP BY Zip
+        ORDER BY Zip
+    """, out_path)
+    return out_path
+
+
+def _compact_types(con, source, columns, category_columns):
+    # the dtype preprocess.compact_dtypes gives each column of `source`: float32 ratios,
+    # Int32 where every present value is a whole number that fits, float64 otherwise.
+    # Integer columns too, as the pandas engine's left join turns them into floats.
+    numeric = [name for name, kind in columns if kind in FLOAT_TYPES | INTEGER_TYPES
+               and name not in category_columns and not name.endswith('_percent') and not name.startswith('Percent_')]
+    stats = {}
+    if numeric:
+        aggregates = []
+        for name in numeric:
+            value = f"CAST({_name(name)} AS DOUBLE)"
+            present = f"FILTER (WHERE {_name(name)} IS NOT NULL AND NOT isnan({value}))"
+            aggregates += [f"count(*) {present}", f"bool_and({value} = floor({value})) {present}", f"max(abs({value})) {present}"]
+        row = con.execute(f"SELECT {', '.join(aggregates)} FROM {source} AS s").fetchone()
+        stats = {name: row[3 * i:3 * i + 3] for i, name in enumerate(numeric)}
+
+    types = {}
+    for name, kind in columns:
+        if name in category_columns:
+            types[name] = 'category'
+        elif name.endswith('_percent') or name.startswith('Percent_'):
+            types[name] = 'float32'
+        elif name in stats:
+            present, whole, largest = stats[name]
+            types[name] = 'Int32' if present and whole and largest < INT32_LIMIT else 'float64'
+    return types
+
+
+def write_processed_table(ratios_path, out_path, centroids_path=None, category_columns=(), row_group_size=ROW_GROUP_SIZE):
+    # same as preprocess.write_processed, after attach_centroids when centroids_path is
+    # given: the compact dtypes, sorted by ParcelID. DuckDB sorts (spilling as needed)
+    # and the rows are streamed into the file a batch at a time, typed and described
+    # the way pandas writes them, so reading the file back gives the same frame.
+    import pandas as pd
+
+    source = f"read_parquet({_literal(ratios_path)})"
+    if centroids_path:
+        source = f"(SELECT r.*, c.x, c.y FROM {source} AS r LEFT JOIN read_parquet({_literal(centroids_path)}) AS c USING (ParcelID))"
+    con = connect()
+    columns = [(name, kind) for name, kind, *_ in con.execute(f"DESCRIBE SELECT * FROM {source} AS s").fetchall()]
+    types = _compact_types(con, source, columns, category_columns)
+
+    casts = {'float32': 'FLOAT', 'Int32': 'INTEGER', 'float64': 'DOUBLE'}
+    select = ', '.join(f"CAST({_name(name)} AS {casts[types[name]]}) AS {_name(name)}" if types.get(name) in casts else _name(name)
+                       for name, kind in columns)
+    # categories sorted, as astype('category') sorts them
+    dictionaries = {name: con.execute(f"SELECT DISTINCT {_name(name)} FROM {source} AS s WHERE {_name(name)} IS NOT NULL "
+                                      f"ORDER BY 1").fetch_arrow_table().column(0).combine_chunks()
+                    for name, kind in columns if types.get(name) == 'category'}
+
+    reader = con.execute(f"SELECT {select} FROM {source} AS s ORDER BY ParcelID").fetch_record_batch(row_group_size)
+    fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type)) if field.name in dictionaries else field
+              for field in reader.schema]
+    empty = reader.schema.empty_table().to_pandas()
+    for name, kind in types.items():
+        empty[name] = empty[name].astype(pd.CategoricalDtype(dictionaries[name].to_pylist()) if kind == 'category' else kind)
+    schema = pa.schema(fields, metadata=pa.Schema.from_pandas(empty, preserve_index=False).metadata)
+
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for batch in reader:
+            arrays = [pa.DictionaryArray.from_arrays(pc.index_in(column, value_set=dictionaries[name]).cast(pa.int32()),
+                                                     dictionaries[name]) if name in dictionaries else column
+                      for name, column in zip(batch.schema.names, batch.columns)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema), row_group_size=row_group_size)
+    return out_path
@@ -0,0 +1,156 @@
+# JSON lookup service: the PIN comparison from app.py for other tools
+# lookup_service.py
+#
+#   python lookup_service.py --port 8000
+#   curl localhost:8000/pin/9788123456
+#   curl -d '{"pins": ["9788123456", "9788000001"]}' localhost:8000/pins
+#   curl localhost:8000/zip/27514
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from batch_compare import PARCEL_COLUMNS, PROCESSED_PATH, parcel_ranks
+from county_dataset import read_parcels
+from pin_index import RATIO_COLUMNS, VALUE_COLUMNS, PinIndex
+
+
+# quantiles of each ratio reported per ZIP
+ZIP_QUANTILES = {'p25': 0.25, 'median': 0.5, 'p75': 0.75}
+
+# most PINs accepted by one batch request
+MAX_BATCH = 10_000
+
+
+def _json(payload, status=200):
+    return Response(json.dumps(payload, separators=(',', ':')), status_code=status, media_type='application/json')
+
+
+def _clean(values):
+    # NaN isn't valid JSON
+    return [None if value != value else value for value in values]
+
+
+def zip_summaries(parcels):
+    # per ZIP: parcel count, median current values and the quartiles of each ratio
+    by_zip = parcels.groupby('Zip', observed=True)
+    counts = by_zip.size()
+    values = by_zip[VALUE_COLUMNS].median()
+    quantiles = by_zip[RATIO_COLUMNS].quantile(list(ZIP_QUANTILES.values()))
+    summaries = {}
+    for zip_code in counts.index:
+        summaries[int(zip_code)] = {
+            'Zip': int(zip_code),
+            'parcels': int(counts[zip_code]),
+            'median_values': dict(zip(VALUE_COLUMNS, _clean(values.loc[zip_code].tolist()))),
+            'ratios': {
+                column: dict(zip(ZIP_QUANTILES, _clean(quantiles.loc[zip_code, column].tolist())))
+                for column in RATIO_COLUMNS
+            },
+        }
+    return summaries
+
+
+class ParcelLookup:
+    # Everything the endpoints read, built once at startup: the PIN index for the
+    # binary search, one row of values and county / ZIP ranks per parcel (the same
+    # columns batch_compare.py reports) and the ZIP summaries, already encoded.
+
+    def __init__(self, parcels):
+        self.index = PinIndex.from_frame(parcels)
+        ranks = parcel_ranks(parcels)
+        self.columns = [column for column in ranks.columns if column not in ('ParcelID', 'Zip')]
+        self.table = ranks[self.columns].to_numpy(dtype='float64', na_value=np.nan)
+        self.zips = ranks['Zip'].to_numpy(dtype='float64', na_value=np.nan)
+        summaries = zip_summaries(parcels)
+        self.zip_json = {zip_code: json.dumps(summary, separators=(',', ':')) for zip_code, summary in summaries.items()}
+        self.all_zips_json = json.dumps(list(summaries.values()), separators=(',', ':'))
+
+    def __len__(self):
+        return len(self.index)
+
+    def records(self, pins):
+        # one dict per PIN, in the order given; unknown PINs, including ones that can't be
+        # a ParcelID at all (non-ASCII, wider than the ids), come back with Found=False
+        positions = self.index.positions(pins)
+        records = []
+        for pin, position in zip(pins, positions.tolist()):
+            if position < 0:
+                records.append({'PIN': pin, 'Found': False})
+                continue
+            row = self.index.rows[position]
+            zip_code = self.zips[row]
+            record = {'PIN': pin, 'Found': True, 'Zip': None if zip_code != zip_code else int(zip_code)}
+            record.update(zip(self.columns, _clean(self.table[row].tolist())))
+            records.append(record)
+        return records
+
+
+def build_app(lookup):
+    async def health(request):
+        return _json({'parcels': len(lookup), 'zips': len(lookup.zip_json)})
+
+    async def pin(request):
+        record = lookup.records([request.path_params['pin'].strip()])[0]
+        return _json(record, status=200 if record['Found'] else 404)
+
+    async def pins(request):
+        try:
+            body = await request.json()
+            # a string or an object would be iterated too, one character or key per PIN
+            if not isinstance(body['pins'], list):
+                raise TypeError('pins must be a list')
+            requested = [str(pin).strip() for pin in body['pins']]
+        except (ValueError, KeyError, TypeError):
+            return _json({'error': 'expected a JSON body like {"pins": ["9788123456", ...]}'}, status=400)
+        if len(requested) > MAX_BATCH:
+            return _json({'error': f'at most {MAX_BATCH:,} PINs per request'}, status=413)
+        records = lookup.records(requested)
+        return _json({'found': sum(record['Found'] for record in records), 'results': records})
+
+    async def zip_summary(request):
+        summary = lookup.zip_json.get(request.path_params['zip'])
+        if summary is None:
+            return _json({'error': 'ZIP not found', 'Zip': request.path_params['zip']}, status=404)
+        return Response(summary, media_type='application/json')
+
+    async def all_zips(request):
+        return Response(lookup.all_zips_json, media_type='application/json')
+
+    return Starlette(routes=[
+        Route('/health', health),
+        Route('/pin/{pin}', pin),
+        Route('/pins', pins, methods=['POST']),
+        Route('/zip/{zip:int}', zip_summary),
+        Route('/zips', all_zips),
+    ])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve PIN, batch PIN and ZIP lookups as JSON')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data', default=PROCESSED_PATH, help='processed parcel table')
+    parser.add_argument('--county', metavar='FIPS', help='serve this county (e.g. 37135) from the partitioned dataset instead of --data')
+    return parser.parse_args()
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+    if args.county:
+        parcels = read_parcels(args.county, columns=PARCEL_COLUMNS)
+    else:
+        parcels = pd.read_parquet(args.data, columns=PARCEL_COLUMNS)
+    lookup = ParcelLookup(parcels)
+    print(f'{len(lookup):,} parcels in {len(lookup.zip_json):,} ZIPs loaded')
+    uvicorn.run(build_app(lookup), host=args.host, port=args.port, http='httptools', access_log=False, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
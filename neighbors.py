@@ -0,0 +1,130 @@
+# nearest-neighbor comparison of a parcel to the parcels around it
+# neighbors.py
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from pin_index import RATIO_COLUMNS
+
+
+NEIGHBOR_DIR = 'neighbors'
+
+# NAD83 / North Carolina (metres), so distances are in metres
+PARCEL_CRS = 32119
+
+# default number of neighbors compared against
+DEFAULT_K = 50
+
+
+def parcel_centroids(parcel_layer, pin_field='PIN'):
+    # one projected centroid per PIN from the county parcel polygons
+    import geopandas as gpd
+
+    parcels = gpd.read_file(parcel_layer, columns=[pin_field]).to_crs(epsg=PARCEL_CRS)
+    centroids = parcels.geometry.centroid
+    located = pd.DataFrame({
+        'ParcelID': parcels[pin_field].astype(str).str.strip(),
+        'x': centroids.x,
+        'y': centroids.y,
+    })
+    return located.drop_duplicates(subset=['ParcelID'], keep='first')
+
+
+class NeighborIndex:
+    # tree:      KD-tree over the parcels that have a centroid
+    # tree_rows: row in processed_data.parquet of each point in the tree
+    # xy:        centroid of every row (NaN where the parcel wasn't in the parcel layer)
+    # ratios:    ratio columns of every row
+
+    def __init__(self, tree, tree_rows, xy, ratios, columns):
+        self.tree = tree
+        self.tree_rows = tree_rows
+        self.xy = xy
+        self.ratios = ratios
+        self.columns = list(columns)
+
+    @classmethod
+    def from_frame(cls, df):
+        from scipy.spatial import cKDTree
+
+        xy = df[['x', 'y']].to_numpy(dtype='float64', na_value=np.nan)
+        located = ~np.isnan(xy).any(axis=1)
+        tree = cKDTree(xy[located])
+        ratios = df[RATIO_COLUMNS].to_numpy(dtype='float64', na_value=np.nan)
+        return cls(tree, np.flatnonzero(located), xy, ratios, RATIO_COLUMNS)
+
+    def save(self, out_dir=NEIGHBOR_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, 'tree.pkl'), 'wb') as f:
+            pickle.dump(self.tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        np.save(os.path.join(out_dir, 'tree_rows.npy'), self.tree_rows)
+        np.save(os.path.join(out_dir, 'xy.npy'), self.xy)
+        np.save(os.path.join(out_dir, 'ratios.npy'), self.ratios)
+        with open(os.path.join(out_dir, 'columns.json'), 'w') as f:
+            json.dump(self.columns, f)
+
+    @classmethod
+    def load(cls, out_dir=NEIGHBOR_DIR):
+        with open(os.path.join(out_dir, 'tree.pkl'), 'rb') as f:
+            tree = pickle.load(f)
+        with open(os.path.join(out_dir, 'columns.json')) as f:
+            columns = json.load(f)
+        return cls(
+            tree,
+            np.load(os.path.join(out_dir, 'tree_rows.npy'), mmap_mode='r'),
+            np.load(os.path.join(out_dir, 'xy.npy'), mmap_mode='r'),
+            np.load(os.path.join(out_dir, 'ratios.npy'), mmap_mode='r'),
+            columns,
+        )
+
+    def neighbors(self, row, k=DEFAULT_K, radius=None):
+        # rows of the k nearest parcels, or of every parcel within radius metres,
+        # not counting the parcel itself; None if the parcel has no centroid
+        point = self.xy[row]
+        if np.isnan(point).any():
+            return None
+        if radius is not None:
+            found = np.asarray(self.tree.query_ball_point(point, radius), dtype='int64')
+            distances = np.hypot(*(self.tree.data[found] - point).T)
+        else:
+            distances, found = self.tree.query(point, k=min(k + 1, self.tree.n))
+            distances, found = np.atleast_1d(distances), np.atleast_1d(found)
+        rows = self.tree_rows[found]
+        keep = rows != row
+        rows, distances = rows[keep], distances[keep]
+        if radius is None:
+            rows, distances = rows[:k], distances[:k]
+        return rows, distances
+
+    def compare(self, row, k=DEFAULT_K, radius=None):
+        # the parcel's ratios against its neighbors: neighbor median and the parcel's
+        # rank among them (share of neighbors strictly below it, as for PinIndex.rank)
+        found = self.neighbors(row, k, radius)
+        if found is None:
+            return None
+        rows, distances = found
+        summary = []
+        for i, column in enumerate(self.columns):
+            values = self.ratios[rows, i]
+            values = values[~np.isnan(values)]
+            own = self.ratios[row, i]
+            summary.append({
+                'column': column,
+                'value': float(own),
+                'neighbor_median': float(np.median(values)) if len(values) else np.nan,
+                'rank': float((values < own).mean()) if len(values) else np.nan,
+            })
+        return {
+            'neighbors': int(len(rows)),
+            'max_distance': float(distances.max()) if len(distances) else 0.0,
+            'ratios': summary,
+        }
+
+
+def build_neighbor_index(df, out_dir=NEIGHBOR_DIR):
+    index = NeighborIndex.from_frame(df)
+    index.save(out_dir)
+    return index
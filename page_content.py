@@ -0,0 +1,193 @@
+# text, map titles and tables of the page, shared by app.py and static_export.py
+# page_content.py
+
+
+# county named on the page for the single county layout next to app.py
+COUNTY_NAME = 'Orange County'
+
+# Page text, in the order it appears. Markdown, with links as inline HTML.
+INTRO = """
+Recently, where I live in Orange County North Carolina, there has been a lot of <a href="https://www.newsobserver.com/news/local/counties/orange-county/article300487814.html" target="_blank">talk about changes in the appraised value of homes that are used for calculating property taxes</a>.
+
+I thought it would be interesting to see how residential property values have evolved from 2024 to 2025, and how they compare to each other in my county (Orange County NC). So, I used the publicly available Orange County GIS data to get the value of each property and compare them to others in the rest of the county.
+
+Below I'll provide some data that I found interesting, and at the bottom you can see how changes in property values compares to general distribution found in Orange County.
+"""
+
+REVALUATION = """
+**First, what is the revaluation process and why does it matter?**
+
+I'm not going to go into the full details, but the Orange County website does a <a href="https://www.orangecountync.gov/878/Revaluation" target="_blank">great job</a> of describing the process and answering a lot of questions (<a href="https://www.orangecountync.gov/FAQ.aspx?TID=40" target="_blank">and here is an additional FAQ</a>). From a simple perspective, it is the following:
+
+*"Revaluation is the process of updating all property tax assessments in Orange County to reflect market value as of a set date. For Orange County, this date is January 1, 2025. During this process, the tax office reassesses all real property, including land, buildings, and improvements. North Carolina law requires counties to revalue properties at least every eight years, Orange County follows a four-year revaluation cycle."*
+"""
+
+DATA_NOTES = """
+Next up, some basics on the data itself, and what is and is not included in this analysis
+
+**Where is the data sourced?**
+
+Nicely, Orange County Publishes all of this data on their <a href="https://www.orangecountync.gov/2057/Download-GIS-Data" target="_blank">website</a>. Full data for 2024 and previous years is on the site, but they were kind enough to supply preliminary 2025 data by email.
+
+**Does this include all properties in Orange County NC?**
+
+No! For simplicity, and because I wanted to focus on residential housing, I trimmed out a few types of properties:
+
+1. **Non Zero Tax Exemptions** This primarily includes out schools and similar tax exempt locations.
+2. **Land only plots** There is a LOT of land in Chapel Hill which doesn't have any buildings. It's been trimmed out.
+3. **Duplicates:** I wasn't sure exactly how to handle this, but there are more than a few duplicates Parcels in the data which are mostly similar. It's a relatively small amount, but only one was chosen.
+
+In sum, this leaves us with around 40K property locations in Orange County, down from around 62K. I should note that this data also includes a lot of other quirks which I don't fully understand, nor will likely ever understand. As the 2025 data is also *preliminary*, it is also likely to change and get cleaner over time.
+
+Before we go deeper, we should check if this data makes sense. The following figure shows the median appraised value for each zip code in Orange County. Two zip codes had under 10 properties, so I filtered them out (27312 and 27515). As expected, the locations that are closer to the town center of chapel hill have higher valuations (e.g. 27514):
+
+"""
+
+VALUE_CHANGE = """
+**Next, does the data show that property valuations have increased in the county, and if so, by how much?**
+
+Yes. For this set of properties, appraised values increased by around 58% in 2025. However, there is also a lot of variation (see figures below). While almost no properties had lower value valuations, there were a rather larger number of properties that actually had valuations increase 2X, 5X and a few even by 10X.
+
+The table below shows a quick snapshot of the valuation change from 2024 to 2025.
+
+"""
+
+SANITY_CHECK = """
+**Do these numbers seem to make sense?**
+
+At a high level, the increase in residential real estate valuation estimated over the past 4 years from both <a href="https://www.redfin.com/city/3059/NC/Chapel-Hill/housing-market" target="_blank">Redfin</a> and <a href="https://www.zillow.com/home-values/17386/chapel-hill-nc/" target="_blank">Zillow</a> seem in line with the increase shown in the tax revaluation.
+
+"""
+
+FACTORS = """
+**What factors most correlate with the *increase* in value?**
+
+*Do building characteristics such as Age or Square Footage matter?* It turns out, not so much. The correlation in the change of value is rather small to non-existent.
+
+*What about Land and Building Values? Did they change at the same rate?* No. This is where we see big differences. It turns out that mean changes in building values and land values have gone up at extremely different rates. The tax office finds that, for this sample, building values should increase by roughly 43%, while land values are closer to 115% (i.e. more than double). This also means that property owners who have a lot of land are likely to pay a much higher share of property taxes in the future and that home owners on small plots of land will likely pay less, relatively.
+
+
+"""
+
+ZIP_CHANGE = """
+This also means that if we average change in property values by zip code, we should see larger increases from the outside of town.
+
+This is quite evident as the zip codes with less land (27514 and 27510) show a smaller increase than those farther outside of town."
+
+"""
+
+PARCEL_MAP = """
+The ZIP averages smooth over a lot. The map below shows the median change of the parcels in each square of a grid, so neighbourhoods that were revalued differently from the rest of their ZIP stand out. Pick a smaller square to see more detail, in places with enough properties.
+"""
+
+PIN_PROMPT = """
+Of course, many individuals care about how changes in property valuation will compare to that of others in the county. If you want to see how any property compares to the distribution of others in Orange County, please go to the <a href="https://gis.orangecountync.gov/orangeNCGIS/default.htm">Orange County GIS website</a> to lookup the associated **PIN**, and then enter then enter that PIN below. This will show the change in that property's Total Valuation, Building Valuation and Land Valuation from 2024 to 2025.
+"""
+
+SEGMENTS = """
+**How do different kinds of properties compare?**
+
+Pick a ZIP, a building type, a band of current appraised value or of the year a building was built to see the change for just those properties, and compare the largest groups within them side by side.
+"""
+
+WRAP_UP = """
+**Wrap up**
+
+Given the above, there are lots of potentially unanswered questions. One which still stands out to me is the "lumpiness" in the change in Land Valuation. While changes in building valuation seem to have a smooth curve, the changes in Land Valuation have many large jumps, most notably around 50%, 100% and a handful of other values. This suggests a rather coarse modeling.
+"""
+
+
+# The two ZIP maps: zip_tiers column, title ({county} is the county name) and label format
+ZIP_MAPS = {
+    'value_map': ('AvgAppraisalValue', 'Median Appraised Value by ZIP in {county}, NC', '{zip}\n${value:,.0f}'),
+    'change_map': ('AppraisalValueChange', 'Change in Appraised Value by ZIP in {county}, NC', '{zip}\n{value:,.1%}'),
+}
+
+# The three PIN histograms: ratio column, current value column, label used in the
+# message and the chart title
+PIN_HISTOGRAMS = [
+    ('TotalAppraisedValue_percent', 'TotalAppraisedValue', 'Total Appraisal Value of',
+     'Trimmed Distribution of the Change in Total Appraised Property Value'),
+    ('TotalAppraisedBuildingValue_percent', 'TotalAppraisedBuildingValue', 'Building Appraisal Value of:',
+     'Trimmed Distribution of the Change in Total Appraised Building Value'),
+    ('TotalAppraisedLandValue_percent', 'TotalAppraisedLandValue', 'Land Appraisal Value of:',
+     'Trimmed Distribution of the Change in Total Appraised Land Value'),
+]
+
+
+# Segment filters: cube dimension and its label
+SEGMENT_DIMENSIONS = {
+    'Zip': 'ZIP',
+    'BldgTypeDescription': 'Building Type',
+    'ValueDecile': 'Appraised Value Decile',
+    'YearBuiltBand': 'Year Built',
+}
+
+# Ratio choices of the segment chart and the parcel map: label and ratio column
+RATIO_CHOICES = {
+    'Total Value': 'TotalAppraisedValue_percent',
+    'Building Value': 'TotalAppraisedBuildingValue_percent',
+    'Land Value': 'TotalAppraisedLandValue_percent',
+}
+
+# how many of the largest levels are overlaid when comparing by a dimension
+SEGMENT_COMPARE_TOP = 3
+
+# what the segment chart and the parcel map show before anything is picked; building
+# types compared on the change in building value is the chart this page started with
+SEGMENT_DEFAULT_RATIO = 'Building Value'
+SEGMENT_DEFAULT_COMPARE = 'BldgTypeDescription'
+PARCEL_MAP_DEFAULT_RATIO = 'Land Value'
+
+
+def percent_change(x):
+    # ratio to change, e.g. 1.25 → 25.0%
+    return f"{x * 100 - 100:.1f}%"
+
+
+def dollars(x):
+    return f"${x:,.0f}"
+
+
+def stats_table(summary, rows):
+    # rows: (summary column, row label, formatter); one column per statistic
+    header = list(summary['stats'][rows[0][0]])
+
+    # Build HTML table with centered values
+    html_table = "<table style='width:100%; border-collapse:collapse; text-align:center;'>"
+
+    # Header row
+    html_table += "<thead><tr><th></th>"  # Empty top-left cell
+    for col in header:
+        html_table += f"<th>{col}</th>"
+    html_table += "</tr></thead><tbody>"
+
+    # Data rows
+    for column, row_name, fmt in rows:
+        html_table += f"<tr><td><strong>{row_name}</strong></td>"
+        for col in header:
+            html_table += f"<td>{fmt(summary['stats'][column][col])}</td>"
+        html_table += "</tr>"
+
+    html_table += "</tbody></table>"
+    return html_table
+
+
+def value_table(summary):
+    return stats_table(summary, [
+        ('TotalAppraisedValue_percent', '% Change in Appraisal Value', percent_change),
+        ('TotalAppraisedValue', '2025 Appraised Value', dollars),
+    ])
+
+
+def change_table(summary):
+    return stats_table(summary, [
+        ('TotalAppraisedLandValue_percent', '% Change in Land Value', percent_change),
+        ('TotalAppraisedBuildingValue_percent', '% Change in Building Value', percent_change),
+    ])
+
+
+def segment_table(cells):
+    # cells: [(row label, cube cell)]; the cells hold the same statistics as the summary
+    return stats_table({'stats': {label: cell['stats'] for label, cell in cells}},
+                       [(label, label, percent_change) for label, _ in cells])
@@ -0,0 +1,61 @@
+# figures of the page as encoded images, shared by app.py and the pre-rendered copies
+# in app_bundle.py
+# page_figures.py
+import json
+
+import page_content
+import plots
+
+
+def page_image(fig, fmt='png'):
+    data = plots.figure_bytes(fig, fmt)
+    return plots.fit_page_width(data) if fmt == 'png' else data
+
+
+def figure_key(kind, *args):
+    # name of a pre-rendered figure: its kind and everything it was drawn from
+    return json.dumps([kind, *args])
+
+
+def zip_map(name, zip_tier, county_tier, county_name, fmt='png'):
+    column, title, label_format = page_content.ZIP_MAPS[name]
+    fig = plots.zip_choropleth(zip_tier, county_tier, column, title.format(county=county_name), label_format)
+    return page_image(fig, fmt)
+
+
+def pin_histogram(hist, title):
+    # the histogram without a marker, as a palette PNG, and where its axes land in the
+    # image for pin_marker
+    fig = plots.trimmed_histogram(hist, title)
+    extent = plots.axes_extent(fig)
+    return plots.palette_png(page_image(fig)), extent
+
+
+def pin_marker(image, extent, marker):
+    # a PIN's marker over the image from pin_histogram; fit_page_width only scales it,
+    # so the extent's fractions still hold
+    return plots.draw_marker(image, extent, marker)
+
+
+def segment_chart(segments, selection, column, compare, label):
+    # one segment, or the largest levels of the compare dimension within the selection
+    if compare is None:
+        series = [(label, segments.cell(selection, column)['counts'])]
+    else:
+        series = [(level, cell['counts'])
+                  for level, cell in segments.largest(compare, selection, column, page_content.SEGMENT_COMPARE_TOP)]
+    title = f'Normalized Distribution of the Change in {label}'
+    legend = page_content.SEGMENT_DIMENSIONS[compare] if compare else None
+    return page_image(plots.segment_histograms(segments.edges[column], series, title, f'Change in {label}', legend))
+
+
+def parcel_map(raster_grids, column, label, cell_size, zip_tier, county_tier, hist, county_name):
+    # colours span the county histogram's trim bounds at every cell size; None when the
+    # level has no cells
+    level = raster_grids.image(cell_size, column)
+    if level is None:
+        return None
+    image, extent = level
+    title = f'Median Change in {label} in {county_name}, NC'
+    return page_image(plots.raster_map(image, extent, zip_tier, county_tier, title, f'{label} Ratio',
+                                       hist['lower'], hist['upper']))
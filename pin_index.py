@@ -0,0 +1,124 @@
+# persisted PIN lookup index
+# pin_index.py
+import json
+import os
+
+import numpy as np
+
+
+INDEX_DIR = 'pin_index'
+
+# ratio columns with a presorted copy for percentile ranks
+RATIO_COLUMNS = [
+    'TotalAppraisedValue_percent',
+    'TotalAppraisedBuildingValue_percent',
+    'TotalAppraisedLandValue_percent',
+]
+
+# current values shown next to each ratio
+VALUE_COLUMNS = [
+    'TotalAppraisedValue',
+    'TotalAppraisedBuildingValue',
+    'TotalAppraisedLandValue',
+]
+
+
+def _encode(pins):
+    # fixed width bytes, so the id array can be memory mapped and binary searched
+    return np.asarray(pins, dtype=object).astype(str).astype('S')
+
+
+def _sorted_key(name):
+    return f'sorted_{name}'
+
+
+class PinIndex:
+    # ids:    ParcelIDs, sorted
+    # rows:   row offset of each id in processed_data.parquet
+    # values: one column per entry in `columns`, in id order
+    # sorted_<ratio>: the non-null values of each ratio column, ascending
+
+    def __init__(self, ids, rows, values, columns, sorted_ratios):
+        self.ids = ids
+        self.rows = rows
+        self.values = values
+        self.columns = list(columns)
+        self.sorted_ratios = sorted_ratios
+
+    @classmethod
+    def from_frame(cls, df):
+        columns = RATIO_COLUMNS + VALUE_COLUMNS
+        ids = _encode(df['ParcelID'].to_numpy())
+        order = np.argsort(ids, kind='stable')
+        values = df[columns].to_numpy(dtype='float64', na_value=np.nan)[order]
+        sorted_ratios = {}
+        for i, column in enumerate(RATIO_COLUMNS):
+            present = values[:, i][~np.isnan(values[:, i])]
+            sorted_ratios[column] = np.sort(present)
+        return cls(ids[order], order.astype('int64'), values, columns, sorted_ratios)
+
+    def save(self, out_dir=INDEX_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, 'ids.npy'), self.ids)
+        np.save(os.path.join(out_dir, 'rows.npy'), self.rows)
+        np.save(os.path.join(out_dir, 'values.npy'), self.values)
+        for column, values in self.sorted_ratios.items():
+            np.save(os.path.join(out_dir, f'{_sorted_key(column)}.npy'), values)
+        with open(os.path.join(out_dir, 'columns.json'), 'w') as f:
+            json.dump({'columns': self.columns, 'ratios': list(self.sorted_ratios)}, f)
+
+    @classmethod
+    def load(cls, out_dir=INDEX_DIR, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(out_dir, 'columns.json')) as f:
+            meta = json.load(f)
+        ids = np.load(os.path.join(out_dir, 'ids.npy'), mmap_mode=mode)
+        rows = np.load(os.path.join(out_dir, 'rows.npy'), mmap_mode=mode)
+        values = np.load(os.path.join(out_dir, 'values.npy'), mmap_mode=mode)
+        sorted_ratios = {
+            column: np.load(os.path.join(out_dir, f'{_sorted_key(column)}.npy'), mmap_mode=mode)
+            for column in meta['ratios']
+        }
+        return cls(ids, rows, values, meta['columns'], sorted_ratios)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, pins):
+        # binary search for many PINs at once, -1 where a PIN is not in the index. A PIN
+        # that isn't ASCII or is wider than the ids can't be one of them, as in
+        # static/lookup.js, and is searched for as an empty key instead of encoded.
+        pins = np.asarray(pins, dtype=object).astype(str)
+        width = self.ids.dtype.itemsize
+        valid = np.array([pin.isascii() and 0 < len(pin) <= width for pin in pins], dtype=bool)
+        keys = _encode(np.where(valid, pins, ''))
+        if len(self.ids) == 0:
+            return np.full(len(keys), -1)
+        found = np.searchsorted(self.ids, keys)
+        found = np.minimum(found, len(self.ids) - 1)
+        hit = valid & (self.ids[found] == keys)
+        return np.where(hit, found, -1)
+
+    def rank(self, column, values):
+        # share of parcels with a ratio strictly below each value, which is what the
+        # app's "higher than X% of properties" says; ties don't count
+        sorted_values = self.sorted_ratios[column]
+        ranks = np.searchsorted(sorted_values, values, side='left') / max(len(sorted_values), 1)
+        return np.where(np.isnan(values), np.nan, ranks)
+
+    def lookup(self, pin):
+        # all values for one PIN plus its percentile rank in each ratio, or None
+        position = self.positions([pin.strip()])[0]
+        if position < 0:
+            return None
+        record = {column: float(self.values[position, i]) for i, column in enumerate(self.columns)}
+        for column in self.sorted_ratios:
+            record[f'{column}_rank'] = float(self.rank(column, np.array([record[column]]))[0])
+        record['row'] = int(self.rows[position])
+        return record
+
+
+def build_pin_index(df, out_dir=INDEX_DIR):
+    index = PinIndex.from_frame(df)
+    index.save(out_dir)
+    return index
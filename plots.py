@@ -0,0 +1,215 @@
+# matplotlib figures drawn by the page
+# plots.py
+#
+# pyplot is imported by each function rather than here, so importing this module
+# doesn't cost the matplotlib import until a figure is actually drawn
+import io
+
+import pandas as pd
+
+
+# keep the Streamlit look: st.pyplot saves with the same options
+SAVEFIG_OPTIONS = {'bbox_inches': 'tight', 'dpi': 200}
+
+# size the ZIP maps are drawn at
+MAP_FIGSIZE = (7, 10)
+
+# matplotlib's default lines.dashed_pattern ('--'), in multiples of the line width
+DASHED_PATTERN = (3.7, 1.6)
+
+# widest image st.image shows as is (2 x its 730px content width); wider ones are
+# decoded, scaled down and re-encoded by Streamlit on every rerun
+PAGE_IMAGE_WIDTH = 2 * 730
+
+
+def figure_bytes(fig, fmt='png'):
+    # render and release the figure, only the encoded image is kept
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, **SAVEFIG_OPTIONS)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def fit_page_width(data, width=PAGE_IMAGE_WIDTH):
+    # the PNG st.image would produce from data: scaled the same way (bilinear, to `width`),
+    # so doing it once here leaves Streamlit nothing to do
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if image.width <= width:
+        return data
+    image = image.resize((width, int(1.0 * image.height * width / image.width)), resample=Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', quality=90)
+    return buffer.getvalue()
+
+
+def zip_choropleth(zip_tier, county_tier, column, title, label_format, figsize=MAP_FIGSIZE):
+    # zip_tier and county_tier come from geo_tiers: already in EPSG:3857, simplified,
+    # with the ZIP outlines and label points stored, so there is no geometry work here
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+
+    # Fill ZIPs with shading by the chosen value
+    zip_tier.plot(
+        column=column,
+        cmap="OrRd",
+        linewidth=0,
+        ax=ax,
+        legend=False,
+    )
+
+    # ZIP code boundary lines
+    zip_tier["boundary"].plot(ax=ax, linewidth=1, edgecolor="black")
+
+    # County boundary
+    county_tier.plot(ax=ax, linewidth=2, edgecolor="blue")
+
+    # ZIP code labels
+    for zip_code, value, x, y in zip(zip_tier["ZIP"], zip_tier[column], zip_tier["label_x"], zip_tier["label_y"]):
+        if pd.notnull(value):
+            ax.text(
+                x,
+                y,
+                label_format.format(zip=zip_code, value=value),
+                fontsize=8,
+                ha="center",
+                va="center",
+                color="black"
+            )
+
+    # Clean layout
+    ax.set_title(title, fontsize=14)
+    ax.axis("off")
+    fig.tight_layout()
+    return fig
+
+
+def raster_map(image, extent, zip_tier, county_tier, title, label, vmin, vmax, figsize=MAP_FIGSIZE):
+    # image and extent from raster_grids.RasterGrids.image, in the same CRS as the tiers;
+    # one imshow however many parcels went into the cells
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+    shown = ax.imshow(image, extent=extent, origin='lower', cmap='viridis', vmin=vmin, vmax=vmax,
+                      interpolation='nearest', zorder=1)
+    zip_tier["boundary"].plot(ax=ax, linewidth=0.5, edgecolor="grey", zorder=2)
+    county_tier.plot(ax=ax, linewidth=2, edgecolor="blue", zorder=3)
+
+    # framed on the county, cells of neighbouring counties are cut off
+    minx, miny, maxx, maxy = county_tier.total_bounds
+    ax.set_xlim(minx, maxx)
+    ax.set_ylim(miny, maxy)
+    fig.colorbar(shown, ax=ax, shrink=0.5, label=label)
+    ax.set_title(title, fontsize=14)
+    ax.axis("off")
+    fig.tight_layout()
+    return fig
+
+
+def trimmed_histogram(hist, title, marker=None, figsize=(10, 6)):
+    # hist holds the precomputed trim bounds, bin counts and edges of one ratio column
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+
+    # Marker for the entered PIN
+    if marker is not None:
+        ax.axvline(marker, color='red', linestyle='--', linewidth=2, label='🔴 Your Value')
+
+    # Plot the precomputed bins of the values within bounds
+    ax.hist(hist['edges'][:-1], bins=hist['edges'], weights=hist['counts'], edgecolor='black')
+    ax.grid(True)
+    ax.set_title(title)
+    ax.set_xlabel('Value')
+    ax.set_ylabel('Frequency')
+    fig.tight_layout()
+    return fig
+
+
+def segment_histograms(edges, series, title, xlabel, legend_title=None, figsize=(10, 6)):
+    # series: [(label, bin counts)] on the same edges, drawn as overlaid densities so
+    # segments of very different sizes can be compared
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+    for label, counts in series:
+        ax.hist(edges[:-1], bins=edges, weights=counts, density=True, alpha=0.5, label=label,
+                edgecolor='black', linewidth=0.5)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Density')
+    if len(series) > 1:
+        ax.legend(title=legend_title)
+    fig.tight_layout()
+    return fig
+
+
+def axes_extent(fig, ax=None):
+    # Where the axes fall in the image figure_bytes() saves, as fractions of its width
+    # (left / right, at the ends of xlim) and height (top / bottom, from the top), so a
+    # marker can be drawn over the pre-rendered image without rendering it again.
+    import matplotlib.pyplot as plt
+
+    ax = ax or fig.axes[0]
+    fig.canvas.draw()
+    renderer = fig.canvas.get_renderer()
+    saved = fig.get_tightbbox(renderer).padded(plt.rcParams['savefig.pad_inches'])
+    box = ax.get_window_extent(renderer).transformed(fig.dpi_scale_trans.inverted())
+    return {
+        'xlim': [float(x) for x in ax.get_xlim()],
+        'left': (box.x0 - saved.x0) / saved.width,
+        'right': (box.x1 - saved.x0) / saved.width,
+        'top': (saved.y1 - box.y1) / saved.height,
+        'bottom': (saved.y1 - box.y0) / saved.height,
+        'width_in': saved.width,
+    }
+
+
+def palette_png(data, colours=255):
+    # the image with its colours reduced to a palette (a chart has few besides the
+    # antialiasing), one byte a pixel instead of four, so re-encoding it is ~8x faster;
+    # one palette slot is left for draw_marker's red
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data)).convert('RGB').quantize(colours, method=Image.Quantize.MEDIANCUT)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def draw_marker(data, extent, marker, linewidth=2):
+    # the dashed red line trimmed_histogram draws for a marker, drawn with PIL over the
+    # image saved without one (axes_extent of that figure), so a PIN lookup needs
+    # neither matplotlib nor a render
+    from PIL import Image, ImageDraw
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    red = (255, 0, 0)
+    if image.mode == 'P' and len(image.getpalette()) < 3 * 256:
+        palette = image.getpalette()
+        image.putpalette(palette + list(red))
+        red = len(palette) // 3
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    points = image.width / (72 * extent['width_in'])
+    (x0, x1), width = extent['xlim'], image.width
+    x = width * (extent['left'] + (marker - x0) / (x1 - x0) * (extent['right'] - extent['left']))
+    top, bottom = extent['top'] * image.height, extent['bottom'] * image.height
+    on, off = [length * linewidth * points for length in DASHED_PATTERN]
+    half = linewidth * points / 2
+
+    # dashes run up from the bottom of the axes, as axvline's path does
+    draw = ImageDraw.Draw(image)
+    y = bottom
+    while y > top:
+        draw.rectangle([round(x - half), round(max(y - on, top)), round(x + half) - 1, round(y) - 1], fill=red)
+        y -= on + off
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
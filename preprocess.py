@@ -1,116 +1,456 @@
 # pre processing property tax data
 # preprocess.py
+import argparse
+import os
+import shutil
+
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 
+from app_bundle import build_app_bundle
+from county_dataset import artifact_paths, publish_county, write_parcels
+from delta import affected_zips, changed_ids, diff_extract, patch_rows
+from distributions import build_summary, write_summary
+from geo_cache import cached_download
+from geo_tiers import COUNTY_TIERS_PATH, ZIP_TIERS_PATH, build_county_tiers, build_zip_tiers, write_tiers
+from ingest import EXTRACT_COLUMNS, read_extract
+from instrument import PROFILE_ENV, Profiler
+from lazy_engine import write_deduped_extract, write_long_table, write_processed_table, write_ratios, write_zip_medians
+from neighbors import NEIGHBOR_DIR, build_neighbor_index, parcel_centroids
+from pin_index import build_pin_index
+from raster_grids import RASTER_PATH, build_raster_grids
+from segments import SEGMENTS_PATH, write_segment_cube
+from shared_data import write_shared
+from stage_cache import StageCache
+
+
+# yearly extracts, oldest first. The label is the Year key in the long table and the
+# column suffix when an extract is used as the base of a comparison.
+EXTRACTS = {
+    '2024': '/Users/isaacdinner/Documents/orange_gis/2024 Real Property Data Extract - Detailed - 20240828.xlsx',
+    '2025': '/Users/isaacdinner/Documents/orange_gis/2025 Real Property Data Extract - Detailed - PRELIMINARY - 20250324.xlsx',
+}
+
+# (base, target) comparisons to compute. The first one is the one shown on the page.
+PAIRS = [('2024', '2025')]
+
+# county parcel polygons, used for the parcel centroids behind the neighbor comparison
+PARCEL_LAYER = '/Users/isaacdinner/Documents/orange_gis/parcels.shp'
+PARCEL_PIN_FIELD = 'PIN'
+
+COUNTY_SHAPEFILE = '/Users/isaacdinner/Documents/orange_gis/tl_2023_us_county.shp'
+ZIP_GEOJSON_URL = "https://raw.githubusercontent.com/OpenDataDE/State-zip-code-GeoJSON/master/nc_north_carolina_zip_codes_geo.min.json"
+
+# Orange County, NC (state FIPS: 37, county FIPS: 135)
+STATE_FIPS = "37"
+COUNTY_FIPS = "135"
 
-#loading key data from 2024 and 2025
-df_2024 = pd.read_excel('/Users/isaacdinner/Documents/orange_gis/2024 Real Property Data Extract - Detailed - 20240828.xlsx', engine='openpyxl')
-df_2025 = pd.read_excel('/Users/isaacdinner/Documents/orange_gis/2025 Real Property Data Extract - Detailed - PRELIMINARY - 20250324.xlsx', engine='openpyxl')
-
-#trimming down the data to only include the key columns
-df_2024_trim=df_2024[['ParcelID', 'TotalAppraisedValue', 'TotalAppraisedLandValue', 'TotalAppraisedBuildingValue','TotalFinishedArea','LandArea']]
-df_2024_thin = df_2024_trim.rename(columns={
-    'TotalAppraisedValue': 'TotalAppraisedValue_2024',
-    'TotalAppraisedLandValue': 'TotalAppraisedLandValue_2024',
-    'TotalAppraisedBuildingValue': 'TotalAppraisedBuildingValue_2024',
-    'TotalFinishedArea':'TotalFinishedArea_2024',
-    'LandArea':'LandArea_2024'
-})
-
-# Removing duplicate rows based on 'col1', keeping the last occurrence
-df_2024_trim = df_2024_thin.drop_duplicates(subset=['ParcelID'], keep='first')
-
-# Remove duplicate rows based on 'col1', keeping the last occurrence
-df_2025_trim00 = df_2025.drop_duplicates(subset=['ParcelID'], keep='first')
-
-# Removes tax exempt locations
-df_2025_trim = df_2025_trim00[(df_2025_trim00['TotalValueExemption'] == 0)]
-
-# Merging the two dataframes
-merged_df = pd.merge(df_2024_trim, df_2025_trim, on='ParcelID', how='left')
-
-# Filtering out further invalid values or locations with no buildings
-merged_df_trim_filter01 = merged_df[(merged_df['LandArea_2024'] == merged_df['LandArea']) &
-    (merged_df['TotalFinishedArea_2024'] == merged_df['TotalFinishedArea']) &
-    (merged_df['TotalAppraisedValue_2024'] > 1) & 
-    (merged_df['TotalAppraisedLandValue_2024'] > 1) & 
-    (merged_df['TotalAppraisedBuildingValue_2024'] > 1)]
-
-
-merged_df_trim_filter01 = merged_df_trim_filter01.copy() 
-
-merged_df_trim_filter01['TotalAppraisedValue_percent'] = np.where(
-    merged_df_trim_filter01['TotalAppraisedValue_2024'] > 1,
-    merged_df_trim_filter01['TotalAppraisedValue'] / merged_df_trim_filter01['TotalAppraisedValue_2024'],
-    np.nan
-)
-
-merged_df_trim_filter01['TotalAppraisedLandValue_percent'] = np.where(
-    merged_df_trim_filter01['TotalAppraisedLandValue_2024'] > 1,
-    merged_df_trim_filter01['TotalAppraisedLandValue'] / merged_df_trim_filter01['TotalAppraisedLandValue_2024'],
-    np.nan
-)
-
-merged_df_trim_filter01['TotalAppraisedBuildingValue_percent'] = np.where(
-    merged_df_trim_filter01['TotalAppraisedBuildingValue_2024'] > 1,
-    merged_df_trim_filter01['TotalAppraisedBuildingValue'] / merged_df_trim_filter01['TotalAppraisedBuildingValue_2024'],
-    np.nan
-)
-
-merged_df_trim_filter01['Percent_TotalAppraisedValue_from_building'] = np.where(
-    merged_df_trim_filter01['TotalAppraisedBuildingValue_2024'] > 1,
-    merged_df_trim_filter01['TotalAppraisedBuildingValue'] / merged_df_trim_filter01['TotalAppraisedValue'],
-    np.nan
-)
+#excluding small zips
+EXCLUDED_ZIPS = [27312, 27515]
 
+# columns carried over from the base extract of a comparison
+BASE_COLUMNS = ['TotalAppraisedValue', 'TotalAppraisedLandValue', 'TotalAppraisedBuildingValue', 'TotalFinishedArea', 'LandArea']
 
-merged_df_trim_filter01
+# low cardinality text columns, kept as categoricals in memory. Parquet dictionary
+# encodes every column on disk, so Zip only needs to shrink to int32.
+CATEGORY_COLUMNS = ['BldgTypeDescription']
 
-# Save to compressed, fast format
-merged_df_trim_filter01.to_parquet('processed_data.parquet')  
+# rows per parquet row group; each group carries min/max statistics for every column
+ROW_GROUP_SIZE = 16_384
 
 
+def dedupe_extract(df, year):
+    # Removing duplicate rows based on 'ParcelID', keeping the first occurrence
+    df = df.drop_duplicates(subset=['ParcelID'], keep='first')
+    df.insert(0, 'Year', year)
+    return df
 
 
-#Creating second data set for the county visual
-# Your appraisal DataFrame
-df = merged_df_trim_filter01.copy()
+def normalize_extract(xlsx_path, year, columns=EXTRACT_COLUMNS):
+    # runs in a worker process: only the needed columns are read, and each workbook
+    # is parsed once into cache/extracts
+    return dedupe_extract(read_extract(xlsx_path, columns), year)
 
-#excluding small zips
-excluded_zips = [27312, 27515]
-df = df[~df["Zip"].isin(excluded_zips)]
 
-# Calculate average appraisal value per ZIP
-zip_avg = (
-    df.groupby("Zip")[["TotalAppraisedValue","TotalAppraisedValue_2024"]]
-    .median()
-    .reset_index()
-    .rename(columns={"Zip": "ZIP", "TotalAppraisedValue": "AvgAppraisalValue","TotalAppraisedValue_2024":"AvgAppraisalValue_2024"})
-)
-zip_avg["ZIP"] = zip_avg["ZIP"].astype('int')
+def build_long_table(*extracts):
+    # one row per parcel per year
+    return pd.concat(extracts, ignore_index=True)
 
 
-# Load NC ZIP GeoJSON (lightweight)
-geojson_url = "https://raw.githubusercontent.com/OpenDataDE/State-zip-code-GeoJSON/master/nc_north_carolina_zip_codes_geo.min.json"
-zip_shapes = gpd.read_file(geojson_url)
-zip_shapes["ZIP"] = zip_shapes["ZCTA5CE10"].astype('int')
+def merge_years(df_base, df_target, base, base_columns=BASE_COLUMNS):
+    #trimming down the base year to only include the key columns
+    df_base_trim = df_base[['ParcelID'] + base_columns].rename(
+        columns={column: f'{column}_{base}' for column in base_columns})
 
-# Merge your data with ZIP geometries
-zip_map = zip_shapes.merge(zip_avg, on="ZIP", how="right")
-zip_map = zip_map.dropna(subset=["geometry", "AvgAppraisalValue","AvgAppraisalValue_2024"])
+    # Removes tax exempt locations
+    df_target_trim = df_target[(df_target['TotalValueExemption'] == 0)].drop(columns='Year')
 
-# Load the county shapefile
-county_shapefile = '/Users/isaacdinner/Documents/orange_gis/tl_2023_us_county.shp'
-#df_2025 = pd.read_excel('/Users/isaacdinner/Documents/orange_gis/2025 Real Property Data Extract - Detailed - PRELIMINARY - 20250324.xlsx', engine='openpyxl')
+    # Merging the two dataframes
+    return pd.merge(df_base_trim, df_target_trim, on='ParcelID', how='left')
 
-counties = gpd.read_file(county_shapefile)
 
-# Filter to Orange County, NC (state FIPS: 37, county FIPS: 135)
-orange = counties[(counties["STATEFP"] == "37") & (counties["COUNTYFP"] == "135")]
+def filter_parcels(merged_df, base):
+    # Filtering out further invalid values or locations with no buildings
+    return merged_df[(merged_df[f'LandArea_{base}'] == merged_df['LandArea']) &
+        (merged_df[f'TotalFinishedArea_{base}'] == merged_df['TotalFinishedArea']) &
+        (merged_df[f'TotalAppraisedValue_{base}'] > 1) &
+        (merged_df[f'TotalAppraisedLandValue_{base}'] > 1) &
+        (merged_df[f'TotalAppraisedBuildingValue_{base}'] > 1)]
 
 
-zip_map.to_parquet('zip_map.parquet', index=False)
-orange.to_parquet('orange.parquet', index=False)
+def add_ratios(merged_df_trim_filter01, base):
+    merged_df_trim_filter01 = merged_df_trim_filter01.copy()
 
+    for value in ['TotalAppraisedValue', 'TotalAppraisedLandValue', 'TotalAppraisedBuildingValue']:
+        merged_df_trim_filter01[f'{value}_percent'] = np.where(
+            merged_df_trim_filter01[f'{value}_{base}'] > 1,
+            merged_df_trim_filter01[value] / merged_df_trim_filter01[f'{value}_{base}'],
+            np.nan
+        )
+
+    merged_df_trim_filter01['Percent_TotalAppraisedValue_from_building'] = np.where(
+        merged_df_trim_filter01[f'TotalAppraisedBuildingValue_{base}'] > 1,
+        merged_df_trim_filter01['TotalAppraisedBuildingValue'] / merged_df_trim_filter01['TotalAppraisedValue'],
+        np.nan
+    )
+    return merged_df_trim_filter01
+
+
+def zip_medians(merged_df_trim_filter01, excluded_zips, base):
+    #Creating second data set for the county visual
+    df = merged_df_trim_filter01[~merged_df_trim_filter01["Zip"].isin(excluded_zips)]
+
+    # Calculate average appraisal value per ZIP
+    zip_avg = (
+        df.groupby("Zip")[["TotalAppraisedValue", f"TotalAppraisedValue_{base}"]]
+        .median()
+        .reset_index()
+        .rename(columns={"Zip": "ZIP", "TotalAppraisedValue": "AvgAppraisalValue", f"TotalAppraisedValue_{base}": f"AvgAppraisalValue_{base}"})
+    )
+    zip_avg["ZIP"] = zip_avg["ZIP"].astype('int')
+    return zip_avg
+
+
+def load_zip_shapes(county, path):
+    # Load NC ZIP GeoJSON from the local copy, only the ZIPs inside the county's bounding box
+    # GeoJSON is always WGS 84, and the bbox has to be given in the file's CRS
+    bbox = tuple(county.to_crs(epsg=4326).total_bounds)
+    zip_shapes = gpd.read_file(path, bbox=bbox)
+    zip_shapes["ZIP"] = zip_shapes["ZCTA5CE10"].astype('int')
+    return zip_shapes
+
+
+def merge_zip_shapes(zip_shapes, zip_avg, base):
+    # Merge your data with ZIP geometries
+    zip_map = zip_shapes.merge(zip_avg, on="ZIP", how="right")
+    return zip_map.dropna(subset=["geometry", "AvgAppraisalValue", f"AvgAppraisalValue_{base}"])
+
+
+def load_county(shapefile, state_fips, county_fips):
+    # Load only the target county from the national shapefile; the attribute filter is
+    # evaluated by GDAL while reading, so the other ~3,200 counties are never built
+    counties = gpd.read_file(shapefile, where=f"STATEFP = '{state_fips}' AND COUNTYFP = '{county_fips}'")
+    return counties[(counties["STATEFP"] == state_fips) & (counties["COUNTYFP"] == county_fips)]
+
+
+def layer_files(path):
+    # a shapefile keeps its attributes (the PINs) in the .dbf and its CRS in the .prj,
+    # so a stage reading one is keyed on every part of it
+    stem, extension = os.path.splitext(path)
+    if extension.lower() != '.shp':
+        return [path]
+    parts = [stem + part for part in ['.shp', '.shx', '.dbf', '.prj', '.cpg']]
+    return [part for part in parts if os.path.exists(part)]
+
+
+def attach_centroids(parcels, centroids):
+    # x/y of each parcel's centroid, NaN for parcels missing from the parcel layer
+    return parcels.merge(centroids, on='ParcelID', how='left')
+
+
+def compact_dtypes(df):
+    # float32 ratios, 32-bit integers for whole-number areas, values and ZIPs, and
+    # categoricals for the repeated text columns. Depends only on the values: a table
+    # patched by --revise (Int32 columns of the last build concatenated with float64
+    # rows, which comes out as nullable Float64) gets the dtypes of a full build.
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORY_COLUMNS:
+            df[column] = values.astype('category')
+        elif column.endswith('_percent') or column.startswith('Percent_'):
+            df[column] = values.astype('float32')
+        elif pd.api.types.is_float_dtype(values) or isinstance(values.dtype, pd.Int32Dtype):
+            values = values.astype('float64')
+            present = values.dropna()
+            if len(present) and (present % 1 == 0).all() and present.abs().max() < 2**31:
+                values = values.astype('Int32')
+            df[column] = values
+    return df
+
+
+def write_processed(df, path):
+    # sorted by ParcelID so the row group statistics can skip straight to a PIN
+    df = compact_dtypes(df).sort_values('ParcelID', ignore_index=True)
+    df.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+    return df
+
+
+def run_pair(cache, base, target, engine='pandas'):
+    # change ratios between any two extracts
+    name = f'{base}_{target}'
+    if engine == 'duckdb':
+        cache.run(f'ratios_{name}', write_ratios, inputs=[f'extract_{base}', f'extract_{target}'],
+                  params={'base': base, 'base_columns': BASE_COLUMNS}, to_file=True)
+        return f'ratios_{name}'
+    cache.run(f'merge_{name}', merge_years, inputs=[f'extract_{base}', f'extract_{target}'],
+              params={'base': base, 'base_columns': BASE_COLUMNS})
+    cache.run(f'filter_{name}', filter_parcels, inputs=[f'merge_{name}'], params={'base': base})
+    cache.run(f'ratios_{name}', add_ratios, inputs=[f'filter_{name}'], params={'base': base})
+    return f'ratios_{name}'
+
+
+def run_geo(cache, profiler, args):
+    # the county outline and the ZIP shapes around it
+    cache.run('county', load_county, files=layer_files(COUNTY_SHAPEFILE),
+              params={'shapefile': COUNTY_SHAPEFILE, 'state_fips': STATE_FIPS, 'county_fips': args.county})
+
+    # the ZIP GeoJSON is downloaded once into cache/geo and re-fetched only on --refresh-geo
+    with profiler.stage('download_zip_geojson'):
+        zip_geojson = cached_download(ZIP_GEOJSON_URL, refresh=args.refresh_geo)
+    cache.run('zip_shapes', load_zip_shapes, inputs=['county'], files=[zip_geojson], params={'path': zip_geojson})
+
+
+def write_artifacts(cache, profiler, processed):
+    # everything derived from processed_data.parquet
+    with profiler.stage('shared_data') as stage:
+        stage['rows'] = write_shared(processed).num_rows
+    with profiler.stage('pin_index') as stage:
+        stage['rows'] = len(build_pin_index(processed))
+    # only when some ParcelID matched a parcel layer PIN; otherwise the files of an
+    # earlier build are removed, so the app doesn't show them for this one
+    if 'x' in processed.columns and processed['x'].notna().any():
+        with profiler.stage('neighbor_index') as stage:
+            stage['rows'] = len(build_neighbor_index(processed).tree_rows)
+        with profiler.stage('raster_grids') as stage:
+            stage['rows'] = len(build_raster_grids(processed))
+    else:
+        if 'x' in processed.columns:
+            print(f'no ParcelID matched a {PARCEL_PIN_FIELD} of {PARCEL_LAYER}, skipping the neighbor index and grids')
+        shutil.rmtree(NEIGHBOR_DIR, ignore_errors=True)
+        if os.path.exists(RASTER_PATH):
+            os.remove(RASTER_PATH)
+    with profiler.stage('summary') as stage:
+        summary = build_summary(processed)
+        write_summary(summary)
+        stage['rows'] = summary['rows']
+    # segment statistics, counted in the bins of the county histograms just written. The
+    # slowest artifact, so it is cached on the contents of processed_data.parquet and the
+    # bins: an unchanged rebuild reuses it, a --revise that changed parcels rebuilds it,
+    # as its deciles and quantiles are over the whole county.
+    cache.run('segment_cube', write_segment_cube, files=['processed_data.parquet'],
+              params={'processed_path': 'processed_data.parquet', 'histograms': summary['histograms']}, to_file=True)
+    with profiler.stage('write_segment_cube'):
+        shutil.copyfile(cache.paths['segment_cube'], SEGMENTS_PATH)
+
+
+def publish(cache, profiler, args, processed):
+    # the app's one file bundle of the outputs above, then the same outputs again in the
+    # county/ZIP partitioned dataset, which the app serves every processed county from
+    county = cache.get('county').iloc[0]
+    county_name = county.get('NAMELSAD', county['NAME'])
+    with profiler.stage('app_bundle'):
+        build_app_bundle(artifact_paths(), county_name)
+    with profiler.stage('write_dataset') as stage:
+        write_parcels(processed, STATE_FIPS + args.county)
+        publish_county(STATE_FIPS + args.county, county_name)
+        stage['rows'] = len(processed)
+
+
+def revise(cache, profiler, args, pairs):
+    # Delta mode: the revised extract is diffed against its rows in parcels_long.parquet
+    # from the last build, the ratios are recomputed for the inserted, updated and
+    # removed ParcelIDs only, and the outputs are patched instead of rebuilt.
+    year, path = args.revise.split('=', 1)
+    if not any(year in pair for pair in pairs):
+        raise SystemExit(f'{year} is not part of any --pair')
+    if not os.path.exists('parcels_long.parquet'):
+        raise SystemExit('parcels_long.parquet not found, run a full build before --revise')
+
+    with profiler.stage('diff_extract') as stage:
+        revised = normalize_extract(path, year, EXTRACT_COLUMNS)
+        long_table = pd.read_parquet('parcels_long.parquet')
+        previous = long_table[long_table['Year'] == year]
+        diff = diff_extract(previous, revised, [column for column in revised.columns if column not in ('Year', 'ParcelID')])
+        changed = changed_ids(diff)
+        stage['rows'] = len(changed)
+    print(f"{year}: {len(diff['inserted']):,} inserted, {len(diff['updated']):,} updated, "
+          f"{len(diff['removed']):,} removed of {len(revised):,} parcels")
+    if not len(changed):
+        return
+
+    # the other years are taken from the same build, which may itself have been revised
+    with profiler.stage('write_parcels_long') as stage:
+        years = list(dict.fromkeys(long_table['Year'].tolist() + [year]))
+        frames = {y: revised if y == year else long_table[long_table['Year'] == y] for y in years}
+        long_table = build_long_table(*frames.values())
+        long_table.to_parquet('parcels_long.parquet', index=False)
+        stage['rows'] = len(long_table)
+
+    processed = None
+    for i, (base, target) in enumerate(pairs):
+        if year not in (base, target):
+            continue
+        out_path = 'processed_data.parquet' if i == 0 else f'ratios_{base}_{target}.parquet'
+        with profiler.stage(f'patch_{base}_{target}') as stage:
+            rows = merge_years(frames[base][frames[base]['ParcelID'].isin(changed)],
+                               frames[target][frames[target]['ParcelID'].isin(changed)], base, BASE_COLUMNS)
+            rows = add_ratios(filter_parcels(rows, base), base)
+            table = pd.read_parquet(out_path)
+            if 'x' in table.columns:
+                if not os.path.exists(PARCEL_LAYER):
+                    raise SystemExit(f'{out_path} has parcel centroids but {PARCEL_LAYER} is missing, run a full build')
+                cache.run('centroids', parcel_centroids, files=layer_files(PARCEL_LAYER),
+                          params={'parcel_layer': PARCEL_LAYER, 'pin_field': PARCEL_PIN_FIELD})
+                rows = attach_centroids(rows, cache.get('centroids'))
+            patched = write_processed(patch_rows(table, changed, rows), out_path)
+            stage['rows'] = len(rows)
+        if i == 0:
+            processed, zips, base_year = patched, affected_zips(table, changed, rows), base
+    if processed is None:
+        return
+
+    write_artifacts(cache, profiler, processed)
+
+    # only the ZIPs the changed parcels were or now are in get a new median
+    run_geo(cache, profiler, args)
+    with profiler.stage('patch_zip_map') as stage:
+        in_zips = processed[processed['Zip'].isin(zips)]
+        value_columns = ['TotalAppraisedValue', f'TotalAppraisedValue_{base_year}']
+        zip_avg = zip_medians(in_zips.astype({column: 'float64' for column in value_columns}), EXCLUDED_ZIPS, base_year)
+        zip_map = gpd.read_parquet('zip_map.parquet')
+        updated = merge_zip_shapes(cache.get('zip_shapes'), zip_avg, base_year)
+        zip_map = pd.concat([zip_map[~zip_map['ZIP'].isin(zips)], updated.to_crs(zip_map.crs)]).sort_values('ZIP', ignore_index=True)
+        zip_map.to_parquet('zip_map.parquet', index=False)
+        stage['rows'] = len(zips)
+    with profiler.stage('write_tiers'):
+        write_tiers(build_zip_tiers(zip_map, base_year), ZIP_TIERS_PATH)
+
+    publish(cache, profiler, args, processed)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the parcel tables behind app.py')
+    parser.add_argument('--extract', action='append', metavar='YEAR=PATH',
+                        help='yearly extract to load, repeatable (default: the 2024 and 2025 extracts)')
+    parser.add_argument('--pair', action='append', nargs=2, metavar=('BASE', 'TARGET'),
+                        help='years to compare, repeatable; the first pair feeds the app (default: 2024 2025)')
+    parser.add_argument('--refresh-geo', action='store_true', help='download the ZIP geometry again instead of using cache/geo')
+    parser.add_argument('--county', default=COUNTY_FIPS, metavar='FIPS',
+                        help=f'three digit county FIPS code within state {STATE_FIPS} (default: {COUNTY_FIPS}, Orange)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes used to load the extracts')
+    parser.add_argument('--engine', choices=['pandas', 'duckdb'], default='pandas',
+                        help='duckdb runs the extract, merge, filter, ratio, ZIP median and processed table stages out of core '
+                             'with bounded memory; the artifacts are still built in memory')
+    parser.add_argument('--revise', metavar='YEAR=PATH',
+                        help='patch the last build for a revised extract of YEAR instead of rebuilding everything')
+    parser.add_argument('--profile', metavar='PATH', default=os.environ.get(PROFILE_ENV),
+                        help=f'write per-stage wall time, CPU time, peak RSS and row counts to PATH as JSON (or set {PROFILE_ENV})')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    extracts = dict(item.split('=', 1) for item in args.extract) if args.extract else EXTRACTS
+    pairs = [tuple(pair) for pair in args.pair] if args.pair else PAIRS
+    for year in {year for pair in pairs for year in pair}:
+        if year not in extracts:
+            raise SystemExit(f'no extract given for year {year}')
+
+    # Every stage is cached under cache/stages, keyed on the input file hashes, the
+    # stage parameters and the source of the stage and its helpers. The constants a
+    # stage depends on are passed as parameters, so editing e.g. EXCLUDED_ZIPS only
+    # re-runs zip_medians and zip_map.
+    profiler = Profiler(enabled=bool(args.profile), label='preprocess')
+    cache = StageCache(profiler=profiler)
+
+    if args.revise:
+        revise(cache, profiler, args, pairs)
+        if args.profile:
+            profiler.write(args.profile)
+        return
+
+    # the extracts are independent of each other, so each one is parsed and normalized
+    # in its own worker process. With --engine duckdb these stages, the long table, the
+    # ratios, the ZIP medians and the processed_data.parquet write are DuckDB queries
+    # between parquet files and never held in pandas.
+    out_of_core = args.engine == 'duckdb'
+    cache.run_parallel([
+        (f'extract_{year}', write_deduped_extract if out_of_core else normalize_extract,
+         [path], {'xlsx_path': path, 'year': year, 'columns': EXTRACT_COLUMNS})
+        for year, path in extracts.items()
+    ], max_workers=args.workers, to_file=out_of_core)
+    cache.run('parcels_long', write_long_table if out_of_core else build_long_table,
+              inputs=[f'extract_{year}' for year in extracts], to_file=out_of_core)
+    with profiler.stage('write_parcels_long'):
+        shutil.copyfile(cache.paths['parcels_long'], 'parcels_long.parquet')
+
+    ratio_stages = [run_pair(cache, base, target, args.engine) for base, target in pairs]
+    for (base, target), stage in list(zip(pairs, ratio_stages))[1:]:
+        if out_of_core:
+            write_processed_table(cache.paths[stage], f'ratios_{base}_{target}.parquet',
+                                  category_columns=CATEGORY_COLUMNS, row_group_size=ROW_GROUP_SIZE)
+        else:
+            write_processed(cache.get(stage), f'ratios_{base}_{target}.parquet')
+
+    base, target = pairs[0]
+    cache.run('zip_medians', write_zip_medians if out_of_core else zip_medians, inputs=[ratio_stages[0]],
+              params={'excluded_zips': EXCLUDED_ZIPS, 'base': base}, to_file=out_of_core)
+    run_geo(cache, profiler, args)
+    cache.run('zip_map', merge_zip_shapes, inputs=['zip_shapes', 'zip_medians'], params={'base': base})
+
+    # Save to compressed, fast format
+    # parcel centroids for the neighbor comparison, when the parcel layer is available
+    processed_stage = ratio_stages[0]
+    located = os.path.exists(PARCEL_LAYER)
+    if located:
+        cache.run('centroids', parcel_centroids, files=layer_files(PARCEL_LAYER),
+                  params={'parcel_layer': PARCEL_LAYER, 'pin_field': PARCEL_PIN_FIELD})
+        if not out_of_core:
+            cache.run('located', attach_centroids, inputs=[processed_stage, 'centroids'])
+            processed_stage = 'located'
+    else:
+        print(f'{PARCEL_LAYER} not found, skipping the neighbor index')
+
+    # with duckdb the centroids are joined, the table sorted and compacted in DuckDB, and
+    # only the compacted result is read back for the artifacts below
+    with profiler.stage('write_processed') as stage:
+        if out_of_core:
+            write_processed_table(cache.paths[processed_stage], 'processed_data.parquet',
+                                  centroids_path=cache.paths['centroids'] if located else None,
+                                  category_columns=CATEGORY_COLUMNS, row_group_size=ROW_GROUP_SIZE)
+            processed = pd.read_parquet('processed_data.parquet')
+        else:
+            processed = write_processed(cache.get(processed_stage), 'processed_data.parquet')
+        stage['rows'] = len(processed)
+    write_artifacts(cache, profiler, processed)
+    with profiler.stage('write_maps'):
+        cache.get('zip_map').to_parquet('zip_map.parquet', index=False)
+        cache.get('county').to_parquet('orange.parquet', index=False)
+
+    # the maps are drawn from these: projected, simplified, with outlines and label points
+    cache.run('zip_tiers', build_zip_tiers, inputs=['zip_map'], params={'base': base})
+    cache.run('county_tiers', build_county_tiers, inputs=['county'])
+    with profiler.stage('write_tiers'):
+        write_tiers(cache.get('zip_tiers'), ZIP_TIERS_PATH)
+        write_tiers(cache.get('county_tiers'), COUNTY_TIERS_PATH)
+
+    publish(cache, profiler, args, processed)
+
+    if args.profile:
+        profiler.write(args.profile)
+        print(f'stage timings written to {args.profile}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# multi-resolution grids of the median change ratios of the parcels in each cell
+# raster_grids.py
+#
+# The parcel centroids are binned once, at every cell size, into square cells of the
+# map CRS aligned on multiples of the cell size, so the grids of neighbouring counties
+# line up. Only cells with parcels are stored; the app turns one level into an image
+# whose size depends on the map extent and cell size, never on the parcel count.
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from geo_tiers import MAP_CRS
+from neighbors import PARCEL_CRS
+from pin_index import RATIO_COLUMNS
+
+
+RASTER_PATH = 'raster_grids.parquet'
+
+# cell sizes in map metres, coarsest first
+CELL_SIZES = [4000, 2000, 1000, 500, 250, 125]
+
+# the default level is the finest whose typical cell still holds this many parcels,
+# so a median isn't mostly one parcel's ratio
+MIN_CELL_PARCELS = 5
+
+
+def map_xy(df):
+    # parcel centroids (x / y in PARCEL_CRS, from neighbors.parcel_centroids) in MAP_CRS;
+    # NaN where the parcel wasn't in the parcel layer
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs(PARCEL_CRS, MAP_CRS, always_xy=True)
+    x, y = transformer.transform(df['x'].to_numpy(dtype='float64', na_value=np.nan),
+                                 df['y'].to_numpy(dtype='float64', na_value=np.nan))
+    return np.asarray(x), np.asarray(y)
+
+
+def build_grids(df, cell_sizes=CELL_SIZES):
+    # one row per occupied cell and cell size: cell column / row (ix, iy), parcel count
+    # and the median of each ratio column
+    x, y = map_xy(df)
+    located = ~(np.isnan(x) | np.isnan(y))
+    ratios = df.loc[located, RATIO_COLUMNS].astype('float64').reset_index(drop=True)
+    x, y = x[located], y[located]
+
+    levels = []
+    for cell_size in cell_sizes:
+        cells = ratios.assign(ix=np.floor(x / cell_size).astype('int32'), iy=np.floor(y / cell_size).astype('int32'))
+        grouped = cells.groupby(['ix', 'iy'], sort=True)
+        level = grouped[RATIO_COLUMNS].median().astype('float32')
+        level.insert(0, 'parcels', grouped.size().astype('int32'))
+        levels.append(level.reset_index().assign(cell_size=np.int32(cell_size)))
+    grids = pd.concat(levels, ignore_index=True)
+    meta = {
+        'crs': MAP_CRS,
+        'cell_sizes': list(cell_sizes),
+        'median_parcels': {str(size): float(level['parcels'].median()) if len(level) else 0.0
+                           for size, level in zip(cell_sizes, levels)},
+    }
+    return grids, meta
+
+
+def write_grids(grids, meta, path=RASTER_PATH):
+    table = pa.Table.from_pandas(grids, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'rasters': json.dumps(meta).encode()})
+    pq.write_table(table, path)
+
+
+class RasterGrids:
+    # every level of the grids, held per cell size
+
+    def __init__(self, grids, meta):
+        self.cell_sizes = meta['cell_sizes']
+        self.median_parcels = {int(size): parcels for size, parcels in meta['median_parcels'].items()}
+        self.levels = {int(size): level.reset_index(drop=True) for size, level in grids.groupby('cell_size')}
+
+    @classmethod
+    def read(cls, path=RASTER_PATH):
+        table = pq.read_table(path)
+        return cls(table.to_pandas(), json.loads(table.schema.metadata[b'rasters']))
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels.values())
+
+    def default_cell_size(self):
+        dense = [size for size in self.cell_sizes if self.median_parcels.get(size, 0) >= MIN_CELL_PARCELS]
+        return min(dense) if dense else max(self.cell_sizes)
+
+    def image(self, cell_size, column):
+        # the level as a dense array (row 0 at the bottom, NaN for empty cells) and its
+        # extent (left, right, bottom, top) in map metres, ready for imshow(origin='lower');
+        # None when no parcel was binned at this cell size
+        level = self.levels.get(cell_size)
+        if level is None or not len(level):
+            return None
+        ix, iy = level['ix'].to_numpy(), level['iy'].to_numpy()
+        x0, x1, y0, y1 = int(ix.min()), int(ix.max()) + 1, int(iy.min()), int(iy.max()) + 1
+        image = np.full((y1 - y0, x1 - x0), np.nan, dtype='float32')
+        image[iy - y0, ix - x0] = level[column].to_numpy()
+        extent = [float(x0 * cell_size), float(x1 * cell_size), float(y0 * cell_size), float(y1 * cell_size)]
+        return image, extent
+
+
+def build_raster_grids(df, path=RASTER_PATH):
+    grids, meta = build_grids(df)
+    write_grids(grids, meta, path)
+    return RasterGrids(grids, meta)
@@ -0,0 +1,198 @@
+# precomputed ZIP x building type x value decile x year built cube of the change ratios
+# segments.py
+#
+# One row per segment with an 'All' level on every dimension (a full data cube), so
+# any combination of single-value filters is one dict lookup instead of a scan of
+# the parcel table. Each row has the parcel count and, per ratio column, the summary
+# table statistics and the counts in the county histogram's bins.
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from distributions import HISTOGRAM_COLUMNS
+
+
+SEGMENTS_PATH = 'segment_cube.parquet'
+
+# level of a dimension that isn't filtered on, and of parcels missing the value
+ALL = 'All'
+UNKNOWN = 'Unknown'
+
+DIMENSIONS = ['Zip', 'BldgTypeDescription', 'ValueDecile', 'YearBuiltBand']
+
+# columns the cube is built from
+SEGMENT_COLUMNS = ['Zip', 'BldgTypeDescription', 'TotalAppraisedValue', 'YearBuilt'] + HISTOGRAM_COLUMNS
+
+# deciles of the current appraised value
+DECILES = 10
+
+# year built bands: first year of each band after the first
+YEAR_BANDS = [1950, 1970, 1990, 2010]
+
+# statistics per ratio column, named as in distributions.summary_stats
+STATS = {'mean': 'Mean', 'p25': '25th Percentile', 'p50': 'Median', 'p75': '75th Percentile'}
+
+
+def _year_band_labels():
+    labels = [f'Before {YEAR_BANDS[0]}']
+    labels += [f'{start}–{end - 1}' for start, end in zip(YEAR_BANDS[:-1], YEAR_BANDS[1:])]
+    return labels + [f'{YEAR_BANDS[-1]} and later']
+
+
+def _with_unknown(labels, levels):
+    labels = labels.astype('string').fillna(UNKNOWN)
+    return labels, levels + ([UNKNOWN] if (labels == UNKNOWN).any() else [])
+
+
+def segment_labels(df):
+    # the four dimension labels of every parcel, and the levels of each in display order
+    labels, levels = {}, {}
+
+    zips = df['Zip'].astype('Float64')
+    labels['Zip'], levels['Zip'] = _with_unknown(
+        zips.astype('Int64').astype('string'), [str(int(z)) for z in sorted(zips.dropna().unique())])
+
+    # most common building types first
+    types = df['BldgTypeDescription'].astype('string')
+    labels['BldgTypeDescription'], levels['BldgTypeDescription'] = _with_unknown(
+        types, types.value_counts().index.tolist())
+
+    values = df['TotalAppraisedValue'].astype('float64')
+    deciles, edges = pd.qcut(values, DECILES, labels=False, retbins=True, duplicates='drop')
+    decile_levels = [f'{i + 1}: ${low:,.0f} – ${high:,.0f}' for i, (low, high) in enumerate(zip(edges[:-1], edges[1:]))]
+    labels['ValueDecile'], levels['ValueDecile'] = _with_unknown(
+        pd.Series(pd.Categorical.from_codes(deciles.fillna(-1).astype(int), decile_levels), index=df.index), decile_levels)
+
+    band_levels = _year_band_labels()
+    years = df['YearBuilt'].astype('float64') if 'YearBuilt' in df.columns else pd.Series(np.nan, index=df.index)
+    bands = pd.cut(years.where(years > 0), [-np.inf] + YEAR_BANDS + [np.inf], right=False, labels=band_levels)
+    labels['YearBuiltBand'], levels['YearBuiltBand'] = _with_unknown(pd.Series(bands, index=df.index), band_levels)
+
+    return pd.DataFrame(labels)[DIMENSIONS], levels
+
+
+def _bin_index(values, hist):
+    # bin of each value in the county histogram, -1 outside its trim bounds (or NaN)
+    edges = np.asarray(hist['edges'])
+    inside = (values >= hist['lower']) & (values <= hist['upper'])
+    bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+    return np.where(inside, bins, -1)
+
+
+def build_cube(df, histograms):
+    # histograms: the county histograms from distributions.build_summary, whose bins
+    # every segment is counted in, so a segment can be drawn against the county
+    labels, levels = segment_labels(df)
+    ratios = df[HISTOGRAM_COLUMNS].astype('float64')
+    bins = {column: _bin_index(ratios[column].to_numpy(), histograms[column]) for column in HISTOGRAM_COLUMNS}
+
+    # each dimension as integer codes with ALL as its last level, so a segment is one
+    # mixed radix int64 instead of a tuple of labels
+    dimension_codes, dimension_levels = [], []
+    for dimension in DIMENSIONS:
+        codes, uniques = pd.factorize(labels[dimension])
+        dimension_codes.append(codes.astype('int64'))
+        dimension_levels.append(np.append(np.asarray(uniques, dtype=object), ALL))
+
+    parts = []
+    for rolled_up in itertools.product([False, True], repeat=len(DIMENSIONS)):
+        key = np.zeros(len(labels), dtype='int64')
+        for codes, names, rolled in zip(dimension_codes, dimension_levels, rolled_up):
+            key = key * len(names) + (len(names) - 1 if rolled else codes)
+        cell_keys, codes = np.unique(key, return_inverse=True)
+        n_cells = len(cell_keys)
+        grouped = ratios.groupby(codes)
+        quantiles = grouped.quantile([0.25, 0.5, 0.75])
+
+        part = {}
+        for dimension, names in reversed(list(zip(DIMENSIONS, dimension_levels))):
+            part[dimension] = names[cell_keys % len(names)]
+            cell_keys = cell_keys // len(names)
+        part = pd.DataFrame({dimension: part[dimension] for dimension in DIMENSIONS})
+        part['parcels'] = np.bincount(codes, minlength=n_cells)
+        means = grouped.mean()
+        counts = grouped.count()
+        for column in HISTOGRAM_COLUMNS:
+            part[f'{column}_count'] = counts[column].to_numpy()
+            part[f'{column}_mean'] = means[column].to_numpy()
+            for stat, q in [('p25', 0.25), ('p50', 0.5), ('p75', 0.75)]:
+                part[f'{column}_{stat}'] = quantiles[column].xs(q, level=1).to_numpy()
+            n_bins = len(histograms[column]['counts'])
+            kept = bins[column] >= 0
+            hist = np.bincount(codes[kept] * n_bins + bins[column][kept], minlength=n_cells * n_bins)
+            part[f'{column}_hist'] = list(hist.reshape(n_cells, n_bins).astype('int32'))
+        parts.append(part)
+
+    cube = pd.concat(parts, ignore_index=True)
+    meta = {'levels': levels, 'edges': {column: histograms[column]['edges'] for column in HISTOGRAM_COLUMNS}}
+    return cube, meta
+
+
+def write_cube(cube, meta, path=SEGMENTS_PATH):
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'segments': json.dumps(meta).encode()})
+    pq.write_table(table, path)
+
+
+class SegmentCube:
+    # the cube held as one array per statistic, with a dict from the dimension labels
+    # of each row to its position
+
+    def __init__(self, cube, meta):
+        self.levels = meta['levels']
+        self.edges = {column: np.asarray(edges) for column, edges in meta['edges'].items()}
+        self.positions = {key: i for i, key in enumerate(cube[DIMENSIONS].itertuples(index=False, name=None))}
+        self.parcels = cube['parcels'].to_numpy()
+        self.stats = {column: cube[column].to_numpy() for column in cube.columns
+                      if column not in DIMENSIONS and not column.endswith('_hist')}
+        self.hists = {column: np.stack(cube[f'{column}_hist'].to_numpy()) for column in HISTOGRAM_COLUMNS}
+
+    @classmethod
+    def read(cls, path=SEGMENTS_PATH):
+        table = pq.read_table(path)
+        return cls(table.to_pandas(), json.loads(table.schema.metadata[b'segments']))
+
+    @classmethod
+    def from_frame(cls, df, histograms):
+        return cls(*build_cube(df, histograms))
+
+    def __len__(self):
+        return len(self.parcels)
+
+    def cell(self, selection, column):
+        # parcel count, statistics and bin counts of one segment for one ratio column, or
+        # None if no parcel falls in it. selection: {dimension: level}, missing ones are All
+        position = self.positions.get(tuple(selection.get(dimension, ALL) for dimension in DIMENSIONS))
+        if position is None:
+            return None
+        return {
+            'parcels': int(self.parcels[position]),
+            'count': int(self.stats[f'{column}_count'][position]),
+            'stats': {label: float(self.stats[f'{column}_{stat}'][position]) for stat, label in STATS.items()},
+            'counts': self.hists[column][position],
+            'edges': self.edges[column],
+        }
+
+    def largest(self, dimension, selection, column, n):
+        # the n levels of one dimension with the most parcels within the other filters
+        cells = [(level, self.cell({**selection, dimension: level}, column)) for level in self.levels[dimension]]
+        cells = [(level, cell) for level, cell in cells if cell is not None and cell['count']]
+        return sorted(cells, key=lambda item: -item[1]['count'])[:n]
+
+
+def write_segment_cube(processed_path, histograms, out_path=SEGMENTS_PATH):
+    # the cube of a processed parquet file, reading only the columns it is built from;
+    # a file stage of preprocess.py's StageCache
+    names = pq.read_schema(processed_path).names
+    df = pd.read_parquet(processed_path, columns=[column for column in SEGMENT_COLUMNS if column in names])
+    write_cube(*build_cube(df, histograms), out_path)
+
+
+def build_segment_cube(df, histograms, path=SEGMENTS_PATH):
+    cube, meta = build_cube(df, histograms)
+    write_cube(cube, meta, path)
+    return SegmentCube(cube, meta)
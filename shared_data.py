@@ -0,0 +1,55 @@
+# read-only Arrow copy of the parcel columns the app uses, memory mapped and shared
+# by every session of a process
+# shared_data.py
+#
+# Parquet is compressed and encoded, so every read decodes into fresh memory. An
+# uncompressed Arrow IPC file holds the columns in their in-memory layout: mapping it
+# costs nothing up front, pages are read on first touch, and every session (and every
+# app process on the host) uses the same physical pages through the page cache.
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+
+SHARED_PATH = 'processed_data.arrow'
+
+# columns the page uses, the rest of processed_data.parquet is never read
+APP_COLUMNS = [
+    'ParcelID',
+    'TotalAppraisedValue',
+    'TotalAppraisedBuildingValue',
+    'TotalAppraisedLandValue',
+    'TotalAppraisedValue_percent',
+    'TotalAppraisedBuildingValue_percent',
+    'TotalAppraisedLandValue_percent',
+    'BldgTypeDescription',
+    'Zip',
+]
+
+
+def write_shared(df, path=SHARED_PATH, columns=APP_COLUMNS):
+    # one record batch per column, with categoricals stored as plain strings so every
+    # column can be used in place. Written under a temporary name and renamed, so an
+    # app that has the old file mapped keeps reading a consistent copy.
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    table = table.combine_chunks()
+    temporary = f'{path}.tmp'
+    with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temporary, path)
+    return table
+
+
+def map_shared(path=SHARED_PATH):
+    # the table's buffers point into the mapping, nothing is read here
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def shared_frame(table):
+    # pandas view of an Arrow table without a copy: every column stays an Arrow array
+    # (ArrowDtype). Read only, like the file under it.
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,254 @@
+# content-hashed cache for the preprocess stages
+# stage_cache.py
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from instrument import Profiler
+
+
+CACHE_DIR = 'cache/stages'
+
+# file hashes are remembered by size and mtime so unchanged workbooks are not re-read
+HASH_INDEX = 'cache/file_hashes.json'
+
+
+def file_hash(path, index_path=HASH_INDEX):
+    stat = os.stat(path)
+    stamp = f'{stat.st_size}:{stat.st_mtime_ns}'
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    entry = index.get(os.path.abspath(path))
+    if entry and entry['stamp'] == stamp:
+        return entry['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    index[os.path.abspath(path)] = {'stamp': stamp, 'sha256': digest.hexdigest()}
+    # written whole and renamed, as the extract workers may hash at the same time
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    return digest.hexdigest()
+
+
+# functions and classes defined under this directory are followed into by code_hash;
+# library code is left to the installed versions
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _in_project(obj):
+    try:
+        path = inspect.getsourcefile(obj)
+    except TypeError:
+        return False
+    return path is not None and os.path.abspath(path).startswith(PROJECT_DIR + os.sep)
+
+
+def _code_names(code):
+    # global names read by a function, including those of its lambdas and comprehensions
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _items(value):
+    # the values inside a module constant, e.g. the converter functions of a dict
+    if isinstance(value, dict):
+        return [item for pair in value.items() for part in pair for item in _items(part)]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [item for part in value for item in _items(part)]
+    return [value]
+
+
+def _constant_repr(value):
+    # module constants and default arguments; sets are sorted, as their order changes
+    # between interpreter runs, functions are named, and other objects whose repr is
+    # their address are reduced to their type
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{_constant_repr(key)}: {_constant_repr(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_constant_repr(item) for item in value) + ']'
+    if isinstance(value, (set, frozenset)):
+        return '{' + ', '.join(sorted(_constant_repr(item) for item in value)) + '}'
+    if inspect.isfunction(value) or inspect.isclass(value):
+        return f'{value.__module__}.{value.__qualname__}'
+    text = repr(value)
+    return type(value).__name__ if ' at 0x' in text else text
+
+
+def _dependencies(obj, seen):
+    # source of obj and of the project functions and classes it reads by global name,
+    # followed transitively, plus the values of the module constants and defaults they read
+    if id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    parts = [inspect.getsource(obj)]
+    functions = [member for member in vars(obj).values() if inspect.isfunction(member)] if inspect.isclass(obj) else [obj]
+    for function in functions:
+        values = [('default', value) for value in function.__defaults__ or ()]
+        values += [('default', value) for value in (function.__kwdefaults__ or {}).values()]
+        values += [(name, function.__globals__[name]) for name in sorted(_code_names(function.__code__))
+                   if name in function.__globals__]
+        for name, value in values:
+            if inspect.ismodule(value):
+                continue
+            if not (inspect.isfunction(value) or inspect.isclass(value)):
+                if callable(value):
+                    # library callables, e.g. np.where
+                    continue
+                parts.append(f'{name}={_constant_repr(value)}')
+            for item in _items(value):
+                if (inspect.isfunction(item) or inspect.isclass(item)) and _in_project(item):
+                    parts += _dependencies(item, seen)
+    return parts
+
+
+def code_hash(fn):
+    # hash of the stage function's source, the source of the project functions it calls
+    # (transitively) and the module constants they read, so editing a stage or any helper
+    # it relies on re-runs it; functions without source fall back to their qualified name
+    try:
+        if not _in_project(fn):
+            raise TypeError
+        source = '\n'.join(_dependencies(fn, set()))
+    except (OSError, TypeError):
+        source = f'{getattr(fn, "__module__", "")}.{getattr(fn, "__qualname__", repr(fn))}'
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def _write_frame(frame, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    frame.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def _write_file(fn, upstream_paths, params, path):
+    # for stages that write their own parquet file instead of returning a frame
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fn(*upstream_paths, out_path=path + '.tmp', **params)
+    os.replace(path + '.tmp', path)
+
+
+def _run_to_path(fn, params, path, to_file=False):
+    # executed in a worker process, the result goes straight to disk instead of
+    # being pickled back to the parent
+    if to_file:
+        _write_file(fn, [], params, path)
+    else:
+        _write_frame(fn(**params), path)
+    return path
+
+
+def _read_frame(path):
+    # GeoDataFrames are written as GeoParquet, which carries a 'geo' schema entry
+    metadata = pq.read_schema(path).metadata or {}
+    if b'geo' in metadata:
+        import geopandas as gpd
+        return gpd.read_parquet(path)
+    return pd.read_parquet(path)
+
+
+class StageCache:
+    # Each stage's key hashes its name, the source of its function and its helpers, its parameters, the
+    # hashes of any input files and the keys of the stages it reads from. Changing one stage therefore only
+    # changes the keys, and re-runs, of the stages downstream of it.
+
+    def __init__(self, cache_dir=CACHE_DIR, verbose=True, profiler=None):
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.profiler = profiler or Profiler(enabled=False)
+        self.keys = {}
+        self.frames = {}
+        self.paths = {}
+
+    def key(self, name, inputs=(), files=(), params=None, fn=None):
+        payload = {
+            'stage': name,
+            'code': code_hash(fn) if fn is not None else None,
+            'inputs': [self.keys[upstream] for upstream in inputs],
+            'files': [file_hash(path) for path in files],
+            'params': params or {},
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+    def get(self, name):
+        if name not in self.frames:
+            self.frames[name] = _read_frame(self.paths[name])
+        return self.frames[name]
+
+    def run(self, name, fn, inputs=(), files=(), params=None, to_file=False):
+        # With to_file the stage is called with the parquet paths of its upstream stages
+        # and an out_path to write to, so neither side is loaded into memory here.
+        key = self.key(name, inputs, files, params, fn)
+        path = os.path.join(self.cache_dir, f'{name}-{key}.parquet')
+        self.keys[name] = key
+        self.paths[name] = path
+
+        cached = os.path.exists(path)
+        with self.profiler.stage(name, cached=cached) as stage:
+            if cached:
+                if self.verbose:
+                    print(f'[cached] {name}')
+                self.frames.pop(name, None)
+                if self.profiler.enabled:
+                    stage['rows'] = pq.read_metadata(path).num_rows
+                return key
+
+            if self.verbose:
+                print(f'[run]    {name}')
+            if to_file:
+                _write_file(fn, [self.paths[upstream] for upstream in inputs], params or {}, path)
+                self.frames.pop(name, None)
+                if self.profiler.enabled:
+                    stage['rows'] = pq.read_metadata(path).num_rows
+                return key
+            frame = fn(*[self.get(upstream) for upstream in inputs], **(params or {}))
+            _write_frame(frame, path)
+            self.frames[name] = frame
+            stage['rows'] = len(frame)
+        return key
+
+    def run_parallel(self, stages, max_workers=None, to_file=False):
+        # stages is a list of (name, fn, files, params) without upstream inputs; the ones
+        # missing from the cache run side by side in worker processes
+        pending = []
+        for name, fn, files, params in stages:
+            key = self.key(name, files=files, params=params, fn=fn)
+            path = os.path.join(self.cache_dir, f'{name}-{key}.parquet')
+            self.keys[name] = key
+            self.paths[name] = path
+            self.frames.pop(name, None)
+            if os.path.exists(path):
+                if self.verbose:
+                    print(f'[cached] {name}')
+            else:
+                pending.append((name, fn, params, path))
+
+        if not pending:
+            return
+        workers = min(len(pending), max_workers or os.cpu_count() or 1)
+        # one record for the whole batch, the workers' CPU time is counted once they exit
+        with self.profiler.stage('+'.join(name for name, *_ in pending), workers=workers) as stage:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [(name, pool.submit(_run_to_path, fn, params or {}, path, to_file)) for name, fn, params, path in pending]
+                for name, future in futures:
+                    future.result()
+                    if self.verbose:
+                        print(f'[run]    {name}')
+            if self.profiler.enabled:
+                stage['rows'] = sum(pq.read_metadata(path).num_rows for *_, path in pending)
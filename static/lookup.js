@@ -0,0 +1,147 @@
+// PIN lookup for the page written by static_export.py: a binary search over the
+// sorted PIN table, with the marker drawn over the pre-rendered histograms
+// static/lookup.js
+(function () {
+  'use strict';
+
+  const site = JSON.parse(document.getElementById('site').textContent);
+  const pins = site.pins;
+  let table = null;
+
+  // fetched on the first lookup, so loading the page doesn't wait for it
+  function loadTable() {
+    if (!table) {
+      table = fetch(pins.file)
+        .then(function (response) {
+          if (!response.ok) throw new Error('PIN table: HTTP ' + response.status);
+          return response.arrayBuffer();
+        })
+        .then(function (buffer) {
+          const loaded = {
+            ids: new Uint8Array(buffer, pins.ids, pins.count * pins.id_width),
+            values: {}, ratios: {}, ranks: {},
+          };
+          for (const [column, offset] of Object.entries(pins.values)) {
+            loaded.values[column] = new Uint32Array(buffer, offset, pins.count);
+          }
+          for (const [column, offset] of Object.entries(pins.ratios)) {
+            loaded.ratios[column] = new Uint16Array(buffer, offset, pins.count);
+          }
+          for (const [column, offset] of Object.entries(pins.ranks)) {
+            loaded.ranks[column] = new Uint8Array(buffer, offset, pins.count);
+          }
+          return loaded;
+        });
+    }
+    return table;
+  }
+
+  // same fixed width, NUL padded bytes as pin_index.py, or null if it can't be in the table
+  function encodePin(pin) {
+    const bytes = new TextEncoder().encode(pin);
+    if (bytes.length === 0 || bytes.length > pins.id_width || bytes.some(function (b) { return b > 127; })) return null;
+    const key = new Uint8Array(pins.id_width);
+    key.set(bytes);
+    return key;
+  }
+
+  function compareAt(ids, position, key) {
+    const start = position * pins.id_width;
+    for (let j = 0; j < pins.id_width; j++) {
+      const difference = ids[start + j] - key[j];
+      if (difference !== 0) return difference;
+    }
+    return 0;
+  }
+
+  function findPin(loaded, pin) {
+    const key = encodePin(pin);
+    if (key === null) return -1;
+    let lo = 0;
+    let hi = pins.count;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (compareAt(loaded.ids, mid, key) < 0) lo = mid + 1;
+      else hi = mid;
+    }
+    return lo < pins.count && compareAt(loaded.ids, lo, key) === 0 ? lo : -1;
+  }
+
+  function escapeHtml(text) {
+    return text.replace(/[&<>"']/g, function (c) {
+      return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+    });
+  }
+
+  function showMessage(i, kind, text) {
+    const message = document.getElementById('message-' + i);
+    message.className = 'message ' + kind;
+    message.innerHTML = text;
+    message.hidden = false;
+  }
+
+  function placeMarker(i, value) {
+    const hist = site.histograms[i];
+    const marker = document.querySelector('#figure-' + i + ' .marker');
+    if (value === null) {
+      marker.hidden = true;
+      return;
+    }
+    const extent = hist.extent;
+    const x = (value - extent.xlim[0]) / (extent.xlim[1] - extent.xlim[0]);
+    marker.style.left = 100 * (extent.left + x * (extent.right - extent.left)) + '%';
+    marker.style.top = 100 * extent.top + '%';
+    marker.style.height = 100 * (extent.bottom - extent.top) + '%';
+    marker.hidden = false;
+  }
+
+  function clear() {
+    site.histograms.forEach(function (hist, i) {
+      document.getElementById('message-' + i).hidden = true;
+      placeMarker(i, null);
+    });
+  }
+
+  // same messages as the PIN section of app.py
+  function show(loaded, pin) {
+    const position = findPin(loaded, pin);
+    site.histograms.forEach(function (hist, i) {
+      if (position < 0) {
+        placeMarker(i, null);
+        showMessage(i, 'error', 'PIN not found. Please check your entry.');
+        return;
+      }
+      // the range check and the rank were done at export time, on the exact ratios
+      const rank = loaded.ranks[hist.column][position];
+      if (rank === pins.outside_range) {
+        placeMarker(i, null);
+        showMessage(i, 'warning', 'Your value is outside the trimmed display range.');
+        return;
+      }
+      const value = loaded.ratios[hist.column][position] / 100;
+      const dollars = loaded.values[hist.value_column][position];
+      const current = dollars === pins.missing_value ? 'n/a' : '$' + dollars.toLocaleString('en-US');
+      placeMarker(i, value);
+      showMessage(i, 'success',
+        'PIN <code>' + escapeHtml(pin) + '</code> has a change in ' + hist.label + ' <strong>' + value.toFixed(2) +
+        '</strong>X, and is currently <strong>' + current + '</strong>. That change is higher than <strong>' +
+        rank + '%</strong> of properties in the county.');
+    });
+  }
+
+  // like the app's text input, a lookup runs on Enter or when the field loses focus
+  const input = document.getElementById('pin');
+  input.addEventListener('change', function () {
+    const pin = input.value.trim();
+    if (!pin) {
+      clear();
+      return;
+    }
+    loadTable()
+      .then(function (loaded) { show(loaded, pin); })
+      .catch(function (error) {
+        table = null;
+        site.histograms.forEach(function (hist, i) { showMessage(i, 'error', escapeHtml(String(error))); });
+      });
+  });
+})();
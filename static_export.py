@@ -0,0 +1,239 @@
+# static copy of the page for any file server or CDN, with the PIN lookup done in the browser
+# static_export.py
+#
+#   python static_export.py -o site
+#   python static_export.py --county 37135 -o site/37135
+#
+#   site/
+#     index.html                   text, tables and the site config
+#     value_map.<hash>.png         both ZIP maps and the three histograms, pre-rendered
+#     pins.<hash>.bin              sorted PINs, ratios in hundredths, ranks and current values
+#     lookup.<hash>.js             binary search + histogram marker, run in the browser
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+
+import numpy as np
+
+import page_content
+import plots
+from county_dataset import artifact_paths, read_counties, read_parcels
+from distributions import build_summary, load_summary
+from geo_tiers import map_layers
+from pin_index import RATIO_COLUMNS, VALUE_COLUMNS, PinIndex
+
+
+# client-side lookup script copied into the bundle
+LOOKUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'lookup.js')
+
+# ratio in hundredths / whole dollar value that marks a missing value
+MISSING_RATIO = 0xFFFF
+MISSING_VALUE = 0xFFFFFFFF
+
+# rank byte of a PIN whose ratio is outside the trimmed histogram range (or missing)
+OUTSIDE_RANGE = 0xFF
+
+STYLE = """
+body { font-family: "Source Sans Pro", sans-serif; max-width: 46rem; margin: 2rem auto; padding: 0 1rem; color: #31333f; line-height: 1.6; }
+img { width: 100%; }
+.figure { position: relative; }
+.marker { position: absolute; border-left: 2px dashed red; }
+.message { padding: 0.75rem 1rem; border-radius: 0.5rem; margin: 0.5rem 0; }
+.success { background: #dff5e3; }
+.warning { background: #fff8d6; }
+.error { background: #ffe0e0; }
+input { font-size: 1rem; padding: 0.4rem; width: 100%; box-sizing: border-box; }
+"""
+
+
+def _inline(text):
+    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
+    return re.sub(r'\*(.+?)\*', r'<em>\1</em>', text)
+
+
+def markdown_html(text):
+    # the little markdown the page text uses: paragraphs, numbered lists, bold and
+    # italics; links are already inline HTML
+    blocks = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        lines = block.strip().splitlines()
+        if all(re.match(r'\d+\. ', line) for line in lines):
+            items = ''.join(f'<li>{_inline(line.split(". ", 1)[1])}</li>' for line in lines)
+            blocks.append(f'<ol>{items}</ol>')
+        else:
+            blocks.append(f'<p>{_inline(" ".join(lines))}</p>')
+    return '\n'.join(blocks)
+
+
+def write_asset(out_dir, name, ext, data):
+    # content-hashed names, so a CDN can cache them forever; files of earlier exports
+    # are left in place for pages that still reference them
+    if isinstance(data, str):
+        data = data.encode()
+    file_name = f'{name}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}'
+    with open(os.path.join(out_dir, file_name), 'wb') as f:
+        f.write(data)
+    return file_name
+
+
+def shown_ratios(values):
+    # each ratio as the app prints it ({:.2f}), in hundredths; only ratios inside the
+    # trimmed histogram range are ever shown, so clipping the rare huge ones is harmless
+    shown = [int(round(float(f'{value:.2f}') * 100)) if value == value else MISSING_RATIO for value in values.tolist()]
+    return np.minimum(np.array(shown, dtype='int64'), MISSING_RATIO).astype('<u2')
+
+
+def display_ranks(index, column, hist):
+    # the percent the app shows for each PIN's rank (formatted the same way, so ties and
+    # rounding match), or OUTSIDE_RANGE where the app shows the out of range warning
+    values = np.asarray(index.values)[:, index.columns.index(column)]
+    ranks = index.rank(column, values)
+    shown = np.array([int(f'{rank:.0%}'[:-1]) if rank == rank else 0 for rank in ranks.tolist()], dtype='u1')
+    inside = (values >= hist['lower']) & (values <= hist['upper'])
+    return np.where(inside, shown, OUTSIDE_RANGE).astype('u1')
+
+
+def pin_table(index, summary):
+    # One little-endian buffer of column blocks, each readable as a typed array in place:
+    #   values  uint32 x count, per VALUE_COLUMNS   whole dollars
+    #   ratios  uint16 x count, per RATIO_COLUMNS   hundredths, as shown
+    #   ranks   uint8  x count, per RATIO_COLUMNS   percent shown, or OUTSIDE_RANGE
+    #   ids     id_width bytes x count              ASCII, NUL padded, sorted
+    # all in PIN order. Blocks are ordered by element size so every offset is aligned.
+    values = np.asarray(index.values)
+    header = {'count': len(index), 'id_width': index.ids.dtype.itemsize, 'values': {}, 'ratios': {}, 'ranks': {},
+              'missing_ratio': MISSING_RATIO, 'missing_value': MISSING_VALUE, 'outside_range': OUTSIDE_RANGE}
+    blocks = []
+
+    def add(group, column, block):
+        header[group][column] = sum(len(b) for b in blocks)
+        blocks.append(block)
+
+    for column in VALUE_COLUMNS:
+        column_values = values[:, index.columns.index(column)]
+        dollars = np.clip(np.rint(np.nan_to_num(column_values)), 0, MISSING_VALUE - 1)
+        add('values', column, np.where(np.isnan(column_values), MISSING_VALUE, dollars).astype('<u4').tobytes())
+    for column in RATIO_COLUMNS:
+        add('ratios', column, shown_ratios(values[:, index.columns.index(column)]).tobytes())
+    for column in RATIO_COLUMNS:
+        add('ranks', column, display_ranks(index, column, summary['histograms'][column]).tobytes())
+    header['ids'] = sum(len(b) for b in blocks)
+    blocks.append(np.ascontiguousarray(index.ids).tobytes())
+    return b''.join(blocks), header
+
+
+def figure_html(image, alt, id=None):
+    marker = '<div class="marker" hidden></div>' if id else ''
+    id_attribute = f' id="{id}"' if id else ''
+    return f'<div class="figure"{id_attribute}><img src="{image}" alt="{html.escape(alt)}">{marker}</div>'
+
+
+def page_html(county_name, summary, images, site, script):
+    title = f'🏡 Exploration of the Property Tax Revaluation in {county_name} NC'
+    histograms = '\n'.join(
+        f'<div class="message" id="message-{i}" hidden></div>\n{figure_html(hist["image"], hist["title"], f"figure-{i}")}'
+        for i, hist in enumerate(site['histograms']))
+    body = [
+        f'<h1>{html.escape(title)}</h1>',
+        markdown_html(page_content.INTRO), '<hr>',
+        markdown_html(page_content.REVALUATION), '<hr>',
+        markdown_html(page_content.DATA_NOTES),
+        figure_html(images['value_map'], 'Median appraised value by ZIP'), '<hr>',
+        markdown_html(page_content.VALUE_CHANGE),
+        page_content.value_table(summary),
+        markdown_html(page_content.SANITY_CHECK),
+        markdown_html(page_content.FACTORS),
+        page_content.change_table(summary),
+        markdown_html(page_content.ZIP_CHANGE),
+        figure_html(images['change_map'], 'Change in appraised value by ZIP'), '<hr>',
+        markdown_html(page_content.PIN_PROMPT),
+        '<label for="pin">🔎 Enter your PIN:</label> <input id="pin" type="text" autocomplete="off">',
+        histograms, '<hr>',
+        markdown_html(page_content.WRAP_UP),
+    ]
+    # the site config is inline, so the only request after the page is the PIN table,
+    # and only once a PIN is entered
+    config = json.dumps(site).replace('</', '<\\/')
+    return '\n'.join([
+        '<!DOCTYPE html>',
+        '<html lang="en"><head><meta charset="utf-8">',
+        '<meta name="viewport" content="width=device-width, initial-scale=1">',
+        f'<title>{html.escape(title)}</title><style>{STYLE}</style></head><body>',
+        *body,
+        f'<script id="site" type="application/json">{config}</script>',
+        f'<script src="{script}"></script>',
+        '</body></html>',
+    ])
+
+
+def export(county, out_dir):
+    paths = artifact_paths(county)
+    county_name = read_counties().get(county, page_content.COUNTY_NAME) if county else page_content.COUNTY_NAME
+    os.makedirs(out_dir, exist_ok=True)
+
+    # same inputs, with the same fallbacks, as app.py
+    parcels = None
+    if os.path.exists(paths['summary']):
+        summary = load_summary(paths['summary'])
+    else:
+        parcels = read_parcels(county, columns=['ParcelID'] + RATIO_COLUMNS + VALUE_COLUMNS)
+        summary = build_summary(parcels)
+    if os.path.exists(paths['pin_index']):
+        index = PinIndex.load(paths['pin_index'])
+    else:
+        if parcels is None:
+            parcels = read_parcels(county, columns=['ParcelID'] + RATIO_COLUMNS + VALUE_COLUMNS)
+        index = PinIndex.from_frame(parcels)
+
+    images = {}
+    zip_tier, county_tier = map_layers(paths, plots.MAP_FIGSIZE, plots.SAVEFIG_OPTIONS['dpi'])
+    for name, (column, title, label_format) in page_content.ZIP_MAPS.items():
+        fig = plots.zip_choropleth(zip_tier, county_tier, column, title.format(county=county_name), label_format)
+        images[name] = write_asset(out_dir, name, 'png', plots.figure_bytes(fig))
+
+    # the histograms without a marker, plus where their x axis lands in the image so
+    # the script can draw the PIN's marker over them
+    histograms = []
+    for column, value_column, label, title in page_content.PIN_HISTOGRAMS:
+        hist = summary['histograms'][column]
+        fig = plots.trimmed_histogram(hist, title)
+        extent = plots.axes_extent(fig)
+        histograms.append({
+            'column': column, 'value_column': value_column, 'label': label, 'title': title,
+            'lower': hist['lower'], 'upper': hist['upper'], 'extent': extent,
+            'image': write_asset(out_dir, f'hist_{column}', 'png', plots.figure_bytes(fig)),
+        })
+
+    table, header = pin_table(index, summary)
+    header['file'] = write_asset(out_dir, 'pins', 'bin', table)
+    with open(LOOKUP_SCRIPT) as f:
+        script = write_asset(out_dir, 'lookup', 'js', f.read())
+
+    site = {'county': county_name, 'pins': header, 'histograms': histograms}
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(page_html(county_name, summary, images, site, script))
+    files = ['index.html', script, header['file'], *images.values(), *[hist['image'] for hist in histograms]]
+    return site, files
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write the page as a static bundle with a client-side PIN lookup')
+    parser.add_argument('--county', metavar='FIPS', help='export this county (e.g. 37135) of the partitioned dataset')
+    parser.add_argument('-o', '--output', default='site', help='bundle directory')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    site, files = export(args.county, args.output)
+    size = sum(os.path.getsize(os.path.join(args.output, name)) for name in files)
+    print(f"{site['county']}: {site['pins']['count']:,} PINs, {site['pins']['file']} "
+          f"{os.path.getsize(os.path.join(args.output, site['pins']['file'])) / 1e6:.2f} MB, "
+          f"bundle {size / 1e6:.2f} MB in {args.output}/")
+
+
+if __name__ == '__main__':
+    main()